@@ -4,17 +4,18 @@ from discord import Embed, TextChannel
 import discord
 from discord.ext import commands
 
+MESSAGE_LINK_PATTERN = re.compile(r'https://discord(?:app)?\.com/channels/(\d+)/(\d+)/(\d+)')
+
 class LinkCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot: commands.Bot = bot
 
     @commands.Cog.listener('on_message')
     async def link_check(self, message: discord.Message):
-        pattern = re.compile(r'https://discord(?:app)?\.com/channels/(\d+)/(\d+)/(\d+)')
-        if found := pattern.search(message.content):
-            print('Guild ID:', found.group(1))
-            print('Channel ID:', found.group(2))
-            print('Message ID:', found.group(3))
+        # コマンドは Bot.on_message で処理済みなので、ここではリンク展開だけを行う
+        if 'discord' not in message.content:
+            return
+        if found := MESSAGE_LINK_PATTERN.search(message.content):
             channel_id = int(found.group(2))
             message_id = int(found.group(3))
 
@@ -48,7 +49,6 @@ class LinkCog(commands.Cog):
                 view.add_item(button)
                 
                 await message.channel.send(embed=embed, view=view)
-        await self.bot.process_commands(message)
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(LinkCog(bot))
@@ -1,6 +1,10 @@
+import logging
+
 from discord.ext import commands
 from discord import Interaction as Inter, Member, app_commands
 
+logger = logging.getLogger(__name__)
+
 ROLES = [
     ["Silver", 536065526112452609],
     ["Gold", 536062237731717141],
@@ -21,7 +25,7 @@ class RoleCog(commands.Cog):
     @app_commands.autocomplete(role=role_autocomplete)
     async def role(self, inter: Inter, target: Member, role: str):
         for i in range(int(role)+1):
-            print(ROLE_NAMES[i])
+            logger.debug("role=%s target=%s", ROLE_NAMES[i], target.id)
         await inter.response.send_message(f'Role {role} added')
     
 
@@ -1,19 +1,44 @@
 import asyncio
-import re
 import discord
+import logging
 import threading
 import hashlib
 import os
+import shutil
+import time
+import uuid
 from discord import app_commands, Interaction
 from discord.ext import commands
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from ...web.server import create_web_server
 from ...database.config import init_db, close_db
 from ...database.models.voice_settings import VoiceSettings
-from ...core.tts_manager import TTSManager
+from ...database.models.reading_dictionary import ReadingDictionary
+from ...database.models.backlog_settings import BacklogSettings
+from ...core.environment import ENV
+from ...core.metrics import REGISTRY, SYNTHESIS_QUEUE_WAIT_SECONDS
+from ...core.tracing import TRACER, Trace
+from ...core.settings_feed import VOICE_SETTINGS, SettingsFeedListener
+from ...core.status_server import StatusServer
+from ...core.tts_manager import tts_manager
+from ...core.audio import create_audio_source, encode_opus_file
+from ...core.audio_cache import AudioCache
+from ...core.text_processor import MessagePreprocessor, split_sentences
+from ...core.playback import AudioInput, GuildPlayer
+from ...core.backlog import BacklogController, BacklogPolicy, ReadRequest
+from ...utils.singleflight import SingleFlight
+from ...core.voice_settings_cache import ResolvedVoice, VoiceSettingsCache
+from ...core.synthesis_worker import OverflowPolicy, SynthesisJobDropped, SynthesisQueueFull, SynthesisWorker
 
-# TTSマネージャーのグローバルインスタンス
-tts_manager = TTSManager()
+logger = logging.getLogger(__name__)
+
+
+async def voice_autocomplete(interaction: Interaction, current: str) -> List[app_commands.Choice[str]]:
+    """音声キャラの候補（エンジンの初期化前は前回保存した一覧から）"""
+    return [
+        app_commands.Choice(name=voice, value=voice)
+        for voice in tts_manager.voice_names if current.lower() in voice.lower()
+    ][:25]
 
 
 class TTSCog(commands.Cog):
@@ -21,16 +46,78 @@ class TTSCog(commands.Cog):
     
     def __init__(self, bot: commands.Bot) -> None:
         self.bot: commands.Bot = bot
-        self.tts_controls: Dict[int, Dict[str, discord.VoiceClient]] = {}  # サーバーごとのVC管理
-        self.audio_cache_dir = "data/audio/cache"  # キャッシュディレクトリ
+        self.tts_controls: Dict[int, Dict[str, Any]] = {}  # サーバーごとのVC・再生キュー管理
+        self.audio_cache_dir = ENV.get("TTS_CACHE_DIR", "data/audio/cache")  # キャッシュディレクトリ
+        # キャッシュの保存形式（opus: 登録時に一度だけ Opus へ変換 / wav: 生成したまま）
+        self.audio_format = ENV.get("TTS_CACHE_FORMAT", "opus")
+        if self.audio_format == "opus" and shutil.which("ffmpeg") is None:
+            logger.warning("ffmpeg が見つからないため、キャッシュは WAV 形式で保存します")
+            self.audio_format = "wav"
+        
+        # 容量上限付きの音声キャッシュ（インデックスは SQLite）
+        self.audio_cache = AudioCache(
+            self.audio_cache_dir,
+            max_bytes=int(ENV.get("TTS_CACHE_MAX_MB", "1024")) * 1024 * 1024,
+            suffix=".opus" if self.audio_format == "opus" else ".wav",
+        )
+        
+        # 読み上げ用の前処理（パターンのコンパイルはここで一度だけ）
+        self.preprocessor = MessagePreprocessor(
+            max_length=int(ENV.get("TTS_MAX_LENGTH", "0")),
+            truncate_suffix=ENV.get("TTS_TRUNCATE_SUFFIX", "、以下略"),
+        )
+        
+        # 長文を文ごとに分けて合成し、先頭の文から再生を始める（オプトイン）
+        self.sentence_chunking = ENV.get("TTS_SENTENCE_CHUNKING", "false").lower() in ("1", "true", "yes", "on")
+        
+        # 滞留時の振る舞いの既定値（BacklogPolicy と同じくどれも無効。サーバーごとに /voice backlog で変更できる）
+        self.default_backlog_policy = BacklogPolicy(
+            merge_same_author=ENV.get("TTS_BACKLOG_MERGE", "false").lower() in ("1", "true", "yes", "on"),
+            max_backlog_seconds=float(ENV.get("TTS_BACKLOG_MAX_SECONDS", "0")),
+            overflow_action=ENV.get("TTS_BACKLOG_ACTION", "summarize"),
+            speedup_after_seconds=float(ENV.get("TTS_BACKLOG_SPEEDUP_AFTER", "0")),
+            max_speed=float(ENV.get("TTS_BACKLOG_MAX_SPEED", "1.5")),
+        )
+        # 連続投稿をまとめた後の文字数の上限（読み上げの最大文字数があればそれ以下にする）
+        self.max_merge_length = int(ENV.get("TTS_BACKLOG_MERGE_MAX_LENGTH", "200"))
+        if self.preprocessor.max_length:
+            self.max_merge_length = min(self.max_merge_length or self.preprocessor.max_length, self.preprocessor.max_length)
+        # 再生の何件前から合成を始めるか（それより後ろはまとめ・破棄の対象になる）
+        self.prepare_ahead = int(ENV.get("TTS_PREPARE_AHEAD", "2"))
+        
+        # ユーザー設定のメモリキャッシュ（設定保存時に破棄される）
+        self.voice_settings_cache = VoiceSettingsCache(
+            tts_manager, max_entries=int(ENV.get("TTS_VOICE_SETTINGS_CACHE_SIZE", "10000"))
+        )
+        VoiceSettings.add_change_listener(self.voice_settings_cache.invalidate)
         
-        # キャッシュディレクトリを作成
-        os.makedirs(self.audio_cache_dir, exist_ok=True)
+        # 同じキャッシュキーの合成が実行中なら、その完了を待って結果を共有する
+        self.inflight_syntheses = SingleFlight()
+        
+        # 合成はイベントループ外の専用ワーカーで実行する
+        # （サーバーごとのキューから公平に取り出し、エンジンの台数分だけ並行に合成する）
+        self.synthesis_worker = SynthesisWorker(
+            max_queue=int(ENV.get("TTS_SYNTHESIS_QUEUE_SIZE", "32")),
+            policy=OverflowPolicy(ENV.get("TTS_SYNTHESIS_OVERFLOW", OverflowPolicy.BLOCK.value)),
+            max_queue_per_guild=int(ENV.get("TTS_SYNTHESIS_GUILD_QUEUE_SIZE", "16")),
+            quantum=int(ENV.get("TTS_FAIR_QUANTUM", "100")),
+            short_job_cost=int(ENV.get("TTS_SHORT_PRIORITY_LENGTH", "0")),
+            concurrency=tts_manager.concurrency,
+        )
+        
+        # 既存の統計を /metrics で公開する
+        self._register_metrics()
+        
+        # 合成エンジンの起動・接続はバックグラウンドで行い、ログインを待たせない
+        self.bot.loop.create_task(self._wait_for_tts())
         
         # データベース初期化とマイグレーションを非同期で実行
         self.bot.loop.create_task(self._initialize_database())
         
-        # Webサーバーを別スレッドで起動
+        # Webサーバーを起動（TTS_WEB_MODE: thread=このプロセスのスレッド / external=別プロセス / off）
+        self.web_mode = ENV.get("TTS_WEB_MODE", "thread")
+        self.settings_feed: Optional[SettingsFeedListener] = None
+        self.status_server: Optional[StatusServer] = None
         self._start_web_server()
 
     async def _initialize_database(self) -> None:
@@ -38,71 +125,149 @@ class TTSCog(commands.Cog):
         try:
             await init_db()
         except Exception as e:
-            print(f"データベース初期化エラー: {e}")
+            logger.error("データベース初期化エラー: %s", e)
+
+    async def _wait_for_tts(self) -> None:
+        """エンジンの初期化を待ち、台数と音声一覧を反映する"""
+        try:
+            await asyncio.wrap_future(tts_manager.start())
+        except Exception:
+            # エラーは TTSManager 側で記録済み
+            return
+        self.synthesis_worker.set_concurrency(tts_manager.concurrency)
+        # 保存済みの一覧から作ったプリセットは作り直す
+        self.voice_settings_cache.clear()
 
+    # 取得時に値を読むだけのメトリクス（名前, 種類, 説明, 取得関数）
+    def _metric_collectors(self):
+        cache = self.audio_cache
+        return [
+            ("tts_cache_hits_total", "counter", "Audio cache hits", lambda: [({}, cache.stats()["hits"])]),
+            ("tts_cache_misses_total", "counter", "Audio cache misses", lambda: [({}, cache.stats()["misses"])]),
+            ("tts_cache_evictions_total", "counter", "Audio cache evictions", lambda: [({}, cache.stats()["evictions"])]),
+            ("tts_cache_bytes", "gauge", "Bytes stored in the audio cache", lambda: [({}, cache.stats()["bytes"])]),
+            ("tts_cache_entries", "gauge", "Files stored in the audio cache", lambda: [({}, cache.stats()["entries"])]),
+            ("tts_playback_queue_depth", "gauge", "Clips waiting or playing per guild", lambda: [
+                ({"guild": str(guild_id)}, control["player"].queue_depth)
+                for guild_id, control in list(self.tts_controls.items())
+            ]),
+            ("tts_synthesis_queue_depth", "gauge", "Synthesis jobs waiting per guild", lambda: [
+                ({"guild": str(guild_id)}, depth)
+                for guild_id, depth in self.synthesis_worker.guild_queue_depths().items()
+            ]),
+            ("tts_preset_skips_total", "counter", "Preset applications skipped because the engine already had it", lambda: [
+                ({"engine": engine["name"]}, engine["preset_skipped"]) for engine in tts_manager.engine_stats()
+            ]),
+        ]
+    
+    def _register_metrics(self) -> None:
+        for name, kind, documentation, collect in self._metric_collectors():
+            REGISTRY.register_collector(name, kind, documentation, collect)
+    
     def _start_web_server(self) -> None:
-        """Webサーバーを別スレッドで起動"""
+        """Webサーバーを別スレッドで起動（別プロセスの場合は変更通知の受信だけ行う）
+
+        トレースはユーザーID・サーバーIDを含むため、Web UI のポートでは公開せず、
+        どのモードでも localhost の StatusServer から返す。
+        """
+        self.bot.loop.create_task(self._start_status_server())
+        if self.web_mode == "external":
+            self.bot.loop.create_task(self._start_external_web_support())
+            return
+        if self.web_mode == "off":
+            return
+        
+        host, port = ENV.get("WEB_HOST", "127.0.0.1"), int(ENV.get("WEB_PORT", "8080"))
         def run_server():
-            web_server = create_web_server(tts_manager.tts_control)
-            web_server.start(host="localhost", port=8080)
+            web_server = create_web_server(lambda: list(tts_manager.voice_names))
+            web_server.start(host=host, port=port)
         
         web_thread = threading.Thread(target=run_server, daemon=True)
         web_thread.start()
-        print("🌟 TTS Web Interface started on http://localhost:8080")
+        logger.info("TTS Web Interface started on http://%s:%s", host, port)
+    
+    async def _start_status_server(self) -> None:
+        """/metrics・/api/traces をこのプロセスで返す"""
+        self.status_server = StatusServer(ENV.get("STATUS_HOST", "127.0.0.1"), int(ENV.get("STATUS_PORT", "8081")))
+        try:
+            await self.status_server.start()
+        except OSError as e:
+            logger.error("ステータスサーバーの起動エラー: %s", e)
+    
+    async def _start_external_web_support(self) -> None:
+        """別プロセスの Web UI からの設定変更通知を受ける"""
+        self.settings_feed = SettingsFeedListener()
+        self.settings_feed.subscribe(VOICE_SETTINGS, self.voice_settings_cache.invalidate)
+        try:
+            await self.settings_feed.start(int(ENV.get("SETTINGS_FEED_PORT", "8765")))
+        except OSError as e:
+            logger.error("Web UI 連携の起動エラー: %s", e)
 
     # 以下のメソッドは削除（DB操作で置き換え）
     # def _load_voice_settings(self) -> Dict[str, Any]:
     # def _save_voice_settings(self) -> None:
     
-    async def _get_user_voice_settings(self, user_id: str) -> Dict[str, Any]:
-        """指定ユーザーの音声設定を取得（DB から）"""
+    async def _load_dictionary(self, guild_id: int) -> None:
+        """サーバーの読み上げ辞書を読み込んで前処理に設定"""
+        try:
+            entries = await ReadingDictionary.get_guild_entries(str(guild_id))
+            self.preprocessor.set_dictionary(guild_id, entries)
+        except Exception as e:
+            logger.error("読み上げ辞書読み込みエラー: %s", e)
+    
+    async def _start_session(self, guild_id: int, channel_id: int, vc: discord.VoiceClient) -> None:
+        """ボイス接続を登録し、channel_id のメッセージの読み上げを始める"""
+        self.tts_controls[guild_id] = {
+            "vc": vc,
+            "channel_id": channel_id,  # 読み上げ対象のテキストチャンネル
+            "player": GuildPlayer(
+                vc, source_factory=create_audio_source, prepare_ahead=self.prepare_ahead, guild_id=guild_id
+            ),
+            "backlog": BacklogController(
+                BacklogPolicy(**self.default_backlog_policy.to_dict()), max_merge_length=self.max_merge_length
+            ),
+        }
+        await self._load_dictionary(guild_id)
+        await self._load_backlog_policy(guild_id)
+    
+    def _end_session(self, guild_id: int) -> Optional[Dict[str, Any]]:
+        """読み上げを終了し、サーバーごとの再生キュー・辞書・メトリクスの系列を片付ける"""
+        control = self.tts_controls.pop(guild_id, None)
+        if control is None:
+            return None
+        control["player"].close()
+        SYNTHESIS_QUEUE_WAIT_SECONDS.remove(guild_id)
+        self.preprocessor.set_dictionary(guild_id, {})
+        return control
+    
+    async def _load_backlog_policy(self, guild_id: int) -> None:
+        """サーバーの滞留設定を読み込んで再生キューの制御に設定"""
+        control = self.tts_controls.get(guild_id)
+        if control is None:
+            return
         try:
-            return await VoiceSettings.get_user_settings(user_id)
+            settings = await BacklogSettings.get_guild_settings(str(guild_id))
         except Exception as e:
-            print(f"ユーザー設定取得エラー: {e}")
-            return {}
+            logger.error("滞留設定読み込みエラー (guild=%s): %s", guild_id, e)
+            return
+        if settings:
+            control["backlog"].policy = BacklogPolicy(**settings)
     
     async def _save_user_voice_settings(self, user_id: str, settings: Dict[str, Any]) -> None:
         """ユーザーの音声設定を保存（DB へ）"""
         try:
             await VoiceSettings.update_user_settings(user_id, settings)
         except Exception as e:
-            print(f"ユーザー設定保存エラー: {e}")
+            logger.error("ユーザー設定保存エラー: %s", e)
     
-    def _generate_cache_key(self, text: str, voice_preset: Dict[str, Any]) -> str:
-        """テキストとプリセットからキャッシュキーを生成"""
-        # プリセットを文字列化してソート（辞書の順序に依存しないように）
-        preset_str = str(sorted(voice_preset.items()))
-        
+    def _generate_cache_key(self, text: str, preset_fingerprint: str) -> str:
+        """テキストとプリセット指紋からキャッシュキーを生成"""
         # テキストとプリセットを結合してハッシュ化
-        combined = f"{text}:{preset_str}"
+        combined = f"{text}:{preset_fingerprint}"
         cache_key = hashlib.md5(combined.encode('utf-8')).hexdigest()
         
         return cache_key
     
-    def _get_cached_audio_path(self, cache_key: str) -> str:
-        """キャッシュキーから音声ファイルパスを取得"""
-        return os.path.join(self.audio_cache_dir, f"{cache_key}.wav")
-    
-    def _is_audio_cached(self, cache_key: str) -> bool:
-        """音声ファイルがキャッシュされているかチェック"""
-        cache_path = self._get_cached_audio_path(cache_key)
-        return os.path.exists(cache_path)
-    
-    def _save_to_cache(self, cache_key: str, source_file: str = "data/audio/output.wav") -> str:
-        """生成された音声ファイルをキャッシュに保存"""
-        cache_path = self._get_cached_audio_path(cache_key)
-        
-        try:
-            # 元ファイルをキャッシュにコピー
-            import shutil
-            shutil.copy2(source_file, cache_path)
-            print(f"💾 音声ファイルをキャッシュに保存: {cache_key}")
-            return cache_path
-        except Exception as e:
-            print(f"❌ キャッシュ保存エラー: {e}")
-            return source_file
-
     group = app_commands.Group(name='voice', description='voice commands')
 
     @group.command(name='join', description='ボイスチャンネルに参加します')
@@ -110,31 +275,29 @@ class TTSCog(commands.Cog):
         if interaction.user.voice:
             channel = interaction.user.voice.channel
             vc = await channel.connect()
-            self.tts_controls[interaction.guild.id] = {
-                "vc": vc
-            }
             await interaction.response.send_message(f'Joined {channel.name}')
+            await self._start_session(interaction.guild.id, interaction.channel_id, vc)
         else:
             await interaction.response.send_message('You are not connected to a voice channel.')
 
     @group.command(name='leave', description='ボイスチャンネルから退出します')
     async def leave(self, interaction: Interaction):
-        if interaction.guild.id in self.tts_controls:
-            vc = self.tts_controls[interaction.guild.id]["vc"]
-            await vc.disconnect()
-            del self.tts_controls[interaction.guild.id]
+        control = self._end_session(interaction.guild.id)
+        if control is not None:
+            await control["vc"].disconnect()
             await interaction.response.send_message('Disconnected from the voice channel.')
         else:
             await interaction.response.send_message('I am not connected to a voice channel.')
 
     @group.command(name='set_voice', description='読み上げキャラを設定します')
-    @app_commands.choices(voice_name=[
-        app_commands.Choice(name=voice, value=voice) for voice in tts_manager.tts_control.voice_names
-    ])
-    async def set_voice(self, interaction: Interaction, voice_name: app_commands.Choice[str]):
+    @app_commands.autocomplete(voice_name=voice_autocomplete)
+    async def set_voice(self, interaction: Interaction, voice_name: str):
         """音声キャラクターを設定"""
-        await self._save_user_voice_settings(str(interaction.user.id), {"voice": voice_name.value})
-        await interaction.response.send_message(f"Voice set to {voice_name.value} for {interaction.user.name}.")
+        if voice_name not in tts_manager.voice_names:
+            await interaction.response.send_message(f"Unknown voice: {voice_name}", ephemeral=True)
+            return
+        await self._save_user_voice_settings(str(interaction.user.id), {"voice": voice_name})
+        await interaction.response.send_message(f"Voice set to {voice_name} for {interaction.user.name}.")
 
     @group.command(name='settings', description='Web画面で詳細な音声設定を行います')
     async def web_settings(self, interaction: Interaction):
@@ -167,16 +330,8 @@ class TTSCog(commands.Cog):
     async def clear_cache(self, interaction: Interaction):
         """音声キャッシュをクリア"""
         try:
-            cache_files = [f for f in os.listdir(self.audio_cache_dir) if f.endswith('.wav')]
-            deleted_count = 0
-            
-            for cache_file in cache_files:
-                cache_path = os.path.join(self.audio_cache_dir, cache_file)
-                try:
-                    os.remove(cache_path)
-                    deleted_count += 1
-                except OSError:
-                    continue
+            # ファイルの削除でイベントループを止めない
+            deleted_count = await asyncio.to_thread(self.audio_cache.clear)
             
             embed = discord.Embed(
                 title="🗑️ キャッシュクリア完了",
@@ -190,7 +345,7 @@ class TTSCog(commands.Cog):
             )
             
             await interaction.response.send_message(embed=embed, ephemeral=True)
-            print(f"🗑️ キャッシュクリア完了: {deleted_count}ファイル削除")
+            logger.info("キャッシュクリア完了: %dファイル削除", deleted_count)
             
         except Exception as e:
             await interaction.response.send_message(
@@ -202,19 +357,11 @@ class TTSCog(commands.Cog):
     async def cache_info(self, interaction: Interaction):
         """キャッシュ情報を表示"""
         try:
-            cache_files = [f for f in os.listdir(self.audio_cache_dir) if f.endswith('.wav')]
-            total_files = len(cache_files)
-            
-            total_size = 0
-            for cache_file in cache_files:
-                cache_path = os.path.join(self.audio_cache_dir, cache_file)
-                try:
-                    total_size += os.path.getsize(cache_path)
-                except OSError:
-                    continue
+            stats = self.audio_cache.stats()
             
             # バイトサイズを人間が読みやすい形式に変換
-            size_mb = total_size / (1024 * 1024)
+            size_mb = stats["bytes"] / (1024 * 1024)
+            max_size_mb = stats["max_bytes"] / (1024 * 1024)
             
             embed = discord.Embed(
                 title="📊 音声キャッシュ情報",
@@ -222,14 +369,23 @@ class TTSCog(commands.Cog):
             )
             embed.add_field(
                 name="📁 キャッシュファイル数",
-                value=f"{total_files}個",
+                value=f"{stats['entries']}個",
                 inline=True
             )
             embed.add_field(
                 name="💾 合計サイズ",
-                value=f"{size_mb:.2f} MB",
+                value=f"{size_mb:.2f} / {max_size_mb:.0f} MB",
                 inline=True
             )
+            embed.add_field(
+                name="🎯 ヒット率",
+                value=(
+                    f"{stats['hit_ratio'] * 100:.1f}% "
+                    f"(ヒット {stats['hits']} / ミス {stats['misses']} / 追い出し {stats['evictions']} / "
+                    f"合成中への相乗り {self.inflight_syntheses.shared_count})"
+                ),
+                inline=False
+            )
             embed.add_field(
                 name="📂 保存場所",
                 value=f"`{self.audio_cache_dir}`",
@@ -245,91 +401,424 @@ class TTSCog(commands.Cog):
                 ephemeral=True
             )
 
+    @group.command(name='dict_add', description='読み上げ辞書に単語を登録します')
+    @app_commands.describe(word='置き換える表記', reading='読み')
+    async def dict_add(self, interaction: Interaction, word: str, reading: str):
+        """読み上げ辞書に登録（既にあれば読みを更新）"""
+        try:
+            await ReadingDictionary.set_entry(str(interaction.guild.id), word, reading)
+            await self._load_dictionary(interaction.guild.id)
+            await interaction.response.send_message(f"📖 辞書に登録しました: {word} → {reading}")
+        except Exception as e:
+            await interaction.response.send_message(
+                f"❌ 辞書登録でエラーが発生しました: {e}",
+                ephemeral=True
+            )
+
+    @group.command(name='dict_remove', description='読み上げ辞書から単語を削除します')
+    @app_commands.describe(word='削除する表記')
+    async def dict_remove(self, interaction: Interaction, word: str):
+        """読み上げ辞書から削除"""
+        try:
+            if await ReadingDictionary.remove_entry(str(interaction.guild.id), word):
+                await self._load_dictionary(interaction.guild.id)
+                await interaction.response.send_message(f"🗑️ 辞書から削除しました: {word}")
+            else:
+                await interaction.response.send_message(f"辞書に登録されていません: {word}", ephemeral=True)
+        except Exception as e:
+            await interaction.response.send_message(
+                f"❌ 辞書削除でエラーが発生しました: {e}",
+                ephemeral=True
+            )
+
+    @group.command(name='dict_list', description='読み上げ辞書の登録内容を表示します')
+    async def dict_list(self, interaction: Interaction):
+        """読み上げ辞書を表示（先頭の一部のみ）"""
+        try:
+            entries = await ReadingDictionary.get_guild_entries(str(interaction.guild.id))
+            embed = discord.Embed(
+                title="📖 読み上げ辞書",
+                description=f"登録数: {len(entries)}件",
+                color=discord.Color.blue()
+            )
+            lines = [f"{word} → {reading}" for word, reading in list(entries.items())[:30]]
+            if lines:
+                embed.add_field(name="登録内容", value="\n".join(lines)[:1024], inline=False)
+            if len(entries) > 30:
+                embed.set_footer(text=f"ほか {len(entries) - 30}件")
+            
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+        except Exception as e:
+            await interaction.response.send_message(
+                f"❌ 辞書取得でエラーが発生しました: {e}",
+                ephemeral=True
+            )
+
+    @group.command(name='backlog', description='読み上げが溜まったときの振る舞いを設定します')
+    @app_commands.describe(
+        merge_same_author='同じ人の連続投稿をまとめて読む',
+        max_seconds='滞留の上限秒数（超えた分は古い順に読み飛ばす / 0 で無効）',
+        action='上限を超えたときの振る舞い',
+        speedup_after='話速を上げ始める滞留秒数（0 で無効）',
+        max_speed='話速の倍率の上限',
+    )
+    @app_commands.choices(action=[
+        app_commands.Choice(name='「他N件」と読む', value='summarize'),
+        app_commands.Choice(name='黙って読み飛ばす', value='drop'),
+    ])
+    @app_commands.default_permissions(manage_guild=True)
+    async def backlog(
+        self,
+        interaction: Interaction,
+        merge_same_author: Optional[bool] = None,
+        max_seconds: Optional[app_commands.Range[float, 0, 600]] = None,
+        action: Optional[app_commands.Choice[str]] = None,
+        speedup_after: Optional[app_commands.Range[float, 0, 600]] = None,
+        max_speed: Optional[app_commands.Range[float, 1.0, 4.0]] = None,
+    ):
+        """滞留設定を表示（引数を指定した場合は更新）"""
+        guild_id = interaction.guild.id
+        try:
+            settings = await BacklogSettings.get_guild_settings(str(guild_id)) or self.default_backlog_policy.to_dict()
+            updates = {
+                "merge_same_author": merge_same_author,
+                "max_backlog_seconds": max_seconds,
+                "overflow_action": action.value if action else None,
+                "speedup_after_seconds": speedup_after,
+                "max_speed": max_speed,
+            }
+            updates = {key: value for key, value in updates.items() if value is not None}
+            if updates:
+                settings.update(updates)
+                await BacklogSettings.update_guild_settings(str(guild_id), settings)
+                await self._load_backlog_policy(guild_id)
+            
+            embed = discord.Embed(
+                title="📚 読み上げの滞留設定",
+                description="設定を更新しました" if updates else None,
+                color=discord.Color.green() if updates else discord.Color.blue()
+            )
+            embed.add_field(name="🧩 連続投稿をまとめる", value="オン" if settings["merge_same_author"] else "オフ", inline=True)
+            embed.add_field(
+                name="⏳ 滞留の上限",
+                value=f"{settings['max_backlog_seconds']:.0f}秒 ({settings['overflow_action']})" if settings["max_backlog_seconds"] else "なし",
+                inline=True
+            )
+            embed.add_field(
+                name="⏩ 話速の調整",
+                value=(
+                    f"{settings['speedup_after_seconds']:.0f}秒から最大 {settings['max_speed']:.1f}倍"
+                    if settings["speedup_after_seconds"] else "なし"
+                ),
+                inline=True
+            )
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+        except Exception as e:
+            await interaction.response.send_message(
+                f"❌ 滞留設定でエラーが発生しました: {e}",
+                ephemeral=True
+            )
+
+    @group.command(name='queue_info', description='読み上げキューの状態を表示します')
+    async def queue_info(self, interaction: Interaction):
+        """再生キューの深度と待ち時間を表示"""
+        if interaction.guild.id not in self.tts_controls:
+            await interaction.response.send_message('I am not connected to a voice channel.', ephemeral=True)
+            return
+
+        control = self.tts_controls[interaction.guild.id]
+        stats = control["player"].stats()
+        backlog = control["backlog"]
+        embed = discord.Embed(
+            title="🎧 読み上げキュー情報",
+            color=discord.Color.blue()
+        )
+        embed.add_field(name="📥 キュー深度", value=f"{stats['queue_depth']}件", inline=True)
+        embed.add_field(name="✅ 再生済み", value=f"{stats['played']}件", inline=True)
+        embed.add_field(name="⚠️ 失敗", value=f"{stats['failed']}件", inline=True)
+        embed.add_field(
+            name="⏱️ 待ち時間（直近）",
+            value=f"平均 {stats['wait_avg']:.2f}s / p95 {stats['wait_p95']:.2f}s / 最大 {stats['wait_max']:.2f}s",
+            inline=False
+        )
+        embed.add_field(
+            name="🗣️ 受信から最初の音まで",
+            value=f"平均 {stats['first_audio_avg']:.2f}s / p95 {stats['first_audio_p95']:.2f}s",
+            inline=False
+        )
+        embed.add_field(
+            name="🔁 再生開始遅延（平均）",
+            value=f"{stats['start_delay_avg'] * 1000:.1f} ms",
+            inline=False
+        )
+        embed.add_field(
+            name="📚 滞留",
+            value=(
+                f"約 {backlog.backlog_seconds(control['player']):.0f}秒分 / "
+                f"話速 {backlog.speed_factor(control['player']):.1f}倍 / "
+                f"まとめ {backlog.merged_count}件 / 読み飛ばし {backlog.dropped_count}件"
+            ),
+            inline=False
+        )
+        worker_stats = self.synthesis_worker.stats()
+        guild_worker_stats = self.synthesis_worker.guild_stats(interaction.guild.id)
+        embed.add_field(
+            name="🧠 合成待ち（このサーバー）",
+            value=(
+                f"{guild_worker_stats['queue_depth']}/{guild_worker_stats['max_queue']}件 / "
+                f"平均 {guild_worker_stats['wait_avg']:.2f}s / p95 {guild_worker_stats['wait_p95']:.2f}s / "
+                f"最大 {guild_worker_stats['wait_max']:.2f}s"
+            ),
+            inline=False
+        )
+        embed.add_field(
+            name="🧠 合成キュー（全サーバー共通）",
+            value=(
+                f"{worker_stats['queue_depth']}/{worker_stats['max_queue']}件 ({worker_stats['policy']}) / "
+                f"平均待ち {worker_stats['wait_avg']:.2f}s / 平均合成 {worker_stats['run_avg']:.2f}s / "
+                f"拒否 {worker_stats['rejected']}件 / 破棄 {worker_stats['dropped']}件"
+            ),
+            inline=False
+        )
+        embed.add_field(
+            name=f"🎙️ 合成エンジン（{worker_stats['running']}/{worker_stats['concurrency']}台が合成中）",
+            value="\n".join(
+                f"{engine['name']}: {engine['jobs']}件 / プリセット適用 {engine['preset_applied']}回・"
+                f"省略 {engine['preset_skipped']}回{' 🔴' if engine['busy'] else ''}"
+                for engine in tts_manager.engine_stats()
+            )[:1024] or "初期化中",
+            inline=False
+        )
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @group.command(name='traces', description='遅かった読み上げの内訳を表示します（TTS_TRACING 有効時）')
+    async def traces(self, interaction: Interaction):
+        """直近のトレースから区間ごとの内訳と遅かったメッセージを表示"""
+        if not TRACER.enabled:
+            await interaction.response.send_message(
+                'トレースは無効です（.env で TTS_TRACING=true にすると記録します）', ephemeral=True
+            )
+            return
+        
+        snapshot = TRACER.snapshot(limit=5, guild_id=interaction.guild.id)
+        embed = discord.Embed(
+            title="🔍 読み上げトレース",
+            description=f"直近 {snapshot['traces']}件",
+            color=discord.Color.blue()
+        )
+        breakdown = sorted(snapshot["breakdown"].items(), key=lambda entry: entry[1]["avg_ms"], reverse=True)
+        if breakdown:
+            embed.add_field(
+                name="⏱️ 区間ごと（平均 / p95）",
+                value="\n".join(
+                    f"{name}: {stats['avg_ms']:.1f} / {stats['p95_ms']:.1f} ms" for name, stats in breakdown
+                )[:1024],
+                inline=False
+            )
+        for trace in snapshot["slowest"]:
+            spans = sorted(trace["spans"], key=lambda span: span["duration_ms"], reverse=True)[:4]
+            embed.add_field(
+                name=f"🐢 #{trace['id']} {trace['total_ms']:.0f} ms（{trace['text_length']}文字）",
+                value=" / ".join(f"{span['name']} {span['duration_ms']:.0f}ms" for span in spans) or "-",
+                inline=False
+            )
+        
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        """サーバーから退出・キックされたら、そのサーバーの読み上げを片付ける"""
+        self._end_session(guild.id)
+
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         """メッセージ受信時の音声合成・再生処理"""
-        if message.author.bot or message.guild is None:
+        # ボイス接続中のサーバー・読み上げ対象チャンネル以外はここで O(1) で捨てる
+        if message.guild is None:
+            return
+        control = self.tts_controls.get(message.guild.id)
+        if control is None or message.channel.id != control["channel_id"] or message.author.bot:
             return
         
-        # メッセージの前処理（メンション・絵文字・URL置き換え）
-        processed_content = message.content
-        
-        # メンションを表示名に置き換え
-        for mention in message.mentions:
-            print(f"メンション置き換え: {mention.mention} -> {mention.display_name}")
-            processed_content = processed_content.replace(mention.mention, mention.display_name)
-        
-        # 絵文字をテキストに置き換え
-        processed_content = re.sub(r'<a?:([^:]+):(\d+)>', r'[\1]', processed_content)
-        
-        # URLは読み上げ時に「URL省略」とする
-        processed_content = re.sub(r'https?://\S+', '[URL省略]', processed_content)
-        
-        # 処理されたコンテンツをメッセージに設定
-        message.content = processed_content
+        # トレース有効時のみ各段階の時刻を記録する（無効時は None）
+        trace = TRACER.start(message.guild.id, str(message.author.id))
+        started = time.perf_counter()
+        text = self._build_read_text(message)
+        if trace is not None:
+            trace.text_length = len(text)
+            trace.add_span("preprocess", started)
+        if text:
+            await self._process_tts_message(message, text, trace)
+        elif trace is not None:
+            trace.finish("empty")
+    
+    def _build_read_text(self, message: discord.Message) -> str:
+        """読み上げ用テキストを作成（Message 自体は変更しない）"""
+        # メンション・ロール・チャンネル・絵文字・URL・コードブロック・辞書・長さ制限
+        content = message.content
+        mentions = roles = channels = None
+        if "<" in content:
+            mentions = {member.id: member.display_name for member in message.mentions}
+            roles = {role.id: role.name for role in message.role_mentions}
+            channels = {channel.id: channel.name for channel in message.channel_mentions}
+        return self.preprocessor.process(content, message.guild.id, mentions, roles, channels).strip()
+    
+    async def _process_tts_message(self, message: discord.Message, text: str, trace: Optional[Trace] = None) -> None:
+        """TTS処理を再生キューに積む（順序はメッセージの到着順）"""
+        guild_id = message.guild.id
+        control = self.tts_controls.get(guild_id)
+        if control is None:
+            return
+        user_id = str(message.author.id)
+        chunks = split_sentences(text) if self.sentence_chunking else []
         
-        print(f"元メッセージ: {message.content} -> 処理後: {processed_content}")
+        # 文ごとに合成を予約する。再生が近づいた順に合成されるので1文目が最初に仕上がり、
+        # それを再生している間に続きの文が合成される（キャッシュも文ごと）
+        requests = [
+            ReadRequest(user_id, chunk, trace=trace if index == 0 else None)
+            for index, chunk in enumerate(chunks if len(chunks) > 1 else [text])
+        ]
+        # メッセージ全体で滞留を判定する。1文目だけ直前の同じ人の投稿にまとめられ、
+        # 2文目以降はそれに続けて積む（捨てるときも文の途中から欠けないよう一緒に捨てる）
+        admitted = control["backlog"].admit(control["player"], requests[0], requests[1:])
+        if not admitted and trace is not None:
+            trace.finish("merged")
+        for request in requests if admitted else requests[1:]:
+            await self._play_audio_in_discord(
+                guild_id,
+                lambda request=request: self._prepare_request(request, guild_id),
+                message_start=request is requests[0],
+                request=request
+            )
 
-        if message.guild.id in self.tts_controls:
-            await self._process_tts_message(message)
-    
-    async def _process_tts_message(self, message: discord.Message) -> None:
-        """TTS処理を実行（キャッシュ対応）"""
-        # ユーザー設定を取得（DB から）
-        user_settings = await self._get_user_voice_settings(str(message.author.id))
-        print(f"ユーザー設定: {user_settings}")
+    async def _prepare_request(self, request: ReadRequest, guild_id: int) -> Optional[str]:
+        """読み上げ要求を合成する（まとめ・読み飛ばしの反映後、再生が近づいてから呼ばれる）"""
+        control = self.tts_controls.get(guild_id)
+        speed = control["backlog"].speed_factor(control["player"]) if control else 1.0
+        return await self._prepare_audio(request.text, request.author_id, guild_id, speed, request.trace)
+
+    async def _prepare_audio(
+        self, text: str, user_id: str, guild_id: int, speed: float = 1.0, trace: Optional[Trace] = None
+    ) -> Optional[str]:
+        """音声ファイルを用意してパスを返す（キャッシュ対応）"""
+        if not tts_manager.ready:
+            # 起動直後は音声一覧が確定するまで待ってからプリセットを作る
+            try:
+                await asyncio.wrap_future(tts_manager.start())
+            except Exception:
+                return None
         
-        # VoicePresetを作成
-        voice_preset = tts_manager.create_voice_preset(user_settings)
+        # ユーザー設定を取得（メモリキャッシュ、なければ DB から）
+        started = time.perf_counter()
+        voice = await self.voice_settings_cache.get(user_id)
+        if speed != 1.0:
+            voice = self._with_speed(voice, speed)
+        if trace is not None:
+            trace.add_span("voice_settings", started)
         
         # キャッシュキーを生成
-        cache_key = self._generate_cache_key(message.content, voice_preset)
+        cache_key = self._generate_cache_key(text, voice.fingerprint)
         
         # キャッシュされた音声ファイルがあるかチェック
-        if self._is_audio_cached(cache_key):
-            print(f"🎵 キャッシュされた音声を使用: {cache_key}")
-            cached_audio_path = self._get_cached_audio_path(cache_key)
-            await self._play_audio_in_discord(message.guild.id, cached_audio_path)
-            return
+        started = time.perf_counter()
+        cached_audio_path = self.audio_cache.get(cache_key)
+        if trace is not None:
+            trace.add_span("cache_lookup", started)
+        if cached_audio_path is not None:
+            logger.debug("キャッシュされた音声を使用: %s", cache_key)
+            return cached_audio_path
         
-        print(f"🔄 新しい音声を生成中: {cache_key}")
-        
-        # プリセットを適用
-        fallback_voice = user_settings.get("voice", list(tts_manager.voice_names.keys())[0] if tts_manager.voice_names else "")
-        if not tts_manager.apply_voice_preset(voice_preset, fallback_voice):
-            print("VoicePreset適用に失敗しました")
-            return
+        logger.debug("新しい音声を生成中: %s", cache_key)
         
-        # 音声を生成
-        if not tts_manager.generate_audio(message.content):
-            print("音声生成に失敗しました")
-            return
+        started = time.perf_counter()
+        if trace is not None:
+            trace.mark("synthesis_requested")
+        try:
+            return await self.inflight_syntheses.run(
+                cache_key,
+                lambda: self.synthesis_worker.run(
+                    self._synthesize, text, voice, cache_key, trace,
+                    guild_id=guild_id, cost=len(text)
+                )
+            )
+        except (SynthesisQueueFull, SynthesisJobDropped) as e:
+            logger.warning("合成キューが満杯のためスキップしました (guild=%s): %s", guild_id, e)
+            return None
+        finally:
+            if trace is not None:
+                # 合成待ち＋合成（同じ音声を合成中なら、その完了を待った時間）
+                trace.add_span("synthesis_wait", started)
+    
+    def _with_speed(self, voice: ResolvedVoice, factor: float) -> ResolvedVoice:
+        """話速を倍率で上げたプリセットを作る（指紋も変わるのでキャッシュは別になる）"""
+        preset = dict(voice.preset)
+        preset["Speed"] = min(4.0, round(float(preset.get("Speed", 1.0)) * factor, 2))
+        return ResolvedVoice(voice.settings, preset, tts_manager.preset_fingerprint(preset))
+    
+    def _synthesize(self, text: str, voice: ResolvedVoice, cache_key: str, trace: Optional[Trace] = None) -> Optional[str]:
+        """空いているエンジンでプリセット適用・音声生成（合成ワーカーのスレッドで実行）"""
+        if trace is not None:
+            trace.add_span("synthesis_queue", trace.marks["synthesis_requested"])
+        fallback_voice = voice.settings.get("voice", list(tts_manager.voice_names.keys())[0] if tts_manager.voice_names else "")
         
-        # 生成された音声をキャッシュに保存
-        cached_audio_path = self._save_to_cache(cache_key)
+        # 音声をキャッシュへ直接生成（一時ファイル経由で置き換えるので競合しない）
+        cached_audio_path = self.audio_cache.path_for(cache_key)
+        if self.audio_format == "opus":
+            wav_path = os.path.join(self.audio_cache_dir, f".{uuid.uuid4().hex}.wav")
+            try:
+                if not tts_manager.synthesize(text, voice.preset, wav_path, fallback_voice, voice.fingerprint, trace):
+                    logger.warning("音声生成に失敗しました: %s", cache_key)
+                    return None
+                # 再生のたびに変換しないよう、ここで一度だけ Opus にしておく
+                started = time.perf_counter()
+                encode_opus_file(wav_path, cached_audio_path)
+                if trace is not None:
+                    trace.add_span("opus_encode", started)
+            finally:
+                if os.path.exists(wav_path):
+                    os.remove(wav_path)
+        elif not tts_manager.synthesize(text, voice.preset, cached_audio_path, fallback_voice, voice.fingerprint, trace):
+            logger.warning("音声生成に失敗しました: %s", cache_key)
+            return None
         
-        # Discordで再生
-        await self._play_audio_in_discord(message.guild.id, cached_audio_path)
+        started = time.perf_counter()
+        self.audio_cache.put(cache_key, cached_audio_path)
+        if trace is not None:
+            trace.add_span("cache_put", started)
+        logger.debug("音声ファイルをキャッシュに保存: %s", cache_key)
+        return cached_audio_path
     
-    async def _play_audio_in_discord(self, guild_id: int, audio_file: str = "data/audio/output.wav") -> None:
-        """Discordボイスチャンネルで音声を再生"""
+    async def _play_audio_in_discord(
+        self, guild_id: int, audio: AudioInput, message_start: bool = True, request: Optional[ReadRequest] = None
+    ) -> None:
+        """Discordボイスチャンネルの再生キューに音声を追加"""
+        control = self.tts_controls.get(guild_id)
+        if control is None:
+            if asyncio.iscoroutine(audio):
+                audio.close()
+            return
+        
         try:
-            vc = self.tts_controls[guild_id]["vc"]
-            
-            # 現在再生中の音声が終わるまで待機
-            while vc.is_playing():
-                await asyncio.sleep(0.5)
-            
-            # 音声を再生
-            vc.play(discord.FFmpegPCMAudio(audio_file))
-            
+            control["player"].enqueue(audio, message_start, request, request.trace if request else None)
         except Exception as e:
-            print(f"音声再生エラー: {e}")
+            logger.error("音声再生エラー (guild=%s): %s", guild_id, e)
 
     async def cog_unload(self) -> None:
-        """Cog のアンロード時にデータベース接続を閉じる"""
+        """Cog のアンロード時に再生キュー・合成ワーカー・キャッシュ・データベース接続を閉じる"""
+        for control in self.tts_controls.values():
+            control["player"].close()
+        VoiceSettings.remove_change_listener(self.voice_settings_cache.invalidate)
+        for name, *_ in self._metric_collectors():
+            REGISTRY.unregister_collector(name)
+        if self.settings_feed is not None:
+            self.settings_feed.close()
+        if self.status_server is not None:
+            self.status_server.close()
+        self.synthesis_worker.close()
+        self.audio_cache.close()
         await close_db()
 
 async def setup(bot: commands.Bot) -> None:
     await bot.add_cog(TTSCog(bot))
-    print(f'{__name__} loaded successfully.')
+    logger.info("%s loaded successfully", __name__)
@@ -0,0 +1,101 @@
+"""
+スラッシュコマンドの同期（コマンド定義が変わったときだけ Discord に送る）
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+import discord
+from discord import app_commands
+
+logger = logging.getLogger(__name__)
+
+
+def command_tree_hash(tree: app_commands.CommandTree, guild: Optional[discord.abc.Snowflake] = None) -> str:
+    """同期される内容（``tree.sync`` が送る JSON）のハッシュ"""
+    payload = sorted(
+        (command.to_dict(tree) for command in tree.get_commands(guild=guild)),
+        key=lambda command: (command.get("type", 1), command["name"]),
+    )
+    serialized = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class CommandSyncState:
+    """同期済みのハッシュを JSON ファイルに保存したもの（アプリケーション・同期先ごと）"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.hashes: Dict[str, str] = {}
+
+    def load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.hashes = dict(json.load(f))
+        except FileNotFoundError:
+            self.hashes = {}
+        except (OSError, ValueError) as e:
+            logger.warning("コマンド同期状態の読み込みエラー（すべて同期します）: %s", e)
+            self.hashes = {}
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_file = f"{self.path}.tmp"
+        try:
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump(self.hashes, f, indent=2)
+            os.replace(temp_file, self.path)
+        except OSError as e:
+            logger.warning("コマンド同期状態の保存エラー: %s", e)
+
+
+def parse_guild_ids(value: str) -> List[int]:
+    """カンマ区切りのサーバーID"""
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+async def sync_command_tree(
+    tree: app_commands.CommandTree,
+    application_id: int,
+    guild_ids: List[int],
+    state_path: str,
+    mode: str = "auto",
+) -> List[str]:
+    """コマンドを同期し、実際に同期した先の一覧を返す
+
+    ``guild_ids`` があればグローバルコマンドを各サーバーにコピーしてサーバー単位で、
+    なければグローバルに同期する。``mode`` は auto（変更があるときだけ）/
+    force（常に同期）/ off（同期しない）。
+    """
+    if mode == "off":
+        return []
+
+    if not guild_ids:
+        logger.warning(
+            "COMMAND_GUILD_IDS is empty: syncing commands globally. Guild commands registered earlier stay "
+            "until removed, so users may see duplicates, and global changes can take a while to propagate"
+        )
+    state = CommandSyncState(state_path)
+    state.load()
+    targets = [discord.Object(id=guild_id) for guild_id in guild_ids] or [None]
+    synced = []
+    for guild in targets:
+        if guild is not None:
+            tree.copy_global_to(guild=guild)
+        label = str(guild.id) if guild is not None else "global"
+        key = f"{application_id}:{label}"
+        digest = command_tree_hash(tree, guild)
+        if mode != "force" and state.hashes.get(key) == digest:
+            logger.info("Command tree unchanged, skipping sync (%s)", label)
+            continue
+        await tree.sync(guild=guild)
+        state.hashes[key] = digest
+        synced.append(label)
+        logger.info("Synced command tree (%s)", label)
+    if synced:
+        state.save()
+    return synced
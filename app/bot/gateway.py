@@ -0,0 +1,66 @@
+"""
+Gateway 接続の設定（インテント・メンバーキャッシュ・メッセージキャッシュ・シャーディング）
+"""
+from typing import Any, Dict, Optional
+
+import discord
+
+from ..core.environment import ENV
+
+
+def minimal_intents() -> discord.Intents:
+    """各 Cog が実際に使うイベントだけを受け取るインテント
+
+    - guilds: サーバー・チャンネル・ロールのキャッシュ（メンションの読み替え、ボイス接続）
+    - guild_messages / message_content: 読み上げとメッセージリンクの展開
+    - voice_states: ``/voice join`` で呼び出したユーザーのボイスチャンネルを知るため
+
+    メンバー一覧やプレゼンスは使わない（メンションされたメンバーはメッセージに含まれる）。
+    """
+    return discord.Intents(guilds=True, guild_messages=True, message_content=True, voice_states=True)
+
+
+def gateway_options(profile: Optional[str] = None) -> Dict[str, Any]:
+    """Bot に渡すインテント・キャッシュ・シャードの設定
+
+    ``profile`` は minimal（既定）か full（すべてのインテントとメンバー・メッセージのキャッシュ）。
+    """
+    profile = profile or ENV.get("BOT_GATEWAY_PROFILE", "minimal")
+    if profile == "full":
+        intents = discord.Intents.all()
+        options = {
+            "intents": intents,
+            "member_cache_flags": discord.MemberCacheFlags.from_intents(intents),
+            "max_messages": 1000,
+        }
+    elif profile == "minimal":
+        options = {
+            "intents": minimal_intents(),
+            # ボイスチャンネルにいるメンバーだけ（自分自身は常にキャッシュされる）
+            "member_cache_flags": discord.MemberCacheFlags(voice=True, joined=False),
+            # メッセージの編集・削除イベントは使わないので、既定ではキャッシュしない
+            "max_messages": None,
+            "chunk_guilds_at_startup": False,
+        }
+    else:
+        raise ValueError(f"Unknown BOT_GATEWAY_PROFILE: {profile} (available: minimal, full)")
+
+    max_messages = ENV.get("BOT_MAX_MESSAGES")
+    if max_messages:
+        options["max_messages"] = int(max_messages) or None
+
+    if sharding_enabled():
+        # 未指定なら Discord の推奨シャード数
+        shard_count = ENV.get("BOT_SHARD_COUNT")
+        if shard_count:
+            options["shard_count"] = int(shard_count)
+        shard_ids = ENV.get("BOT_SHARD_IDS")
+        if shard_ids:
+            # 複数プロセスに分けて動かす場合に、このプロセスが受け持つシャード
+            options["shard_ids"] = [int(shard_id) for shard_id in shard_ids.split(",") if shard_id.strip()]
+    return options
+
+
+def sharding_enabled() -> bool:
+    """AutoShardedBot を使うか"""
+    return ENV.get("BOT_SHARDING", "false").lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,147 @@
+"""
+音声ファイルの変換と再生用 AudioSource
+"""
+import logging
+import os
+import subprocess
+import uuid
+import wave
+from typing import Iterator
+
+import discord
+import numpy as np
+from discord.oggparse import OggStream
+from discord.opus import Encoder as OpusEncoder
+
+logger = logging.getLogger(__name__)
+
+# Opus ストリーム先頭のヘッダーパケット（音声データではない）
+_OPUS_HEADER_PREFIXES = (b"OpusHead", b"OpusTags")
+
+
+def encode_opus_file(source_file: str, output_file: str, bitrate: str = "64k") -> None:
+    """WAV を Discord 向けの Ogg Opus（48kHz / ステレオ / 20ms フレーム）に変換
+
+    キャッシュへの登録時に一度だけ実行する。一時ファイルに書き出してから
+    ``os.replace`` で置き換えるので、途中のファイルが再生されることはない。
+    """
+    directory, file_name = os.path.split(output_file)
+    temp_file = os.path.join(directory, f".{uuid.uuid4().hex}.{file_name}")
+    command = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+        "-i", source_file,
+        "-map_metadata", "-1",
+        "-c:a", "libopus", "-b:a", bitrate,
+        "-ar", "48000", "-ac", "2",
+        "-frame_duration", "20",
+        "-f", "ogg", temp_file,
+    ]
+    try:
+        subprocess.run(command, check=True, capture_output=True)
+        os.replace(temp_file, output_file)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg failed: {e.stderr.decode(errors='replace').strip()}") from e
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+class OggOpusAudio(discord.AudioSource):
+    """Ogg Opus ファイルのパケットをそのまま送る AudioSource
+
+    ``is_opus()`` が True なので discord.py は再エンコードせずに送信する。
+    ffmpeg のサブプロセスも起動しない。
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            packets = [
+                packet for packet in OggStream(f).iter_packets()
+                if not packet.startswith(_OPUS_HEADER_PREFIXES)
+            ]
+        self._packets: Iterator[bytes] = iter(packets)
+
+    def read(self) -> bytes:
+        return next(self._packets, b"")
+
+    def is_opus(self) -> bool:
+        return True
+
+
+def load_wav_as_discord_pcm(path: str) -> bytes:
+    """PCM WAV を読み込み、Discord の送信形式（48kHz / ステレオ / s16le）に変換
+
+    リサンプリング（線形補間）とチャンネル変換は NumPy でまとめて行い、
+    末尾は 20ms フレームの倍数になるよう無音で埋める。
+    """
+    with wave.open(path, "rb") as w:
+        channels = w.getnchannels()
+        sample_width = w.getsampwidth()
+        rate = w.getframerate()
+        raw = w.readframes(w.getnframes())
+
+    if sample_width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) * 256.0
+    elif sample_width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32)
+    elif sample_width == 3:
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = ((packed[:, 0] | (packed[:, 1] << 8) | (packed[:, 2] << 16)) << 8 >> 16).astype(np.float32)
+    elif sample_width == 4:
+        samples = (np.frombuffer(raw, dtype="<i4") >> 16).astype(np.float32)
+    else:
+        raise ValueError(f"Unsupported sample width: {sample_width}")
+    samples = samples.reshape(-1, channels)
+
+    if rate != OpusEncoder.SAMPLING_RATE and len(samples):
+        out_length = int(round(len(samples) * OpusEncoder.SAMPLING_RATE / rate))
+        positions = np.arange(out_length, dtype=np.float64) * (rate / OpusEncoder.SAMPLING_RATE)
+        source_index = np.arange(len(samples), dtype=np.float64)
+        samples = np.stack(
+            [np.interp(positions, source_index, samples[:, ch]) for ch in range(channels)],
+            axis=1,
+        )
+
+    if channels == 1:
+        samples = np.repeat(samples, OpusEncoder.CHANNELS, axis=1)
+    elif channels > OpusEncoder.CHANNELS:
+        samples = samples[:, :OpusEncoder.CHANNELS]
+
+    pcm = np.clip(np.rint(samples), -32768, 32767).astype("<i2").tobytes()
+    remainder = len(pcm) % OpusEncoder.FRAME_SIZE
+    if remainder:
+        pcm += b"\x00" * (OpusEncoder.FRAME_SIZE - remainder)
+    return pcm
+
+
+class WavPCMAudio(discord.AudioSource):
+    """WAV をプロセス内で変換して 20ms ずつ返す AudioSource
+
+    ``FFmpegPCMAudio`` と違いサブプロセスを起動しないため、ffmpeg が無くても再生でき、
+    最初のフレームまでの時間も短い。
+    """
+
+    def __init__(self, path: str) -> None:
+        self._buffer = memoryview(load_wav_as_discord_pcm(path))
+        self._offset = 0
+
+    def read(self) -> bytes:
+        frame = self._buffer[self._offset:self._offset + OpusEncoder.FRAME_SIZE]
+        self._offset += OpusEncoder.FRAME_SIZE
+        return bytes(frame)
+
+    def is_opus(self) -> bool:
+        return False
+
+
+def create_audio_source(path: str) -> discord.AudioSource:
+    """キャッシュファイルの形式に応じた AudioSource を作成"""
+    if path.endswith(".opus"):
+        return OggOpusAudio(path)
+    if path.endswith(".wav"):
+        try:
+            return WavPCMAudio(path)
+        except (wave.Error, ValueError) as e:
+            # 非 PCM の WAV などは ffmpeg に任せる
+            logger.warning("WAV読み込みエラー（ffmpegで再生します）: %s", e)
+    return discord.FFmpegPCMAudio(path)
@@ -0,0 +1,262 @@
+"""
+バイト数上限付きの音声キャッシュ
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+
+@dataclass
+class _Entry:
+    filename: str
+    size: int
+    hits: int
+    last_hit: float
+
+
+class AudioCache:
+    """LRU で追い出す音声キャッシュ
+
+    キー・ファイル名・サイズ・最終ヒット時刻・ヒット数を SQLite のインデックスに
+    保存し、起動時にメモリ上の LRU リストへ読み込む。参照・追加・追い出し・
+    統計はいずれもディレクトリを走査せず O(1) で行う。
+
+    参照はイベントループから呼ばれるため、ヒットの記録はメモリ上だけで行い、
+    インデックスへは合成ワーカーのスレッドで呼ばれる ``put`` と ``close`` でまとめて書き込む。
+
+    ``get`` が返したパスは再生キューで後から開かれるため、追い出したファイルはすぐには消さず、
+    ``eviction_grace`` 秒たってから次の ``put`` でロックの外で削除する。
+    """
+
+    INDEX_FILE = "index.sqlite3"
+    # 取り込むクリップの拡張子（形式を切り替える前の .wav もそのまま再生できる）
+    AUDIO_SUFFIXES = (".opus", ".wav")
+
+    def __init__(self, cache_dir: str, max_bytes: int, suffix: str = ".wav", eviction_grace: float = 60.0) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.eviction_grace = eviction_grace
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # イベントループと合成ワーカーの両方から触るのでロックで保護する
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(cache_dir, self.INDEX_FILE),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " filename TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " hits INTEGER NOT NULL DEFAULT 0,"
+            " last_hit REAL NOT NULL)"
+        )
+
+        # 先頭が最も長く使われていないエントリ
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # インデックスに未反映のヒットと、ファイルが消えていたエントリ
+        self._dirty: Set[str] = set()
+        self._missing: Set[str] = set()
+        # 追い出したがまだ削除していないファイル（ファイル名 -> 追い出した時刻、古い順）
+        self._evicted: "OrderedDict[str, float]" = OrderedDict()
+
+        self._load_index()
+
+    def _load_index(self) -> None:
+        """インデックスを読み込む（空なら既存ファイルを一度だけ取り込む）"""
+        rows = self._db.execute(
+            "SELECT key, filename, size, hits, last_hit FROM entries ORDER BY last_hit"
+        ).fetchall()
+        if not rows:
+            rows = self._import_existing_files()
+
+        for key, filename, size, hits, last_hit in rows:
+            self._entries[key] = _Entry(filename, size, hits, last_hit)
+            self.total_bytes += size
+
+        with self._lock:
+            self._evict()
+            # 起動時はまだ誰もパスを受け取っていないのですぐに消す
+            evicted = self._take_evicted(float("inf"))
+        self._remove_files(evicted)
+
+    def _import_existing_files(self) -> list:
+        """インデックス導入前に作られたキャッシュファイルを登録する
+
+        現在の形式以外（.opus 導入前の .wav など）も取り込む。同じキーに両方あれば現在の形式を残し、
+        もう一方は管理外のまま残らないよう削除する。
+        """
+        suffixes = (self.suffix,) + tuple(s for s in self.AUDIO_SUFFIXES if s != self.suffix)
+        found: Dict[str, tuple] = {}
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                name = entry.name
+                suffix = next((s for s in suffixes if name.endswith(s)), None)
+                if name.startswith(".") or suffix is None or not entry.is_file():
+                    continue
+                key = name[: -len(suffix)]
+                stat = entry.stat()
+                row = (name, stat.st_size, 0, stat.st_mtime)
+                previous = found.setdefault(key, row)
+                if previous is not row:
+                    current, stale = (previous, row) if previous[0].endswith(self.suffix) else (row, previous)
+                    found[key] = current
+                    self._remove_file(stale[0])
+        rows = sorted(((key,) + row for key, row in found.items()), key=lambda row: row[4])
+        self._db.executemany(
+            "INSERT OR REPLACE INTO entries (key, filename, size, hits, last_hit) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        return rows
+
+    def path_for(self, key: str) -> str:
+        """新しく書き込むクリップのパス"""
+        return os.path.join(self.cache_dir, f"{key}{self.suffix}")
+
+    def get(self, key: str) -> Optional[str]:
+        """キャッシュ済みならパスを返し、ヒットを記録する（インデックスへの書き込みは後でまとめて行う）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            path = os.path.join(self.cache_dir, entry.filename)
+            if not os.path.exists(path):
+                # 外から消されたファイルはエントリごと捨てて作り直させる
+                del self._entries[key]
+                self.total_bytes -= entry.size
+                self._dirty.discard(key)
+                self._missing.add(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            entry.last_hit = time.time()
+            self.hits += 1
+            self._dirty.add(key)
+            return path
+
+    def put(self, key: str, path: str) -> None:
+        """書き込み済みのクリップを登録し、上限を超えた分を追い出す"""
+        size = os.path.getsize(path)
+        filename = os.path.basename(path)
+        now = time.time()
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous.size
+            self._entries[key] = _Entry(filename, size, 0, now)
+            self.total_bytes += size
+            self._dirty.discard(key)
+            self._missing.discard(key)
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, filename, size, hits, last_hit) VALUES (?, ?, ?, 0, ?)",
+                (key, filename, size, now),
+            )
+            self._evicted.pop(filename, None)
+            self._evict()
+            self._flush()
+            evicted = self._take_evicted(now - self.eviction_grace)
+        self._remove_files(evicted)
+
+    def _flush(self) -> None:
+        """メモリ上のヒットと消えていたエントリを1回のトランザクションでインデックスに反映する"""
+        if not self._dirty and not self._missing:
+            return
+        updates = [
+            (entry.hits, entry.last_hit, key)
+            for key, entry in ((key, self._entries.get(key)) for key in self._dirty)
+            if entry is not None
+        ]
+        self._db.execute("BEGIN")
+        try:
+            self._db.executemany("UPDATE entries SET hits = ?, last_hit = ? WHERE key = ?", updates)
+            self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in self._missing])
+        except sqlite3.Error:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+        self._dirty.clear()
+        self._missing.clear()
+
+    def _evict(self) -> None:
+        """上限を超えている間、最も古いエントリを外す（直近の1件は残す。ファイルは後で消す）"""
+        now = time.time()
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry.size
+            self.evictions += 1
+            self._dirty.discard(key)
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._evicted[entry.filename] = now
+
+    def _take_evicted(self, before: float) -> List[str]:
+        """``before`` より前に追い出したファイル名を取り出す（ロックを持って呼ぶ）"""
+        filenames = []
+        while self._evicted:
+            filename, evicted_at = next(iter(self._evicted.items()))
+            if evicted_at > before:
+                break
+            del self._evicted[filename]
+            filenames.append(filename)
+        return filenames
+
+    def _remove_file(self, filename: str) -> None:
+        try:
+            os.remove(os.path.join(self.cache_dir, filename))
+        except OSError:
+            pass
+
+    def _remove_files(self, filenames: Iterable[str]) -> None:
+        for filename in filenames:
+            self._remove_file(filename)
+
+    def clear(self) -> int:
+        """全エントリを削除し、削除した件数を返す（ファイルの削除はロックの外で行う）"""
+        with self._lock:
+            count = len(self._entries)
+            filenames = [entry.filename for entry in self._entries.values()]
+            filenames.extend(self._take_evicted(float("inf")))
+            self._entries.clear()
+            self._dirty.clear()
+            self._missing.clear()
+            self.total_bytes = 0
+            self._db.execute("DELETE FROM entries")
+        self._remove_files(filenames)
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        """件数・サイズ・ヒット率などの統計"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        """未反映のヒットを書き込んでインデックスを閉じる（追い出し済みのファイルもここで消す）"""
+        with self._lock:
+            self._flush()
+            self._db.close()
+            evicted = self._take_evicted(float("inf"))
+        self._remove_files(evicted)
@@ -0,0 +1,175 @@
+"""
+読み上げの滞留（バックログ）制御
+"""
+from dataclasses import dataclass
+from itertools import count
+from typing import Dict, List, Optional, Sequence
+
+from .playback import GuildPlayer, QueueItem
+from .text_processor import SENTENCE_DELIMITERS
+from .tracing import Trace
+
+
+@dataclass
+class BacklogPolicy:
+    """サーバーごとの滞留時の振る舞い（既定ではどれも無効）"""
+    merge_same_author: bool = False     # 同じ人の連続投稿を1回の合成にまとめる
+    max_backlog_seconds: float = 0.0    # 滞留がこの秒数を超えたら古いものを捨てる（0 で無効）
+    overflow_action: str = "summarize"  # drop: 黙って捨てる / summarize: 「他N件」と読む
+    speedup_after_seconds: float = 0.0  # 滞留がこの秒数を超えたら話速を上げ始める（0 で無効）
+    max_speed: float = 1.5              # 話速の倍率の上限（speedup_after_seconds の2倍の滞留で到達）
+    chars_per_second: float = 7.0       # 等速で1秒に読む文字数の目安
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "merge_same_author": self.merge_same_author,
+            "max_backlog_seconds": self.max_backlog_seconds,
+            "overflow_action": self.overflow_action,
+            "speedup_after_seconds": self.speedup_after_seconds,
+            "max_speed": self.max_speed,
+        }
+
+
+@dataclass
+class ReadRequest:
+    """合成前の読み上げ要求（準備が始まるまでは書き換えられる）"""
+    author_id: str
+    text: str
+    skipped: int = 0  # 「他N件」にまとめた件数（0 なら通常のメッセージ）
+    trace: Optional[Trace] = None
+    # 1つのメッセージを文ごとに分けた要求に共通の番号（まとめて受け付け、まとめて捨てる）
+    group: Optional[int] = None
+
+
+class BacklogController:
+    """再生キューの滞留を見て、まとめる・捨てる・速める"""
+
+    def __init__(self, policy: Optional[BacklogPolicy] = None, max_merge_length: int = 200) -> None:
+        self.policy = policy or BacklogPolicy()
+        # まとめた後の文字数の上限（超えるなら別の要求として積む。0 で無制限）
+        self.max_merge_length = max_merge_length
+        self.merged_count = 0
+        self.dropped_count = 0
+        self._groups = count()
+
+    def estimate_seconds(self, text: str) -> float:
+        """等速で読んだときのおおよその秒数"""
+        return len(text) / self.policy.chars_per_second
+
+    def backlog_seconds(self, player: GuildPlayer) -> float:
+        """再生待ちの音声のおおよその長さ（秒）"""
+        return sum(
+            self.estimate_seconds(item.request.text)
+            for item in player.queued_items()
+            if isinstance(item.request, ReadRequest)
+        )
+
+    def admit(self, player: GuildPlayer, request: ReadRequest, following: Sequence[ReadRequest] = ()) -> bool:
+        """新しい要求を受け付ける前に滞留を処理する
+
+        ``following`` には同じメッセージの2文目以降を渡す。滞留の見積もりにはメッセージ全体を含め、
+        全員に同じ ``group`` を付けるので、後で捨てるときも途中の文だけが残ることはない。
+
+        直前の未合成の要求にまとめた場合は False を返す（``request`` を新たに積む必要はなく、
+        ``following`` はまとめた先と同じグループとして続けて積む）。
+        まとめると ``max_merge_length`` を超える場合はまとめずに新しい要求として受け付け、
+        1回の合成が際限なく長くならないようにする。
+        """
+        policy = self.policy
+        queued = player.queued_items()
+        pending = [item for item in queued if not item.started and isinstance(item.request, ReadRequest)]
+        following_seconds = sum(self.estimate_seconds(part.text) for part in following)
+
+        if policy.merge_same_author and pending:
+            last = pending[-1]
+            if last is queued[-1] and not last.request.skipped and last.request.author_id == request.author_id:
+                separator = "" if last.request.text[-1:] in SENTENCE_DELIMITERS else "。"
+                merged = f"{last.request.text}{separator}{request.text}"
+                if not self.max_merge_length or len(merged) <= self.max_merge_length:
+                    last.request.text = merged
+                    self.merged_count += 1
+                    self._assign_group(last.request, following)
+                    self._trim(player, pending, following_seconds, following)
+                    return False
+
+        self._assign_group(request, following)
+        self._trim(player, pending, self.estimate_seconds(request.text) + following_seconds, following)
+        return True
+
+    def _assign_group(self, head: ReadRequest, following: Sequence[ReadRequest]) -> None:
+        """2文目以降を先頭の要求と同じグループにする"""
+        if head.group is None:
+            head.group = next(self._groups)
+        for part in following:
+            part.group = head.group
+
+    def _trim(
+        self, player: GuildPlayer, pending: List[QueueItem], incoming_seconds: float,
+        incoming: Sequence[ReadRequest] = ()
+    ) -> None:
+        """滞留が上限を超える分だけ、古い未合成のメッセージから捨てる（または「他N件」にまとめる）
+
+        文ごとに分けたメッセージはグループ単位で捨てる。一部でも準備が始まっているグループは
+        読み終えさせるため残す。まだ積んでいない ``incoming`` と同じグループも残す。
+        """
+        policy = self.policy
+        if not policy.max_backlog_seconds:
+            return
+
+        groups: Dict[int, List[QueueItem]] = {}
+        for item in pending:
+            groups.setdefault(self._group_key(item), []).append(item)
+        keep = {
+            self._group_key(item) for item in player.queued_items()
+            if item.started and isinstance(item.request, ReadRequest)
+        }
+        keep.update(part.group for part in incoming)
+
+        excess = self.backlog_seconds(player) + incoming_seconds - policy.max_backlog_seconds
+        summary: Optional[QueueItem] = None
+        for group, items in groups.items():
+            if excess <= 0:
+                break
+            head = items[0]
+            if head.request.skipped:
+                summary = head
+                continue
+            if group in keep:
+                continue
+            excess -= sum(self.estimate_seconds(item.request.text) for item in items)
+            self.dropped_count += 1
+            if policy.overflow_action == "summarize":
+                if summary is None:
+                    # 最初に捨てるメッセージの先頭を「他N件」の読み上げに置き換える
+                    head.request.skipped = 1
+                    head.request.author_id = ""
+                    head.request.text = "他1件"
+                    head.request.group = None
+                    if head.trace is not None:
+                        # 元のメッセージは読まれないので、そのトレースはここで確定する
+                        head.trace.finish("dropped")
+                        head.trace = head.request.trace = None
+                    excess += self.estimate_seconds(head.request.text)
+                    summary = head
+                    items = items[1:]
+                else:
+                    summary.request.skipped += 1
+                    summary.request.text = f"他{summary.request.skipped}件"
+            for item in items:
+                player.discard(item)
+
+    @staticmethod
+    def _group_key(item: QueueItem) -> int:
+        """グループの無い要求（「他N件」など）はそれ単独で1つのメッセージとして扱う"""
+        group = item.request.group
+        return group if group is not None else -id(item)
+
+    def speed_factor(self, player: GuildPlayer) -> float:
+        """滞留に応じた話速の倍率（0.1 刻みにしてキャッシュを効かせる）"""
+        policy = self.policy
+        if not policy.speedup_after_seconds or policy.max_speed <= 1.0:
+            return 1.0
+        backlog = self.backlog_seconds(player)
+        ratio = (backlog - policy.speedup_after_seconds) / policy.speedup_after_seconds
+        ratio = min(max(ratio, 0.0), 1.0)
+        return round(1.0 + (policy.max_speed - 1.0) * ratio, 1)
@@ -0,0 +1,147 @@
+"""
+ログ設定（キュー経由の非同期出力・JSON形式・デバッグログの間引き）
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional, TextIO, Tuple
+
+from .environment import ENV
+
+# LogRecord が標準で持つ属性（これ以外は extra として JSON に出す）
+_RESERVED = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+TEXT_FORMAT = "%(asctime)s %(levelname)-8s %(name)s: %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """1レコード1行の JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """DEBUG のレコードをメッセージの書式ごとに N 件に1件だけ通す
+
+    メッセージ受信ごとに出るような行が、デバッグ時にログを埋め尽くさないようにする。
+    INFO 以上は間引かない。通した行には ``sampled_every`` を付ける。
+    """
+
+    def __init__(self, every: int) -> None:
+        super().__init__()
+        self.every = max(1, every)
+        self._counts: Dict[Tuple[str, object], int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every == 1 or record.levelno > logging.DEBUG:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % self.every:
+            return False
+        record.sampled_every = self.every
+        return True
+
+
+class _EnqueueHandler(logging.handlers.QueueHandler):
+    """呼び出し側では引数の埋め込みだけ済ませてキューに積む
+
+    標準の QueueHandler は積む前に Formatter を通してしまうため、時刻や JSON への
+    書式化も出力スレッドに回すよう prepare を差し替える。引数は後から値が
+    変わらないよう、ここで文字列にしておく。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # トレースバックのフレームを出力スレッドに持ち越さない
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    """``app.bot.cogs.tts=DEBUG,discord=WARNING`` 形式のモジュール別レベル"""
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None, stream: Optional[TextIO] = None) -> None:
+    """ルートロガーをキュー経由の出力に切り替える
+
+    各モジュールは ``logging.getLogger(__name__)`` に書くだけでよい。実際の書式化と
+    標準出力・ファイルへの書き込みは専用スレッド（QueueListener）で行うので、
+    イベントループや合成スレッドがログの I/O で止まることはない。
+    何度呼んでも出力スレッドは1つだけ。``stream`` を省略すると標準出力に書く。
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    level = (level or ENV.get("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or ENV.get("LOG_FORMAT", "text")).lower()
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+
+    handlers = [logging.StreamHandler(stream or sys.stdout)]
+    log_file = ENV.get("LOG_FILE")
+    if log_file:
+        handlers.append(logging.handlers.WatchedFileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    enqueue = _EnqueueHandler(log_queue)
+    enqueue.addFilter(SamplingFilter(int(ENV.get("LOG_DEBUG_SAMPLE_EVERY", "1"))))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(enqueue)
+    root.setLevel(level)
+    for name, module_level in _parse_levels(ENV.get("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """キューに残ったログを書き出して出力スレッドを止める"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
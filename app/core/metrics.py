@@ -0,0 +1,241 @@
+"""
+読み上げパイプラインのメトリクス（Prometheus テキスト形式）
+"""
+import logging
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 秒単位の遅延向けのバケット
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# コレクターが返す1系列（ラベル, 値）
+Sample = Tuple[Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    """ラベルごとの子を持つメトリクスの共通部分
+
+    記録はロック1回と加算だけなので、合成スレッドやイベントループから常時呼んでよい。
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._default = self._new_child()
+            self._children[()] = self._default
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        """ラベルの値に対応する子（初回のみ作成）"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def remove(self, *values) -> None:
+        """ラベルの系列を削除（サーバーから退出したときなど）"""
+        with self._lock:
+            self._children.pop(tuple(str(value) for value in values), None)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            lines.extend(child.render(self.name, dict(zip(self.labelnames, key))))
+        return lines
+
+
+class _ValueChild:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def render(self, name: str, labels: Dict[str, str]) -> List[str]:
+        return [f"{name}{_format_labels(labels)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    """増え続ける回数"""
+
+    kind = "counter"
+
+    def _new_child(self) -> _ValueChild:
+        return _ValueChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def render(self, name: str, labels: Dict[str, str]) -> List[str]:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self._buckets + (float("inf"),), counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(dict(labels, le=_format_value(bound)))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    """値の分布（累積バケット・合計・件数）"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+
+class Registry:
+    """メトリクスとコレクターの一覧
+
+    コレクターは取得時にだけ呼ばれる関数で、既に別の場所で数えている値
+    （キャッシュの統計やキューの長さなど）をそのまま公開するのに使う。
+    """
+
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+        self._collectors: Dict[str, Tuple[str, str, Callable[[], Iterable[Sample]]]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(
+        self, name: str, kind: str, documentation: str, collect: Callable[[], Iterable[Sample]]
+    ) -> None:
+        """取得時に collect() の結果を name の系列として出力する（同名は置き換え）"""
+        with self._lock:
+            self._collectors[name] = (kind, documentation, collect)
+
+    def unregister_collector(self, name: str) -> None:
+        with self._lock:
+            self._collectors.pop(name, None)
+
+    def render(self) -> str:
+        """Prometheus のテキスト形式（text/plain; version=0.0.4）"""
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors.items())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for name, (kind, documentation, collect) in collectors:
+            try:
+                samples = list(collect())
+            except Exception as e:
+                logger.warning("メトリクス収集エラー (%s): %s", name, e)
+                continue
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def histogram(
+    name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Optional[Sequence[float]] = None
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets or DEFAULT_BUCKETS))
+
+
+# 合成エンジン
+SYNTHESIS_SECONDS = histogram("tts_synthesis_seconds", "Time spent generating audio on an engine", ("engine",))
+PRESET_APPLY_SECONDS = histogram(
+    "tts_preset_apply_seconds", "Time spent pushing a voice preset to an engine", ("engine",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+ENGINE_RECONNECTS = counter("tts_engine_reconnects_total", "Engine reconnections after a lost connection", ("engine",))
+
+# 合成待ち・再生待ち（サーバーごと）
+SYNTHESIS_QUEUE_WAIT_SECONDS = histogram(
+    "tts_synthesis_queue_wait_seconds", "Time a synthesis job waited in the worker queue", ("guild",)
+)
+PLAYBACK_WAIT_SECONDS = histogram(
+    "tts_playback_wait_seconds", "Time from enqueue to the clip starting to play", ("guild",)
+)
+PLAYBACK_START_DELAY_SECONDS = histogram(
+    "tts_playback_start_delay_seconds", "Gap between a clip being ready and starting to play",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+# データベース
+DB_QUERY_SECONDS = histogram(
+    "tts_db_query_seconds", "Voice settings database query time", ("operation",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
@@ -0,0 +1,325 @@
+"""
+ギルドごとの音声再生キュー
+"""
+import asyncio
+import inspect
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Union
+
+import discord
+
+from .metrics import PLAYBACK_START_DELAY_SECONDS, PLAYBACK_WAIT_SECONDS
+from .tracing import FirstFrameTracingSource, Trace
+
+logger = logging.getLogger(__name__)
+
+# 再生キューに積めるもの（音声ファイルのパス、パスを返す Awaitable、
+# または再生が近づいてから呼ばれる Awaitable のファクトリ）
+AudioInput = Union[str, Awaitable[Optional[str]], Callable[[], Awaitable[Optional[str]]]]
+
+# AudioSource の作成（WAV の読み込み・リサンプリング、Ogg のパケット分解）を行うスレッド
+_SOURCE_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="audio-source")
+
+
+@dataclass
+class QueueItem:
+    """再生キューの1件"""
+    enqueued_at: float
+    message_start: bool
+    request: Any = None
+    factory: Optional[Callable[[], Awaitable[Optional[str]]]] = None
+    # 準備が済むと再生できる AudioSource（音声が無ければ None）になる
+    future: Optional[asyncio.Future] = None
+    trace: Optional[Trace] = None
+
+    @property
+    def started(self) -> bool:
+        """音声の準備（合成など）が始まっているか"""
+        return self.future is not None
+
+
+class GuildPlayer:
+    """VoiceClient ごとの再生キュー
+
+    キューの消費は1つのタスクだけが行い、次のクリップは ``VoiceClient.play`` の
+    ``after=`` コールバックを合図に即座に再生する（ポーリングしない）。
+    Awaitable を積んだ場合も積んだ順に再生されるため、合成の完了順に関係なく
+    メッセージの順序が保たれる。
+
+    ファクトリを積んだ場合は、先頭から ``prepare_ahead`` 件以内に入った時点で
+    呼び出して準備を始める。それまでは ``request`` の書き換えや取り消しができる。
+
+    準備には AudioSource の作成も含め、別スレッドで行う。ファイルの読み込みや変換で
+    イベントループを止めず、前のクリップが終わったらすぐ次を鳴らせる。
+    """
+
+    def __init__(
+        self,
+        vc: discord.VoiceClient,
+        source_factory: Callable[[str], discord.AudioSource] = discord.FFmpegPCMAudio,
+        prepare_ahead: int = 2,
+        history_size: int = 200,
+        guild_id: Optional[int] = None,
+    ) -> None:
+        self.vc = vc
+        self.guild_id = guild_id
+        self._source_factory = source_factory
+        self.prepare_ahead = prepare_ahead
+        self._loop = asyncio.get_running_loop()
+        self._items: Deque[QueueItem] = deque()
+        self._has_items = asyncio.Event()
+        self._finished = asyncio.Event()
+        self._playing = False
+        self._closed = False
+        # キューから取り出して準備の完了を待っている、または再生中の項目
+        self._current: Optional[QueueItem] = None
+        self._started_at = 0.0
+        self._last_finished_at: Optional[float] = None
+
+        # 統計情報（直近 history_size 件）
+        self._wait_times: Deque[float] = deque(maxlen=history_size)
+        self._start_delays: Deque[float] = deque(maxlen=history_size)
+        # メッセージ受信から最初の音が鳴るまでの時間
+        self._first_audio_times: Deque[float] = deque(maxlen=history_size)
+        self.played_count = 0
+        self.failed_count = 0
+        # クリップの再生が始まるたびに (項目, 積まれてから鳴り始めるまでの秒数) で呼ばれる
+        self.on_started: Optional[Callable[[QueueItem, float], None]] = None
+
+        self._task = self._loop.create_task(self._run())
+
+    def enqueue(
+        self, audio: AudioInput, message_start: bool = True, request: Any = None, trace: Optional[Trace] = None
+    ) -> QueueItem:
+        """再生キューに追加
+
+        Awaitable はこの時点で実行を開始し、ファクトリは再生が近づいてから呼ぶ。
+        1つのメッセージを複数クリップに分けて積む場合は、2つ目以降を
+        ``message_start=False`` にすると最初の音までの時間を正しく集計できる。
+        """
+        item = QueueItem(time.perf_counter(), message_start, request, trace=trace)
+        if isinstance(audio, str):
+            item.future = asyncio.ensure_future(self._prepare_source(self._ready(audio), trace))
+            self._trace_prepare(item)
+        elif inspect.isawaitable(audio):
+            item.future = asyncio.ensure_future(self._prepare_source(audio, trace))
+            self._trace_prepare(item)
+        elif callable(audio):
+            item.factory = audio
+        else:
+            raise TypeError(f"Unsupported audio input: {audio!r}")
+
+        self._items.append(item)
+        self._start_ready()
+        self._has_items.set()
+        return item
+
+    def queued_items(self) -> List[QueueItem]:
+        """再生待ちの項目（先頭から順に）"""
+        return list(self._items)
+
+    def discard(self, item: QueueItem) -> None:
+        """再生待ちの項目を取り消す"""
+        try:
+            self._items.remove(item)
+        except ValueError:
+            return
+        self._release(item)
+        if item.trace is not None:
+            item.trace.finish("dropped")
+
+    @staticmethod
+    def _release(item: QueueItem) -> None:
+        """準備を取り消す（作成済みの AudioSource は後始末する）"""
+        future = item.future
+        if future is None:
+            return
+        if not future.done():
+            future.cancel()
+        elif not future.cancelled() and future.exception() is None and future.result() is not None:
+            future.result().cleanup()
+
+    def _start_ready(self) -> None:
+        """先頭から prepare_ahead 件以内の項目の準備を始める"""
+        for item in islice(self._items, self.prepare_ahead):
+            if item.future is None:
+                self._start(item)
+
+    def _start(self, item: QueueItem) -> None:
+        """ファクトリを呼んで準備を始める"""
+        if item.trace is not None:
+            item.trace.add_span("queued", item.enqueued_at)
+        item.future = asyncio.ensure_future(self._prepare_source(item.factory(), item.trace))
+        self._trace_prepare(item)
+
+    @staticmethod
+    async def _ready(audio_file: str) -> str:
+        return audio_file
+
+    async def _prepare_source(
+        self, audio: Awaitable[Optional[str]], trace: Optional[Trace]
+    ) -> Optional[discord.AudioSource]:
+        """音声ファイルを用意し、再生用の AudioSource を別スレッドで作る"""
+        audio_file = await audio
+        if not audio_file:
+            return None
+        started = time.perf_counter()
+        future = _SOURCE_EXECUTOR.submit(self._source_factory, audio_file)
+        try:
+            source = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # 作成中に取り消されたら、できあがった AudioSource を後始末する
+            future.add_done_callback(self._cleanup_created)
+            raise
+        if trace is not None:
+            trace.add_span("source_create", started)
+        return source
+
+    @staticmethod
+    def _cleanup_created(future: Future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            future.result().cleanup()
+
+    @staticmethod
+    def _trace_prepare(item: QueueItem) -> None:
+        """準備（合成など）の開始から完了までを区間として記録する"""
+        trace = item.trace
+        if trace is None:
+            return
+        started = time.perf_counter()
+        item.future.add_done_callback(lambda _: trace.add_span("prepare", started))
+
+    @property
+    def queue_depth(self) -> int:
+        """待機中 + 準備待ち・再生中の先頭のクリップ数"""
+        return len(self._items) + (1 if self._current is not None else 0)
+
+    def stats(self) -> Dict[str, Any]:
+        """キュー深度と待ち時間の統計"""
+        waits = sorted(self._wait_times)
+        delays = self._start_delays
+        first_audio = sorted(self._first_audio_times)
+        return {
+            "queue_depth": self.queue_depth,
+            "playing": self._playing,
+            "played": self.played_count,
+            "failed": self.failed_count,
+            "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+            "wait_p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+            "wait_max": waits[-1] if waits else 0.0,
+            "start_delay_avg": sum(delays) / len(delays) if delays else 0.0,
+            "first_audio_avg": sum(first_audio) / len(first_audio) if first_audio else 0.0,
+            "first_audio_p95": (
+                first_audio[min(len(first_audio) - 1, int(len(first_audio) * 0.95))] if first_audio else 0.0
+            ),
+        }
+
+    async def _run(self) -> None:
+        """キューを消費して順番に再生する"""
+        while True:
+            while not self._items:
+                self._has_items.clear()
+                await self._has_items.wait()
+
+            item = self._items.popleft()
+            self._current = item
+            try:
+                await self._play_item(item)
+            finally:
+                self._current = None
+
+    async def _play_item(self, item: QueueItem) -> None:
+        """先頭の1件の準備の完了を待って再生する"""
+        if item.future is None:
+            self._start(item)
+        # 先頭を再生している間に続きの準備を進める
+        self._start_ready()
+
+        trace = item.trace
+        try:
+            source = await item.future
+        except asyncio.CancelledError:
+            if trace is not None:
+                trace.finish("cancelled")
+            if self._closed:
+                raise
+            # 個別にキャンセルされたクリップは飛ばす
+            return
+        except Exception as e:
+            logger.error("音声準備エラー (guild=%s): %s", self.guild_id, e)
+            self.failed_count += 1
+            if trace is not None:
+                trace.finish("failed")
+            return
+
+        if source is None or not self.vc.is_connected():
+            if source is not None:
+                source.cleanup()
+            if trace is not None:
+                trace.finish("skipped")
+            return
+
+        ready_at = time.perf_counter()
+        try:
+            await self._play(source, trace)
+        except Exception as e:
+            source.cleanup()
+            logger.error("音声再生エラー (guild=%s): %s", self.guild_id, e)
+            self.failed_count += 1
+            if trace is not None:
+                trace.finish("failed")
+            return
+
+        wait = self._started_at - item.enqueued_at
+        self._wait_times.append(wait)
+        PLAYBACK_WAIT_SECONDS.labels(self.guild_id).observe(wait)
+        if item.message_start:
+            self._first_audio_times.append(wait)
+        if self.on_started is not None:
+            self.on_started(item, wait)
+        # 再生可能になってから実際に鳴り始めるまでの遅延
+        previous_end = self._last_finished_at or ready_at
+        start_delay = self._started_at - max(ready_at, previous_end)
+        self._start_delays.append(start_delay)
+        PLAYBACK_START_DELAY_SECONDS.observe(start_delay)
+        self._last_finished_at = time.perf_counter()
+        self.played_count += 1
+
+    async def _play(self, source: discord.AudioSource, trace: Optional[Trace] = None) -> None:
+        """準備済みの1クリップを再生し、after コールバックが呼ばれるまで待つ"""
+        self._finished.clear()
+        self._started_at = time.perf_counter()
+        if trace is not None:
+            # 準備が済んでから前のクリップの再生が終わるまで
+            prepared_at = max((end for name, _, end in trace.spans if name == "prepare"), default=self._started_at)
+            trace.add_span("playback_wait", min(prepared_at, self._started_at), self._started_at)
+            # 最初のフレームが読まれた時点でトレースを確定する
+            source = FirstFrameTracingSource(source, trace, self._started_at)
+        self._playing = True
+        try:
+            self.vc.play(source, after=self._on_finished)
+            await self._finished.wait()
+        finally:
+            self._playing = False
+
+    def _on_finished(self, error: Optional[Exception]) -> None:
+        """再生スレッドから呼ばれる after コールバック"""
+        if error:
+            logger.error("音声再生エラー (guild=%s): %s", self.guild_id, error)
+        self._loop.call_soon_threadsafe(self._finished.set)
+
+    def close(self) -> None:
+        """再生を止め、未再生のクリップを破棄する（このサーバーのメトリクスの系列も消す）"""
+        self._closed = True
+        self._task.cancel()
+        while self._items:
+            self._release(self._items.popleft())
+        if self.vc.is_playing():
+            self.vc.stop()
+        if self.guild_id is not None:
+            PLAYBACK_WAIT_SECONDS.remove(self.guild_id)
@@ -0,0 +1,74 @@
+"""
+設定変更の通知（Web UI のプロセスから Bot のプロセスへ、localhost の UDP で送る）
+"""
+import asyncio
+import json
+import logging
+import socket
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+FEED_HOST = "127.0.0.1"
+
+# 通知の種類（key はユーザーIDなど、変更された対象）
+VOICE_SETTINGS = "voice_settings"
+
+
+class SettingsFeedPublisher:
+    """設定の変更を1件1データグラムで送る
+
+    送信はノンブロッキングで、受け手がいなくても保存処理には影響しない。
+    Windows でも動くよう Unix ソケットではなく localhost の UDP を使う。
+    """
+
+    def __init__(self, port: int, host: str = FEED_HOST) -> None:
+        self._address = (host, port)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+
+    def publish(self, kind: str, key: str) -> None:
+        payload = json.dumps({"kind": kind, "key": str(key)}).encode("utf-8")
+        try:
+            self._sock.sendto(payload, self._address)
+        except OSError as e:
+            logger.warning("設定変更の送信エラー (%s): %s", kind, e)
+
+    def close(self) -> None:
+        self._sock.close()
+
+
+class SettingsFeedListener(asyncio.DatagramProtocol):
+    """受け取った変更を種類ごとのハンドラーに渡す（Bot のイベントループで動く）"""
+
+    def __init__(self) -> None:
+        self._handlers: Dict[str, List[Callable[[str], None]]] = {}
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self.received_count = 0
+
+    def subscribe(self, kind: str, handler: Callable[[str], None]) -> None:
+        self._handlers.setdefault(kind, []).append(handler)
+
+    async def start(self, port: int, host: str = FEED_HOST) -> None:
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        logger.info("Listening for settings changes on udp://%s:%s", host, port)
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        try:
+            message = json.loads(data)
+            kind, key = message["kind"], str(message["key"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning("不正な設定変更通知を無視しました: %r", data[:100])
+            return
+        self.received_count += 1
+        for handler in self._handlers.get(kind, ()):
+            try:
+                handler(key)
+            except Exception as e:
+                logger.warning("設定変更通知エラー (%s): %s", kind, e)
+
+    def close(self) -> None:
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
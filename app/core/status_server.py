@@ -0,0 +1,80 @@
+"""
+Bot のプロセス内の状態（メトリクス・トレース）を返す HTTP サーバー
+"""
+import asyncio
+import json
+import logging
+from typing import Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from .metrics import CONTENT_TYPE, REGISTRY
+from .tracing import TRACER
+
+logger = logging.getLogger(__name__)
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+def traces_response(limit: str, guild_id: Optional[str]) -> Tuple[int, str]:
+    """/api/traces の応答（ステータス, JSON）"""
+    try:
+        snapshot = TRACER.snapshot(int(limit), int(guild_id) if guild_id else None)
+    except ValueError:
+        return 400, json.dumps({"error": "Invalid query parameter"})
+    return 200, json.dumps(snapshot, ensure_ascii=False)
+
+
+class StatusServer:
+    """``GET /metrics`` と ``GET /api/traces`` だけに応答する最小限の HTTP サーバー
+
+    メトリクスやトレースは Bot のプロセスのメモリにあるため、Web UI を別プロセスで
+    動かすときは Bot のイベントループ上でこれを開く。応答は小さく、組み立ては
+    メモリ上の値を読むだけなので、Gateway の処理を止めることはない。
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081) -> None:
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info("Status endpoint listening on http://%s:%s (/metrics, /api/traces)", self.host, self.port)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # ヘッダーは使わないので読み捨てる
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            status, content_type, body = self._route(method, target)
+            payload = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n".encode("latin-1") + payload
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ValueError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _route(self, method: str, target: str) -> Tuple[int, str, str]:
+        url = urlsplit(target)
+        if method != "GET":
+            return 405, "text/plain", "Method Not Allowed"
+        if url.path == "/metrics":
+            return 200, CONTENT_TYPE, REGISTRY.render()
+        if url.path == "/api/traces":
+            query = parse_qs(url.query)
+            status, body = traces_response(query.get("limit", ["10"])[0], query.get("guild_id", [None])[0])
+            return status, "application/json", body
+        return 404, "text/plain", "Not Found"
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            self._server = None
@@ -0,0 +1,322 @@
+"""
+音声合成ワーカー（イベントループ外での合成とバックプレッシャー）
+"""
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, Optional, Set, Tuple
+
+from .metrics import SYNTHESIS_QUEUE_WAIT_SECONDS
+
+
+class OverflowPolicy(str, Enum):
+    """ジョブキューが満杯のときの振る舞い"""
+    REJECT = "reject"            # 新しいジョブを拒否する
+    DROP_OLDEST = "drop_oldest"  # 最も古い待機ジョブを破棄する
+    BLOCK = "block"              # 空きが出るまで待つ
+
+
+class SynthesisQueueFull(RuntimeError):
+    """REJECT ポリシーでキューが満杯だった"""
+
+
+class SynthesisJobDropped(RuntimeError):
+    """DROP_OLDEST ポリシーで待機中のジョブが破棄された"""
+
+
+@dataclass
+class _Job:
+    fn: Callable[..., Any]
+    args: Tuple[Any, ...]
+    future: asyncio.Future
+    guild_id: int
+    cost: int
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class SynthesisWorker:
+    """合成エンジン呼び出しを専用スレッドで実行するワーカー
+
+    A.I.VOICE の呼び出しはブロッキングなので、イベントループからは
+    ``submit`` でジョブを積み、返された Future を await するだけにする。
+    同時に実行するジョブ数（スレッド数）は ``concurrency`` で、
+    エンジンプールの台数に合わせる。
+
+    待機ジョブはサーバーごとのキューに分け、Deficit Round Robin で取り出す。
+    各サーバーは1巡ごとに ``quantum × 重み`` 文字分の合成枠を得るため、
+    大量に投稿するサーバーがあっても他のサーバーの待ち時間は巡回1回分で頭打ちになる。
+    """
+
+    def __init__(
+        self,
+        max_queue: int = 32,
+        policy: OverflowPolicy = OverflowPolicy.BLOCK,
+        max_queue_per_guild: int = 16,
+        quantum: int = 100,
+        short_job_cost: int = 0,
+        history_size: int = 100,
+        concurrency: int = 1,
+    ) -> None:
+        if max_queue < 1 or max_queue_per_guild < 1 or concurrency < 1:
+            raise ValueError("max_queue, max_queue_per_guild and concurrency must be at least 1")
+        self.max_queue = max_queue
+        self.max_queue_per_guild = max_queue_per_guild
+        self.policy = OverflowPolicy(policy)
+        self.quantum = quantum
+        # この文字数以下のジョブが先頭にあるサーバーを優先する（0 で無効）
+        self.short_job_cost = short_job_cost
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="tts-synthesis")
+        self._cond = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._running: Set[asyncio.Task] = set()
+
+        # サーバーごとの待機キューと DRR の状態
+        self._queues: Dict[int, Deque[_Job]] = {}
+        self._active: Deque[int] = deque()
+        self._deficits: Dict[int, float] = {}
+        self._weights: Dict[int, float] = {}
+        self._head_credited = False
+        self._pending = 0
+
+        # 統計情報
+        self.completed_count = 0
+        self.failed_count = 0
+        self.rejected_count = 0
+        self.dropped_count = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+        self._history_size = history_size
+        self._guild_waits: Dict[int, Deque[float]] = {}
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def set_concurrency(self, concurrency: int) -> None:
+        """同時実行数を変更する（エンジンプールの初期化が済んで台数が分かったときなど）
+
+        実行中のジョブはそのまま終わらせ、以降のジョブから新しい数で実行する。
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        delta = concurrency - self.concurrency
+        if delta == 0:
+            return
+        self.concurrency = concurrency
+        previous = self._executor
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="tts-synthesis")
+        previous.shutdown(wait=False)
+        if self._slots is None:
+            return
+        if delta > 0:
+            for _ in range(delta):
+                self._slots.release()
+        else:
+            asyncio.get_running_loop().create_task(self._retire_slots(self._slots, -delta))
+
+    @staticmethod
+    async def _retire_slots(slots: asyncio.Semaphore, count: int) -> None:
+        """減らした分の実行枠を、空いたものから順に確保したままにする"""
+        for _ in range(count):
+            await slots.acquire()
+
+    def set_weight(self, guild_id: int, weight: float) -> None:
+        """サーバーの重みを設定（1巡あたりの合成枠が weight 倍になる）"""
+        if weight <= 0:
+            raise ValueError("weight must be positive")
+        self._weights[guild_id] = weight
+
+    async def submit(self, fn: Callable[..., Any], *args: Any, guild_id: int = 0, cost: int = 1) -> asyncio.Future:
+        """ジョブをキューに積み、結果を受け取る Future を返す
+
+        ``cost`` はジョブの重さ（読み上げる文字数）で、公平性の計算に使う。
+        """
+        self._ensure_started()
+        async with self._cond:
+            while True:
+                guild_full = len(self._queues.get(guild_id, ())) >= self.max_queue_per_guild
+                if not guild_full and self._pending < self.max_queue:
+                    break
+                if self.policy is OverflowPolicy.REJECT:
+                    self.rejected_count += 1
+                    raise SynthesisQueueFull(
+                        f"Synthesis queue is full ({self._pending}/{self.max_queue} jobs, "
+                        f"guild {guild_id}: {len(self._queues.get(guild_id, ()))}/{self.max_queue_per_guild})"
+                    )
+                if self.policy is OverflowPolicy.DROP_OLDEST:
+                    # サーバーの上限なら自分の最古、全体の上限なら最も溜めているサーバーの最古を捨てる
+                    victim = guild_id if guild_full else max(self._queues, key=lambda gid: len(self._queues[gid]))
+                    self._drop_oldest(victim)
+                    continue
+                await self._cond.wait()
+
+            job = _Job(fn, args, asyncio.get_running_loop().create_future(), guild_id, max(1, cost))
+            queue = self._queues.get(guild_id)
+            if queue is None:
+                queue = self._queues[guild_id] = deque()
+                self._active.append(guild_id)
+                self._deficits.setdefault(guild_id, 0.0)
+            queue.append(job)
+            self._pending += 1
+            self._cond.notify_all()
+        return job.future
+
+    async def run(self, fn: Callable[..., Any], *args: Any, guild_id: int = 0, cost: int = 1) -> Any:
+        """ジョブを積んで完了まで待つ"""
+        return await (await self.submit(fn, *args, guild_id=guild_id, cost=cost))
+
+    def _drop_oldest(self, guild_id: int) -> None:
+        job = self._queues[guild_id][0]
+        self._pop_head(guild_id)
+        if not job.future.done():
+            job.future.set_exception(SynthesisJobDropped("Dropped by a newer synthesis job"))
+        self.dropped_count += 1
+
+    def _pop_head(self, guild_id: int) -> _Job:
+        """サーバーの先頭ジョブを取り出す（空になったら巡回から外す）"""
+        queue = self._queues[guild_id]
+        job = queue.popleft()
+        self._pending -= 1
+        if not queue:
+            del self._queues[guild_id]
+            if self._active and self._active[0] == guild_id:
+                self._head_credited = False
+            self._active.remove(guild_id)
+            # 待機ジョブが無い間に枠を貯め込めないようにする（前借りした分は残す）
+            self._deficits[guild_id] = min(self._deficits[guild_id], 0.0)
+        return job
+
+    def _next_job(self) -> _Job:
+        """次に実行するジョブを選ぶ（呼び出し時点で待機ジョブが1件以上あること）"""
+        if self.short_job_cost:
+            # 短いジョブは順番を飛ばして取り出すが、枠は前借りとして差し引く。
+            # 前借りは1巡分までなので、短い投稿を連投するサーバーがあっても
+            # 他のサーバーの待ち時間は巡回で決まる上限を超えない
+            for guild_id in self._active:
+                head = self._queues[guild_id][0]
+                allowance = self._deficits[guild_id] + self.quantum * self._weights.get(guild_id, 1.0)
+                if head.cost <= self.short_job_cost and head.cost <= allowance:
+                    self._deficits[guild_id] -= head.cost
+                    return self._pop_head(guild_id)
+
+        while True:
+            guild_id = self._active[0]
+            if not self._head_credited:
+                self._deficits[guild_id] += self.quantum * self._weights.get(guild_id, 1.0)
+                self._head_credited = True
+            head = self._queues[guild_id][0]
+            if head.cost <= self._deficits[guild_id]:
+                self._deficits[guild_id] -= head.cost
+                return self._pop_head(guild_id)
+            # 枠が足りなければ次のサーバーへ
+            self._active.rotate(-1)
+            self._head_credited = False
+
+    @property
+    def queue_depth(self) -> int:
+        """待機中 + 実行中のジョブ数"""
+        return self._pending + len(self._running)
+
+    def guild_queue_depths(self) -> Dict[int, int]:
+        """サーバーごとの待機ジョブ数"""
+        return {guild_id: len(queue) for guild_id, queue in self._queues.items()}
+
+    def guild_stats(self, guild_id: int) -> Dict[str, Any]:
+        """サーバーごとの待機数と待ち時間"""
+        waits = sorted(self._guild_waits.get(guild_id, ()))
+        return {
+            "queue_depth": len(self._queues.get(guild_id, ())),
+            "max_queue": self.max_queue_per_guild,
+            "wait_avg": sum(waits) / len(waits) if waits else 0.0,
+            "wait_p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+            "wait_max": waits[-1] if waits else 0.0,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """キューと処理時間の統計"""
+        finished = self.completed_count + self.failed_count
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "policy": self.policy.value,
+            "busy": bool(self._running),
+            "running": len(self._running),
+            "concurrency": self.concurrency,
+            "completed": self.completed_count,
+            "failed": self.failed_count,
+            "rejected": self.rejected_count,
+            "dropped": self.dropped_count,
+            "wait_avg": self._total_wait / finished if finished else 0.0,
+            "run_avg": self._total_run / finished if finished else 0.0,
+            "guilds": {guild_id: self.guild_stats(guild_id) for guild_id in self._guild_waits},
+        }
+
+    async def _run(self) -> None:
+        """実行枠が空くたびにジョブを取り出して専用スレッドで実行する"""
+        loop = asyncio.get_running_loop()
+        slots = self._slots = asyncio.Semaphore(self.concurrency)
+        while True:
+            # 枠が空いてから次のジョブを選ぶ（選ぶ時点の待機状況で公平性を判断する）
+            await slots.acquire()
+            async with self._cond:
+                while not self._pending:
+                    await self._cond.wait()
+                job = self._next_job()
+                self._cond.notify_all()
+
+            # 待っている側がいなくなったジョブは実行しない
+            if job.future.done():
+                slots.release()
+                continue
+
+            task = loop.create_task(self._execute(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _execute(self, job: _Job) -> None:
+        """1件のジョブをスレッドで実行して結果を Future に渡す"""
+        loop = asyncio.get_running_loop()
+        started_at = time.perf_counter()
+        wait = started_at - job.enqueued_at
+        self._total_wait += wait
+        waits = self._guild_waits.get(job.guild_id)
+        if waits is None:
+            waits = self._guild_waits[job.guild_id] = deque(maxlen=self._history_size)
+        waits.append(wait)
+        SYNTHESIS_QUEUE_WAIT_SECONDS.labels(job.guild_id).observe(wait)
+
+        try:
+            result = await loop.run_in_executor(self._executor, job.fn, *job.args)
+        except Exception as e:
+            self.failed_count += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.completed_count += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._total_run += time.perf_counter() - started_at
+            # ワーカー停止で中断された場合は待っている側もキャンセルする
+            if not job.future.done():
+                job.future.cancel()
+
+    def close(self) -> None:
+        """ワーカーを停止し、待機中のジョブをキャンセルする"""
+        if self._task is not None:
+            self._task.cancel()
+        for task in self._running:
+            task.cancel()
+        for queue in self._queues.values():
+            for job in queue:
+                job.future.cancel()
+        self._queues.clear()
+        self._active.clear()
+        self._pending = 0
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,122 @@
+"""
+読み上げテキストの前処理
+"""
+import re
+from typing import Dict, List, Mapping, Optional
+
+from ..utils.aho_corasick import AhoCorasick
+
+# 文の区切り（日本語・英語の終止符と改行）
+SENTENCE_DELIMITERS = "。！？!?\n"
+_SENTENCE_PATTERN = re.compile(f"[^{SENTENCE_DELIMITERS}]+[{SENTENCE_DELIMITERS}]*|[{SENTENCE_DELIMITERS}]+")
+
+
+def split_sentences(text: str) -> List[str]:
+    """テキストを文単位に分割する（区切り文字は直前の文に含める）
+
+    区切り文字だけの断片や空白だけの断片は独立させず、直前の文に付けるか捨てる。
+    """
+    chunks: List[str] = []
+    for match in _SENTENCE_PATTERN.finditer(text):
+        chunk = match.group().strip()
+        if not chunk:
+            continue
+        if not chunk.strip(SENTENCE_DELIMITERS):
+            if chunks:
+                chunks[-1] += chunk
+            continue
+        chunks.append(chunk)
+    return chunks
+
+
+def truncate_text(text: str, max_length: int, suffix: str = "") -> str:
+    """max_length 文字以内に切り詰めて suffix を付ける（0 なら何もしない）
+
+    上限の後半に文の区切りがあればそこで切る。無ければ上限で切るが、
+    置き換えたトークン（``[URL省略]`` など）の途中では切らずにその手前で切る。
+    """
+    if not max_length or len(text) <= max_length:
+        return text
+    head = text[:max_length]
+    sentence_end = max(head.rfind(delimiter) for delimiter in SENTENCE_DELIMITERS) + 1
+    if sentence_end > max_length // 2:
+        cut = sentence_end
+    else:
+        cut = max_length
+        bracket = head.rfind("[")
+        if bracket > head.rfind("]") and "]" in text[max_length:]:
+            cut = bracket
+    return text[:cut].rstrip().rstrip(SENTENCE_DELIMITERS).rstrip() + suffix
+
+
+# 読み上げ用に置き換えるトークン（1回の走査ですべて処理する）
+_TOKEN_PATTERN = re.compile(
+    r"(?P<code_block>```.*?```)"
+    r"|<@!?(?P<user>\d+)>"
+    r"|<@&(?P<role>\d+)>"
+    r"|<#(?P<channel>\d+)>"
+    r"|<a?:(?P<emoji>[^:\s]+):\d+>"
+    r"|(?P<url>https?://\S+)",
+    re.DOTALL,
+)
+
+
+class MessagePreprocessor:
+    """メッセージ本文を読み上げ用テキストに変換する
+
+    メンション・ロール・チャンネル・カスタム絵文字・URL・コードブロックは
+    コンパイル済みの1つのパターンで一度に置き換え、続けてサーバーごとの
+    読み上げ辞書（Aho–Corasick）を適用し、最後に長さを制限する（``max_length`` が 0 なら無制限）。
+    """
+
+    def __init__(self, max_length: int = 0, truncate_suffix: str = "、以下略") -> None:
+        self.max_length = max_length
+        self.truncate_suffix = truncate_suffix
+        self._dictionaries: Dict[int, AhoCorasick] = {}
+
+    def set_dictionary(self, guild_id: int, entries: Mapping[str, str]) -> None:
+        """サーバーの読み上げ辞書を設定（オートマトンはここで一度だけ構築する）"""
+        if entries:
+            self._dictionaries[guild_id] = AhoCorasick(entries)
+        else:
+            self._dictionaries.pop(guild_id, None)
+
+    def has_dictionary(self, guild_id: int) -> bool:
+        return guild_id in self._dictionaries
+
+    def process(
+        self,
+        text: str,
+        guild_id: Optional[int] = None,
+        users: Optional[Mapping[int, str]] = None,
+        roles: Optional[Mapping[int, str]] = None,
+        channels: Optional[Mapping[int, str]] = None,
+    ) -> str:
+        """本文を読み上げ用に変換"""
+        users = users or {}
+        roles = roles or {}
+        channels = channels or {}
+
+        def replace_token(match: "re.Match[str]") -> str:
+            kind = match.lastgroup
+            if kind == "user":
+                return users.get(int(match.group("user")), "ユーザー")
+            if kind == "role":
+                return roles.get(int(match.group("role")), "ロール")
+            if kind == "channel":
+                return channels.get(int(match.group("channel")), "チャンネル")
+            if kind == "emoji":
+                return f"[{match.group('emoji')}]"
+            if kind == "url":
+                return "[URL省略]"
+            return "[コード省略]"
+
+        # トークンが含まれ得ないメッセージは正規表現を走らせない
+        if "<" in text or "://" in text or "```" in text:
+            text = _TOKEN_PATTERN.sub(replace_token, text)
+
+        dictionary = self._dictionaries.get(guild_id)
+        if dictionary is not None:
+            text = dictionary.replace(text)
+
+        return truncate_text(text, self.max_length, self.truncate_suffix)
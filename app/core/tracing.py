@@ -0,0 +1,170 @@
+"""
+メッセージ単位の遅延トレース（受信から最初の音声フレームまで）
+"""
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import discord
+
+from .environment import ENV
+
+
+class Trace:
+    """1メッセージ分の区間（名前, 開始, 終了）の記録
+
+    区間は合成スレッドや再生スレッドからも追加されるが、list.append だけなので
+    ロックは取らない。時刻はすべて ``time.perf_counter()``。
+    """
+
+    def __init__(self, tracer: "Tracer", trace_id: int, guild_id: int, user_id: str, text_length: int) -> None:
+        self._tracer = tracer
+        self.trace_id = trace_id
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.text_length = text_length
+        self.received_at = time.time()
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float, float]] = []
+        self.marks: Dict[str, float] = {}
+        self.outcome: Optional[str] = None
+        self.duration = 0.0
+
+    def add_span(self, name: str, start: float, end: Optional[float] = None) -> None:
+        self.spans.append((name, start, time.perf_counter() if end is None else end))
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start)
+
+    def mark(self, name: str) -> None:
+        """後で区間の開始に使う時刻を記録"""
+        self.marks[name] = time.perf_counter()
+
+    def finish(self, outcome: str = "played") -> None:
+        """最初の音が鳴った（または鳴らないことが確定した）時点で記録を確定する"""
+        if self.outcome is not None:
+            return
+        self.outcome = outcome
+        self.duration = time.perf_counter() - self.started
+        self._tracer._record(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.trace_id,
+            "guild_id": str(self.guild_id),
+            "user_id": self.user_id,
+            "text_length": self.text_length,
+            "received_at": self.received_at,
+            "outcome": self.outcome,
+            "total_ms": self.duration * 1000,
+            "spans": [
+                {
+                    "name": name,
+                    "start_ms": (start - self.started) * 1000,
+                    "duration_ms": (end - start) * 1000,
+                }
+                for name, start, end in sorted(self.spans, key=lambda span: span[1])
+            ],
+        }
+
+
+class Tracer:
+    """トレースのリングバッファ
+
+    無効のときは ``start`` が None を返すだけなので、呼び出し側の負担は
+    None チェック1回で済む。
+    """
+
+    def __init__(self, enabled: bool = False, capacity: int = 500) -> None:
+        self.enabled = enabled
+        self._traces: Deque[Trace] = deque(maxlen=capacity)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self, guild_id: int, user_id: str, text_length: int = 0) -> Optional[Trace]:
+        if not self.enabled:
+            return None
+        return Trace(self, next(self._ids), guild_id, user_id, text_length)
+
+    def _record(self, trace: Trace) -> None:
+        with self._lock:
+            self._traces.append(trace)
+
+    def recent(self, guild_id: Optional[int] = None) -> List[Trace]:
+        with self._lock:
+            traces = list(self._traces)
+        if guild_id is not None:
+            traces = [trace for trace in traces if trace.guild_id == guild_id]
+        return traces
+
+    def slowest(self, limit: int = 10, guild_id: Optional[int] = None) -> List[Trace]:
+        """最初の音までが遅かった順"""
+        traces = [trace for trace in self.recent(guild_id) if trace.outcome == "played"]
+        return sorted(traces, key=lambda trace: trace.duration, reverse=True)[:limit]
+
+    def breakdown(self, guild_id: Optional[int] = None) -> Dict[str, Dict[str, float]]:
+        """区間ごとの件数・平均・p95・最大（ミリ秒）"""
+        durations: Dict[str, List[float]] = {}
+        for trace in self.recent(guild_id):
+            for name, start, end in trace.spans:
+                durations.setdefault(name, []).append((end - start) * 1000)
+        result = {}
+        for name, values in durations.items():
+            values.sort()
+            result[name] = {
+                "count": len(values),
+                "avg_ms": sum(values) / len(values),
+                "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))],
+                "max_ms": values[-1],
+            }
+        return result
+
+    def snapshot(self, limit: int = 10, guild_id: Optional[int] = None) -> Dict[str, Any]:
+        """Web・コマンド向けの要約"""
+        return {
+            "enabled": self.enabled,
+            "traces": len(self.recent(guild_id)),
+            "breakdown": self.breakdown(guild_id),
+            "slowest": [trace.to_dict() for trace in self.slowest(limit, guild_id)],
+        }
+
+
+class FirstFrameTracingSource(discord.AudioSource):
+    """最初のフレームを読んだ時点でトレースを確定する AudioSource のラッパー
+
+    トレース中のクリップにだけ使う。ffmpeg の起動待ちなどは最初の ``read`` に現れる。
+    """
+
+    def __init__(self, source: discord.AudioSource, trace: Trace, play_called_at: float) -> None:
+        self._source = source
+        self._trace = trace
+        self._play_called_at = play_called_at
+        self._first = True
+
+    def read(self) -> bytes:
+        data = self._source.read()
+        if self._first:
+            self._first = False
+            self._trace.add_span("first_frame", self._play_called_at)
+            self._trace.finish("played" if data else "empty")
+        return data
+
+    def is_opus(self) -> bool:
+        return self._source.is_opus()
+
+    def cleanup(self) -> None:
+        self._source.cleanup()
+
+
+TRACER = Tracer(
+    enabled=ENV.get("TTS_TRACING", "false").lower() in ("1", "true", "yes", "on"),
+    capacity=int(ENV.get("TTS_TRACE_BUFFER", "500")),
+)
@@ -0,0 +1,387 @@
+"""
+音声合成エンジン（バックエンド）の共通インターフェースと実装
+"""
+import io
+import logging
+import os
+import time
+import uuid
+import wave
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from .environment import ENV
+from .metrics import ENGINE_RECONNECTS
+from .voice_catalog import VoiceCatalog
+
+logger = logging.getLogger(__name__)
+
+
+class TTSEngine:
+    """TTSManager のプールが扱う合成エンジン1台分
+
+    バックエンドは音声一覧（``voices``）、プリセット適用（``apply_voice_preset``）、
+    WAV のバイト列への合成（``synthesize``）、状態確認（``health``）を実装する。
+
+    同時に呼び出されるのは1ジョブだけ（プールが貸し出しを管理する）なので、
+    実装側でロックを取る必要はない。エンジンごとに適用中のプリセットを覚えておき、
+    同じプリセットの再適用を省く。
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        # エンジンに現在適用されているプリセットの指紋（不明な場合は None）
+        self.applied_fingerprint: Optional[str] = None
+        self.preset_apply_count = 0
+        self.preset_skip_count = 0
+        self.job_count = 0
+
+    def voices(self) -> Dict[str, str]:
+        """表示名 → エンジン上の音声名"""
+        raise NotImplementedError
+
+    def apply_voice_preset(self, voice_preset: Dict[str, Any], fallback_voice: str = None, fingerprint: str = None) -> bool:
+        """VoicePresetを適用"""
+        raise NotImplementedError
+
+    def synthesize(self, text: str) -> bytes:
+        """適用中のプリセットで合成し、WAV のバイト列を返す"""
+        raise NotImplementedError
+
+    def health(self) -> Dict[str, Any]:
+        """状態（少なくとも ``connected`` を含む）"""
+        raise NotImplementedError
+
+    def reconnect(self) -> bool:
+        """接続を再試行"""
+        return self.is_connected()
+
+    @property
+    def voice_names(self) -> Dict[str, str]:
+        return self.voices()
+
+    def generate_audio(self, text: str, output_file: str) -> bool:
+        """音声を生成してファイルに保存
+
+        同じディレクトリの一意な一時ファイルに書き出してから ``os.replace`` で
+        置き換えるため、同時に合成しても互いの出力を上書きしない。
+        """
+        directory, file_name = os.path.split(output_file)
+        temp_file = os.path.join(directory, f".{uuid.uuid4().hex}.{file_name}")
+        try:
+            with open(temp_file, "wb") as f:
+                f.write(self.synthesize(text))
+            os.replace(temp_file, output_file)
+            return True
+        except Exception as e:
+            logger.error("Audio generation error (%s): %s", self.name, e)
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            return False
+
+    def is_connected(self) -> bool:
+        """接続状態をチェック"""
+        try:
+            return bool(self.health().get("connected"))
+        except Exception:
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        """エンジンごとの統計"""
+        return {
+            "name": self.name,
+            "jobs": self.job_count,
+            "preset_applied": self.preset_apply_count,
+            "preset_skipped": self.preset_skip_count,
+        }
+
+
+class AIVoiceEngine(TTSEngine):
+    """A.I.VOICE Editor のホスト1つを操作するエンジン
+
+    ``aivoice_python`` は Windows 専用なので、このクラスを使うときに初めて import する。
+    """
+
+    def __init__(
+        self, host_name: str, temp_preset_name: str = "WebUI_TempPreset", known_voices: Optional[Dict[str, str]] = None
+    ) -> None:
+        from aivoice_python import AIVoiceTTsControl, HostStatus
+
+        super().__init__(host_name)
+        self._host_status = HostStatus
+        self.temp_preset_name = temp_preset_name
+        self._voice_names: Dict[str, str] = {}
+        self._current_preset_name: Optional[str] = None
+        self._has_connected = False
+        self.tts_control = AIVoiceTTsControl()
+        self.tts_control.initialize(host_name)
+
+        logger.info("Connecting to TTS host (%s)", host_name)
+        # 接続は以降も維持して使い回す
+        self._ensure_connected()
+        logger.info("TTS connection successful (%s)", host_name)
+
+        # 音声名マッピングを作成（前回の一覧と音声名が一致すれば使い回す）
+        self._build_voice_mapping(known_voices)
+
+        # 共用プリセットを作成
+        self._create_temp_preset()
+
+    @staticmethod
+    def available_host_names() -> List[str]:
+        """利用できるホスト名の一覧"""
+        from aivoice_python import AIVoiceTTsControl
+
+        return AIVoiceTTsControl().get_available_host_names()
+
+    def _ensure_connected(self) -> None:
+        """ホストとの接続を維持する（未起動・切断時のみ起動・接続する）
+
+        ``connect()`` を with で使うと抜けるたびに切断されるため、接続は開いたままにする。
+        ホストは10分間操作がないと接続を切るので、呼び出しのたびに状態を確認する。
+        """
+        status = self.tts_control.status
+        if status == self._host_status.NotRunning:
+            self.tts_control.start_host()
+            status = self._host_status.NotConnected
+        if status == self._host_status.NotConnected:
+            self.tts_control.connect()
+            if self._has_connected:
+                ENGINE_RECONNECTS.labels(self.name).inc()
+            self._has_connected = True
+            # 接続し直した後はホスト側のプリセット状態を信用しない
+            self.applied_fingerprint = None
+            self._current_preset_name = None
+
+    def _build_voice_mapping(self, known_voices: Optional[Dict[str, str]] = None) -> None:
+        """音声名のマッピングを構築
+
+        音声ごとにプリセットを問い合わせるため、``known_voices`` の音声名が
+        ホストの一覧と一致する場合はそれをそのまま使う。
+        """
+        self._ensure_connected()
+        voice_names = list(self.tts_control.voice_names)
+        if known_voices and list(known_voices) == voice_names:
+            self._voice_names = dict(known_voices)
+            return
+        self._voice_names = {}
+        for voice_name in voice_names:
+            preset = self.tts_control.get_voice_preset(voice_name)
+            self._voice_names[voice_name] = preset["VoiceName"]
+        logger.info("Built voice mapping (%s): %d voices", self.name, len(self._voice_names))
+
+    def _create_temp_preset(self) -> None:
+        """一時プリセットを作成"""
+        self._ensure_connected()
+        if self.temp_preset_name not in self.tts_control.voice_preset_names:
+            default_voice = list(self._voice_names.keys())[0] if self._voice_names else None
+            if default_voice:
+                self.tts_control.add_voice_preset({
+                    "PresetName": self.temp_preset_name,
+                    "VoiceName": self._voice_names[default_voice],
+                    "Volume": 1.0,
+                    "Speed": 1.0,
+                    "Pitch": 1.0,
+                    "PitchRange": 1.0,
+                    "MiddlePause": 150,
+                    "LongPause": 300,
+                    "Styles": [
+                        {"Name": "J", "Value": 0.0},
+                        {"Name": "A", "Value": 0.0},
+                        {"Name": "S", "Value": 0.0}
+                    ]
+                })
+
+    def voices(self) -> Dict[str, str]:
+        return self._voice_names
+
+    def apply_voice_preset(self, voice_preset: Dict[str, Any], fallback_voice: str = None, fingerprint: str = None) -> bool:
+        """VoicePresetを適用（直前に適用したものと同じなら何もしない）"""
+        try:
+            self._ensure_connected()
+            if fingerprint is not None and fingerprint == self.applied_fingerprint:
+                self.preset_skip_count += 1
+                return True
+
+            self.tts_control.set_voice_preset(voice_preset)
+            if self._current_preset_name != self.temp_preset_name:
+                self.tts_control.current_voice_preset_name = self.temp_preset_name
+                self._current_preset_name = self.temp_preset_name
+            self.applied_fingerprint = fingerprint
+            self.preset_apply_count += 1
+            return True
+        except Exception as e:
+            logger.warning("Error setting voice preset (%s): %s", self.name, e)
+            self.applied_fingerprint = None
+            self._current_preset_name = None
+            if fallback_voice:
+                try:
+                    self.tts_control.current_voice_preset_name = fallback_voice
+                    self._current_preset_name = fallback_voice
+                    return True
+                except Exception as fallback_error:
+                    logger.error("Fallback error (%s): %s", self.name, fallback_error)
+            return False
+
+    def synthesize(self, text: str) -> bytes:
+        # A.I.VOICE はファイルへの保存しかできないので、一時ファイルを経由する
+        temp_file = os.path.join(os.path.abspath("data/audio"), f".{uuid.uuid4().hex}.wav")
+        os.makedirs(os.path.dirname(temp_file), exist_ok=True)
+        try:
+            self._ensure_connected()
+            self.tts_control.text = text
+            self.tts_control.save_audio_to_file(temp_file)
+            with open(temp_file, "rb") as f:
+                return f.read()
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+    def generate_audio(self, text: str, output_file: str) -> bool:
+        """音声を生成してファイルに保存（バイト列を経由せずホストに直接書かせる）"""
+        directory, file_name = os.path.split(output_file)
+        temp_file = os.path.join(directory, f".{uuid.uuid4().hex}.{file_name}")
+        try:
+            self._ensure_connected()
+            self.tts_control.text = text
+            self.tts_control.save_audio_to_file(temp_file)
+            os.replace(temp_file, output_file)
+            return True
+        except Exception as e:
+            logger.error("Audio generation error (%s): %s", self.name, e)
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            return False
+
+    def health(self) -> Dict[str, Any]:
+        status = self.tts_control.status
+        return {
+            "name": self.name,
+            "backend": "aivoice",
+            "status": getattr(status, "name", str(status)),
+            "connected": status in (self._host_status.Idle, self._host_status.Busy),
+        }
+
+    def reconnect(self) -> bool:
+        """TTS接続を再試行"""
+        try:
+            self._ensure_connected()
+            return True
+        except Exception as e:
+            logger.error("TTS reconnection failed (%s): %s", self.name, e)
+            return False
+
+
+class FakeEngine(TTSEngine):
+    """A.I.VOICE なしで動く疑似エンジン（負荷試験・動作確認用）
+
+    テキストの長さに比例した長さ（プリセットの Speed で短くなる）のトーンを
+    16bit モノラル PCM の WAV で返す。音の高さはテキストとプリセットから決まるため、
+    同じ入力には常に同じバイト列を返す。プリセット適用と合成には指定した時間だけ待つ。
+    """
+
+    SAMPLE_RATE = 44100
+
+    def __init__(
+        self,
+        name: str = "fake",
+        voice_names: Optional[List[str]] = None,
+        apply_latency: float = 0.02,
+        latency: float = 0.1,
+        latency_per_char: float = 0.005,
+        chars_per_second: float = 7.0,
+    ) -> None:
+        super().__init__(name)
+        self._voice_names = {voice: voice for voice in (voice_names or ["fake_voice_1", "fake_voice_2"])}
+        self.apply_latency = apply_latency
+        self.latency = latency
+        self.latency_per_char = latency_per_char
+        self.chars_per_second = chars_per_second
+        self._speed = 1.0
+
+    def voices(self) -> Dict[str, str]:
+        return self._voice_names
+
+    def apply_voice_preset(self, voice_preset: Dict[str, Any], fallback_voice: str = None, fingerprint: str = None) -> bool:
+        if fingerprint is not None and fingerprint == self.applied_fingerprint:
+            self.preset_skip_count += 1
+            return True
+        time.sleep(self.apply_latency)
+        self._speed = max(0.1, float(voice_preset.get("Speed", 1.0)))
+        self.applied_fingerprint = fingerprint
+        self.preset_apply_count += 1
+        return True
+
+    def synthesize(self, text: str) -> bytes:
+        time.sleep(self.latency + self.latency_per_char * len(text))
+        samples = max(1, int(len(text) / (self.chars_per_second * self._speed) * self.SAMPLE_RATE))
+        seed = zlib.crc32(f"{self.applied_fingerprint}:{text}".encode("utf-8"))
+        frequency = 220 + seed % 440
+        tone = 8000 * np.sin(2 * np.pi * frequency * np.arange(samples) / self.SAMPLE_RATE)
+
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(self.SAMPLE_RATE)
+            w.writeframes(tone.astype("<i2").tobytes())
+        return buffer.getvalue()
+
+    def health(self) -> Dict[str, Any]:
+        return {"name": self.name, "backend": "fake", "status": "Idle", "connected": True}
+
+
+def _create_aivoice_engines(temp_preset_name: str, catalog: Optional[VoiceCatalog] = None) -> List[TTSEngine]:
+    host_names = AIVoiceEngine.available_host_names()
+    if not host_names:
+        raise RuntimeError("No available host names found. Please check your AIVoiceTTsControl configuration.")
+
+    # 使うホスト（カンマ区切り、all で全部。未指定なら先頭のみ）
+    configured = ENV.get("TTS_AIVOICE_HOSTS", "")
+    if configured == "all":
+        selected = host_names
+    elif configured:
+        selected = [name.strip() for name in configured.split(",") if name.strip() in host_names]
+    else:
+        selected = host_names[:1]
+    if not selected:
+        raise RuntimeError(f"None of TTS_AIVOICE_HOSTS are available: {host_names}")
+
+    return [
+        AIVoiceEngine(name, temp_preset_name, catalog.voices_for(name) if catalog else None)
+        for name in selected
+    ]
+
+
+def _create_fake_engines(temp_preset_name: str, catalog: Optional[VoiceCatalog] = None) -> List[TTSEngine]:
+    count = int(ENV.get("TTS_ENGINE_COUNT", "1"))
+    voice_names = [name.strip() for name in ENV.get("TTS_FAKE_VOICES", "").split(",") if name.strip()]
+    return [
+        FakeEngine(
+            f"fake-{index}",
+            voice_names=voice_names or None,
+            apply_latency=float(ENV.get("TTS_FAKE_APPLY_LATENCY_MS", "20")) / 1000,
+            latency=float(ENV.get("TTS_FAKE_LATENCY_MS", "100")) / 1000,
+            latency_per_char=float(ENV.get("TTS_FAKE_LATENCY_PER_CHAR_MS", "5")) / 1000,
+        )
+        for index in range(count)
+    ]
+
+
+# TTS_BACKEND の値 → エンジンを作る関数
+ENGINE_BACKENDS: Dict[str, Callable[[str, Optional[VoiceCatalog]], List[TTSEngine]]] = {
+    "aivoice": _create_aivoice_engines,
+    "fake": _create_fake_engines,
+}
+
+
+def create_engines(
+    backend: str, temp_preset_name: str = "WebUI_TempPreset", catalog: Optional[VoiceCatalog] = None
+) -> List[TTSEngine]:
+    """設定されたバックエンドのエンジンを作成（catalog は前回保存した音声一覧）"""
+    factory = ENGINE_BACKENDS.get(backend)
+    if factory is None:
+        raise ValueError(f"Unknown TTS backend: {backend} (available: {', '.join(ENGINE_BACKENDS)})")
+    return factory(temp_preset_name, catalog)
@@ -1,82 +1,139 @@
 """
-A.I.VOICE TTS Manager
+TTS Manager
 """
-from aivoice_python import AIVoiceTTsControl, HostStatus
-from typing import Dict, Any
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional
+
+from .environment import ENV
+from .metrics import PRESET_APPLY_SECONDS, SYNTHESIS_SECONDS
+from .tracing import Trace
+from .tts_engine import TTSEngine, create_engines
+from .voice_catalog import VoiceCatalog
+
+logger = logging.getLogger(__name__)
 
 
 class TTSManager:
-    """A.I.VOICE TTS制御のマネージャークラス"""
-    
-    def __init__(self):
-        self.tts_control = None
+    """TTS制御のマネージャークラス（合成エンジンのプール）
+
+    A.I.VOICE のホストなど、バックエンドごとに1台のエンジンを持ち、合成ジョブは
+    空いているエンジンに振り分ける。空きが複数あれば、そのジョブのプリセットを
+    適用済みのものを優先し、なければこれまでのジョブ数が最も少ないものを選ぶ。
+
+    エンジンの起動・接続は時間がかかるため、作成時には行わない。``start`` で
+    バックグラウンドのスレッドが初期化し、それまでは前回保存した音声一覧
+    （``TTS_VOICE_CATALOG``）を ``voice_names`` として返す。合成は初期化の完了を待つ。
+    初期化に失敗した場合は、待ち時間（失敗のたびに倍）が過ぎた後の ``start`` でやり直す。
+    """
+
+    def __init__(self, engines: Optional[List[TTSEngine]] = None, catalog_path: Optional[str] = None):
+        self.engines: List[TTSEngine] = []
         self.voice_names: Dict[str, str] = {}
         self.temp_preset_name = "WebUI_TempPreset"
-        self._initialize_tts()
-    
-    def _initialize_tts(self) -> None:
-        """TTS制御の初期化"""
+        self.backend = ENV.get("TTS_BACKEND", "aivoice")
+        self.catalog = VoiceCatalog(catalog_path or ENV.get("TTS_VOICE_CATALOG", "data/voice_catalog.json"))
+        self._busy: set = set()
+        self._cond = threading.Condition()
+        self._ready = threading.Event()
+        self._start_lock = threading.Lock()
+        self._started: Optional[Future] = None
+        # 初期化に失敗したときの再試行の待ち時間（秒）
+        self.retry_backoff = float(ENV.get("TTS_INIT_RETRY_SECONDS", "5"))
+        self.retry_backoff_max = float(ENV.get("TTS_INIT_RETRY_MAX_SECONDS", "300"))
+        self._failures = 0
+        self._retry_at = 0.0
+        if engines:
+            self._set_engines(engines)
+            self._started = Future()
+            self._started.set_result(None)
+            self._ready.set()
+        else:
+            self.catalog.load(self.backend)
+            self.voice_names = dict(self.catalog.voice_names)
+
+    def start(self) -> Future:
+        """エンジンの初期化をバックグラウンドで始める（初期化中・成功後は同じ Future を返す）
+
+        失敗していれば、再試行の待ち時間が過ぎるまでは失敗した Future を返し、過ぎていればやり直す。
+        """
+        with self._start_lock:
+            if self._started is not None and self._started.done() and self._started.exception() is not None:
+                if time.monotonic() >= self._retry_at:
+                    self._started = None
+            if self._started is None:
+                self._started = Future()
+                self._ready.clear()
+                threading.Thread(
+                    target=self._initialize_tts, args=(self._started,), name="tts-init", daemon=True
+                ).start()
+            return self._started
+
+    @property
+    def ready(self) -> bool:
+        """エンジンが使える状態か"""
+        return self._ready.is_set() and bool(self.engines)
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """初期化の完了を待つ（未開始なら開始する）。使えるエンジンがあれば True"""
+        self.start()
+        self._ready.wait(timeout)
+        return self.ready
+
+    def _initialize_tts(self, future: Future) -> None:
+        """TTS制御の初期化（start から専用スレッドで呼ばれる）
+
+        失敗しても ``_ready`` は立てて、待っている合成をエンジンなしのまま返す。
+        """
+        started = time.perf_counter()
         try:
-            self.tts_control = AIVoiceTTsControl()
-            host_names = self.tts_control.get_available_host_names()
-            
-            if not host_names:
-                raise RuntimeError("No available host names found. Please check your AIVoiceTTsControl configuration.")
-            
-            self.tts_control.initialize(host_names[0])
-            
-            if self.tts_control.status == HostStatus.NotRunning:
-                self.tts_control.start_host()
-            
-            print('Connecting to TTS host...')
-            # 初期接続テスト
-            with self.tts_control.connect():
-                print('TTS connection successful!')
-            
-            # 音声名マッピングを作成
-            self._build_voice_mapping()
-            
-            # 共用プリセットを作成
-            self._create_temp_preset()
-            
+            self._set_engines(create_engines(self.backend, self.temp_preset_name, self.catalog))
+            if self.catalog.update(self.backend, {engine.name: dict(engine.voices()) for engine in self.engines}):
+                self.catalog.save()
         except Exception as e:
-            print(f"TTS初期化エラー: {e}")
-            raise
-    
-    def _build_voice_mapping(self) -> None:
-        """音声名のマッピングを構築"""
-        with self.tts_control.connect():
-            self.voice_names = {}
-            for voice_name in self.tts_control.voice_names:
-                preset = self.tts_control.get_voice_preset(voice_name)
-                self.voice_names[voice_name] = preset["VoiceName"]
-    
-    def _create_temp_preset(self) -> None:
-        """一時プリセットを作成"""
-        with self.tts_control.connect():
-            if self.temp_preset_name not in self.tts_control.voice_preset_names:
-                default_voice = list(self.voice_names.keys())[0] if self.voice_names else None
-                if default_voice:
-                    self.tts_control.add_voice_preset({
-                        "PresetName": self.temp_preset_name,
-                        "VoiceName": self.voice_names[default_voice],
-                        "Volume": 1.0,
-                        "Speed": 1.0,
-                        "Pitch": 1.0,
-                        "PitchRange": 1.0,
-                        "MiddlePause": 150,
-                        "LongPause": 300,
-                        "Styles": [
-                            {"Name": "J", "Value": 0.0},
-                            {"Name": "A", "Value": 0.0},
-                            {"Name": "S", "Value": 0.0}
-                        ]
-                    })
-    
+            with self._start_lock:
+                delay = min(self.retry_backoff * (2 ** self._failures), self.retry_backoff_max)
+                self._failures += 1
+                self._retry_at = time.monotonic() + delay
+            logger.error("TTS初期化エラー（%.0f秒後以降に再試行します）: %s", delay, e)
+            self._ready.set()
+            future.set_exception(e)
+        else:
+            self._failures = 0
+            logger.info(
+                "TTS engines ready: %s (%.2fs)",
+                ", ".join(engine.name for engine in self.engines), time.perf_counter() - started
+            )
+            self._ready.set()
+            future.set_result(None)
+
+    def _set_engines(self, engines: List[TTSEngine]) -> None:
+        """エンジンを登録し、音声名マッピングを先頭のエンジンから作る"""
+        self.engines = list(engines)
+        self.voice_names = dict(self.engines[0].voices())
+        for engine in self.engines[1:]:
+            if engine.voices() != self.voice_names:
+                logger.warning("エンジン %s の音声一覧が %s と異なります", engine.name, self.engines[0].name)
+
+    @property
+    def concurrency(self) -> int:
+        """同時に合成できる数（エンジン数。初期化前は前回の台数）"""
+        return len(self.engines) or len(self.catalog.engines) or 1
+
+    @property
+    def preset_apply_count(self) -> int:
+        return sum(engine.preset_apply_count for engine in self.engines)
+
+    @property
+    def preset_skip_count(self) -> int:
+        return sum(engine.preset_skip_count for engine in self.engines)
+
     def create_voice_preset(self, user_settings: Dict[str, Any]) -> Dict[str, Any]:
         """ユーザー設定からVoicePresetを作成"""
         user_voice = user_settings.get("voice", list(self.voice_names.keys())[0] if self.voice_names else "")
-        
+
         return {
             "PresetName": self.temp_preset_name,
             "VoiceName": self.voice_names.get(user_voice, list(self.voice_names.values())[0] if self.voice_names else ""),
@@ -92,52 +149,94 @@ class TTSManager:
                 {"Name": "S", "Value": user_settings.get("styleS", 0.0)}
             ]
         }
-    
-    def apply_voice_preset(self, voice_preset: Dict[str, Any], fallback_voice: str = None) -> bool:
-        """VoicePresetを適用"""
-        with self.tts_control.connect():
-            try:
-                self.tts_control.set_voice_preset(voice_preset)
-                self.tts_control.current_voice_preset_name = self.temp_preset_name
-                return True
-            except Exception as e:
-                print(f"Error setting voice preset: {e}")
-                if fallback_voice:
-                    try:
-                        self.tts_control.current_voice_preset_name = fallback_voice
-                        return True
-                    except Exception as fallback_error:
-                        print(f"Fallback error: {fallback_error}")
+
+    @staticmethod
+    def preset_fingerprint(voice_preset: Dict[str, Any]) -> str:
+        """プリセットの内容を表す文字列（辞書の順序に依存しない）"""
+        return str(sorted(voice_preset.items()))
+
+    def _acquire(self, fingerprint: str) -> TTSEngine:
+        """空いているエンジンを借りる（全部使用中なら空くまで待つ）"""
+        with self._cond:
+            while len(self._busy) >= len(self.engines):
+                self._cond.wait()
+            idle = [engine for engine in self.engines if engine not in self._busy]
+            engine = next(
+                (engine for engine in idle if engine.applied_fingerprint == fingerprint),
+                None
+            ) or min(idle, key=lambda engine: engine.job_count)
+            self._busy.add(engine)
+            engine.job_count += 1
+            return engine
+
+    def _release(self, engine: TTSEngine) -> None:
+        with self._cond:
+            self._busy.discard(engine)
+            self._cond.notify()
+
+    def synthesize(
+        self,
+        text: str,
+        voice_preset: Dict[str, Any],
+        output_file: str,
+        fallback_voice: str = None,
+        fingerprint: str = None,
+        trace: Optional[Trace] = None,
+    ) -> bool:
+        """空いているエンジンでプリセットを適用して音声ファイルを生成（ブロッキング）"""
+        if not self.wait_ready():
+            logger.warning("TTS engines are not available")
+            return False
+        fingerprint = fingerprint or self.preset_fingerprint(voice_preset)
+        engine = self._acquire(fingerprint)
+        try:
+            already_applied = engine.applied_fingerprint == fingerprint
+            started = time.perf_counter()
+            if not engine.apply_voice_preset(voice_preset, fallback_voice, fingerprint):
+                logger.warning("VoicePreset適用に失敗しました (%s)", engine.name)
                 return False
-    
-    def generate_audio(self, text: str, output_file: str = "data/audio/output.wav") -> bool:
-        """音声を生成してファイルに保存"""
-        with self.tts_control.connect():
+            if not already_applied:
+                PRESET_APPLY_SECONDS.labels(engine.name).observe(time.perf_counter() - started)
+                if trace is not None:
+                    trace.add_span("preset_apply", started)
+
+            started = time.perf_counter()
+            try:
+                return engine.generate_audio(text, output_file)
+            finally:
+                SYNTHESIS_SECONDS.labels(engine.name).observe(time.perf_counter() - started)
+                if trace is not None:
+                    trace.add_span("engine_synthesis", started)
+        finally:
+            self._release(engine)
+
+    def engine_stats(self) -> List[Dict[str, Any]]:
+        """エンジンごとの統計"""
+        with self._cond:
+            busy = set(self._busy)
+        return [dict(engine.stats(), busy=engine in busy) for engine in self.engines]
+
+    def health(self) -> List[Dict[str, Any]]:
+        """エンジンごとの状態"""
+        results = []
+        for engine in self.engines:
             try:
-                self.tts_control.text = text
-                self.tts_control.save_audio_to_file(output_file)
-                return True
+                results.append(engine.health())
             except Exception as e:
-                print(f"Audio generation error: {e}")
-                return False
-    
+                results.append({"name": engine.name, "connected": False, "error": str(e)})
+        return results
+
     def is_connected(self) -> bool:
-        """TTS接続状態をチェック"""
-        try:
-            return self.tts_control and self.tts_control.status == HostStatus.Ready
-        except Exception:
-            return False
-    
+        """TTS接続状態をチェック（1台でも使えれば True）"""
+        return any(engine.is_connected() for engine in self.engines)
+
     def reconnect(self) -> bool:
         """TTS接続を再試行"""
-        try:
-            with self.tts_control.connect():
-                print('🔄 TTS reconnection successful!')
-                return True
-        except Exception as e:
-            print(f"❌ TTS reconnection failed: {e}")
-            return False
+        results = [engine.reconnect() for engine in self.engines]
+        if all(results):
+            logger.info("TTS reconnection successful")
+        return any(results)
 
 
-# TTSマネージャーのグローバルインスタンス
+# TTSマネージャーのグローバルインスタンス（エンジンの初期化は start() まで行わない）
 tts_manager = TTSManager()
@@ -0,0 +1,78 @@
+"""
+音声一覧（表示名 → エンジン上の音声名）の保存と読み込み
+"""
+import json
+import logging
+import os
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class VoiceCatalog:
+    """エンジンごとの音声名マッピングを JSON ファイルに保存したもの
+
+    A.I.VOICE の音声名マッピングは音声ごとにホストへ問い合わせて作るため時間がかかる。
+    前回の結果を保存しておき、起動時はコマンドの候補や Web 画面にそのまま使う。
+    エンジン側では音声名の一覧と突き合わせるだけで、一致すれば問い合わせを省く。
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.backend: Optional[str] = None
+        self.engines: Dict[str, Dict[str, str]] = {}
+        self._mtime: Optional[float] = None
+
+    def load(self, backend: str) -> None:
+        """保存済みの一覧を読み込む（別のバックエンドのものや壊れたファイルは無視する）"""
+        try:
+            self._mtime = os.path.getmtime(self.path)
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("音声一覧の読み込みエラー（作り直します）: %s", e)
+            return
+        if data.get("backend") != backend:
+            return
+        self.backend = backend
+        self.engines = {name: dict(voices) for name, voices in data.get("engines", {}).items()}
+
+    def refresh(self, backend: str) -> None:
+        """ファイルが更新されていれば読み直す（別プロセスの Web UI 向け）"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.load(backend)
+
+    def save(self) -> None:
+        """一時ファイルに書いてから置き換える"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_file = f"{self.path}.tmp"
+        try:
+            with open(temp_file, "w", encoding="utf-8") as f:
+                json.dump({"backend": self.backend, "engines": self.engines}, f, ensure_ascii=False, indent=2)
+            os.replace(temp_file, self.path)
+        except OSError as e:
+            logger.warning("音声一覧の保存エラー: %s", e)
+
+    def update(self, backend: str, engines: Dict[str, Dict[str, str]]) -> bool:
+        """一覧を置き換える（変わっていれば True）"""
+        changed = backend != self.backend or engines != self.engines
+        self.backend = backend
+        self.engines = {name: dict(voices) for name, voices in engines.items()}
+        return changed
+
+    def voices_for(self, engine_name: str) -> Optional[Dict[str, str]]:
+        """エンジンの前回の音声名マッピング"""
+        return self.engines.get(engine_name)
+
+    @property
+    def voice_names(self) -> Dict[str, str]:
+        """先頭のエンジンの音声名マッピング（プールとしての音声一覧）"""
+        return next(iter(self.engines.values()), {})
@@ -0,0 +1,101 @@
+"""
+ユーザー音声設定のメモリキャッシュ
+"""
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict
+
+from ..database.models.voice_settings import VoiceSettings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ResolvedVoice:
+    """DB の設定から導出した、合成にそのまま使える値"""
+    settings: Dict[str, Any]
+    preset: Dict[str, Any]
+    fingerprint: str
+
+
+class VoiceSettingsCache:
+    """ユーザーIDごとに設定・VoicePreset・プリセット指紋を保持するキャッシュ
+
+    ``VoiceSettings.update_user_settings`` が呼ばれると変更リスナー経由で
+    該当ユーザーのエントリが破棄されるため、既知のユーザーのメッセージは
+    DB に問い合わせずに処理できる。
+
+    エントリは ``max_entries`` 件までで、超えたら最も長く使われていないユーザーから捨てる。
+    世代番号は読み込み中のユーザーの分だけ持つので、こちらも際限なく増えない。
+    """
+
+    def __init__(self, tts_manager, max_entries: int = 10000) -> None:
+        self._tts_manager = tts_manager
+        self.max_entries = max_entries
+        # 先頭が最も長く使われていないエントリ
+        self._entries: "OrderedDict[str, ResolvedVoice]" = OrderedDict()
+        # 読み込み中に無効化された場合に古い値を書き戻さないための世代番号と、読み込み中の数
+        self._generations: Dict[str, int] = {}
+        self._loading: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, user_id: str) -> ResolvedVoice:
+        """ユーザーの設定を取得（キャッシュになければ DB から読み込む）"""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        # 読み込み中として登録してから世代を読む（以降の invalidate は世代を進める）
+        self._loading[user_id] = self._loading.get(user_id, 0) + 1
+        generation = self._generations.get(user_id, 0)
+        try:
+            settings = await VoiceSettings.get_user_settings(user_id)
+        except Exception as e:
+            # 取得失敗時はデフォルト設定で読み上げ、キャッシュはしない
+            logger.error("ユーザー設定取得エラー: %s", e)
+            return self._resolve({})
+        finally:
+            stale = self._generations.get(user_id, 0) != generation
+            self._finish_loading(user_id)
+
+        entry = self._resolve(settings)
+        if not stale:
+            self._store(user_id, entry)
+        return entry
+
+    def _finish_loading(self, user_id: str) -> None:
+        """読み込みが終わったら、誰も読み込んでいないユーザーの世代番号を捨てる"""
+        remaining = self._loading.get(user_id, 1) - 1
+        if remaining:
+            self._loading[user_id] = remaining
+        else:
+            self._loading.pop(user_id, None)
+            self._generations.pop(user_id, None)
+
+    def _store(self, user_id: str, entry: ResolvedVoice) -> None:
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _resolve(self, settings: Dict[str, Any]) -> ResolvedVoice:
+        preset = self._tts_manager.create_voice_preset(settings)
+        return ResolvedVoice(settings, preset, self._tts_manager.preset_fingerprint(preset))
+
+    def invalidate(self, user_id: str) -> None:
+        """ユーザーのエントリを破棄する（他スレッドから呼ばれてもよい）"""
+        if user_id in self._loading:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        """全エントリを破棄する（読み込み中の値も書き戻させない）"""
+        for user_id in list(self._entries) + list(self._loading):
+            self.invalidate(user_id)
@@ -14,7 +14,12 @@ TORTOISE_ORM = {
     },
     "apps": {
         "models": {
-            "models": ["app.database.models.voice_settings", "aerich.models"],
+            "models": [
+                "app.database.models.voice_settings",
+                "app.database.models.reading_dictionary",
+                "app.database.models.backlog_settings",
+                "aerich.models",
+            ],
             "default_connection": "default",
         },
     },
@@ -0,0 +1,53 @@
+"""
+サーバーごとの読み上げ滞留設定のデータベースモデル
+"""
+from tortoise.models import Model
+from tortoise import fields
+from typing import Dict, Any, Optional
+
+
+class BacklogSettings(Model):
+    """サーバーごとの滞留時の振る舞い"""
+    
+    id = fields.IntField(pk=True)
+    guild_id = fields.CharField(max_length=20, unique=True, description="Discord Guild ID")
+    merge_same_author = fields.BooleanField(default=False, description="同じ人の連続投稿をまとめる")
+    max_backlog_seconds = fields.FloatField(default=0.0, description="滞留の上限秒数 (0 で無効)")
+    overflow_action = fields.CharField(max_length=20, default="summarize", description="drop / summarize")
+    speedup_after_seconds = fields.FloatField(default=0.0, description="話速を上げ始める滞留秒数 (0 で無効)")
+    max_speed = fields.FloatField(default=1.5, description="話速の倍率の上限")
+    
+    # メタデータ
+    created_at = fields.DatetimeField(auto_now_add=True)
+    updated_at = fields.DatetimeField(auto_now=True)
+    
+    class Meta:
+        table = "backlog_settings"
+    
+    def __str__(self) -> str:
+        return f"BacklogSettings(guild_id={self.guild_id})"
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """辞書形式に変換（BacklogPolicy の引数と同じキー）"""
+        return {
+            "merge_same_author": self.merge_same_author,
+            "max_backlog_seconds": self.max_backlog_seconds,
+            "overflow_action": self.overflow_action,
+            "speedup_after_seconds": self.speedup_after_seconds,
+            "max_speed": self.max_speed,
+        }
+    
+    @classmethod
+    async def get_guild_settings(cls, guild_id: str) -> Optional[Dict[str, Any]]:
+        """サーバーの設定を取得（未設定なら None）"""
+        settings = await cls.get_or_none(guild_id=guild_id)
+        return settings.to_dict() if settings else None
+    
+    @classmethod
+    async def update_guild_settings(cls, guild_id: str, settings: Dict[str, Any]) -> "BacklogSettings":
+        """サーバーの設定を更新または作成"""
+        obj, created = await cls.update_or_create(
+            guild_id=guild_id,
+            defaults=settings
+        )
+        return obj
@@ -0,0 +1,48 @@
+"""
+サーバーごとの読み上げ辞書のデータベースモデル
+"""
+from tortoise.models import Model
+from tortoise import fields
+from typing import Dict
+
+
+class ReadingDictionary(Model):
+    """サーバーごとの「表記 → 読み」の登録"""
+    
+    id = fields.IntField(pk=True)
+    guild_id = fields.CharField(max_length=20, index=True, description="Discord Guild ID")
+    word = fields.CharField(max_length=100, description="置き換える表記")
+    reading = fields.CharField(max_length=200, description="読み")
+    
+    # メタデータ
+    created_at = fields.DatetimeField(auto_now_add=True)
+    updated_at = fields.DatetimeField(auto_now=True)
+    
+    class Meta:
+        table = "reading_dictionary"
+        unique_together = (("guild_id", "word"),)
+    
+    def __str__(self) -> str:
+        return f"ReadingDictionary(guild_id={self.guild_id}, word={self.word})"
+    
+    @classmethod
+    async def get_guild_entries(cls, guild_id: str) -> Dict[str, str]:
+        """サーバーの辞書を {表記: 読み} で取得"""
+        rows = await cls.filter(guild_id=guild_id).values_list("word", "reading")
+        return dict(rows)
+    
+    @classmethod
+    async def set_entry(cls, guild_id: str, word: str, reading: str) -> "ReadingDictionary":
+        """辞書に登録（既にあれば読みを更新）"""
+        obj, created = await cls.update_or_create(
+            guild_id=guild_id,
+            word=word,
+            defaults={"reading": reading}
+        )
+        return obj
+    
+    @classmethod
+    async def remove_entry(cls, guild_id: str, word: str) -> bool:
+        """辞書から削除（削除できたら True）"""
+        deleted = await cls.filter(guild_id=guild_id, word=word).delete()
+        return deleted > 0
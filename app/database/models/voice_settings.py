@@ -1,9 +1,18 @@
 """
 TTS音声設定のデータベースモデル
 """
+import logging
+import time
 from tortoise.models import Model
 from tortoise import fields
-from typing import Dict, Any
+from typing import Callable, Dict, Any, List
+
+from ...core.metrics import DB_QUERY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# 設定が保存されたときに user_id を受け取って呼ばれるコールバック
+_change_listeners: List[Callable[[str], None]] = []
 
 
 class VoiceSettings(Model):
@@ -54,14 +63,26 @@ class VoiceSettings(Model):
             "styleS": self.style_s,
         }
     
+    @classmethod
+    def add_change_listener(cls, listener: Callable[[str], None]) -> None:
+        """設定変更リスナーを登録"""
+        _change_listeners.append(listener)
+    
+    @classmethod
+    def remove_change_listener(cls, listener: Callable[[str], None]) -> None:
+        """設定変更リスナーを解除"""
+        if listener in _change_listeners:
+            _change_listeners.remove(listener)
+    
     @classmethod
     async def get_user_settings(cls, user_id: str) -> Dict[str, Any]:
         """ユーザー設定を取得（存在しない場合はデフォルト値）"""
+        started = time.perf_counter()
         try:
-            settings = await cls.get(user_id=user_id)
-            return settings.to_dict()
-        except cls.DoesNotExist:
-            return {}
+            settings = await cls.get_or_none(user_id=user_id)
+            return settings.to_dict() if settings is not None else {}
+        finally:
+            DB_QUERY_SECONDS.labels("get_user_settings").observe(time.perf_counter() - started)
     
     @classmethod
     async def update_user_settings(cls, user_id: str, settings: Dict[str, Any]) -> "VoiceSettings":
@@ -80,8 +101,17 @@ class VoiceSettings(Model):
             "style_s": float(settings.get("styleS", 0.0)),
         }
         
+        started = time.perf_counter()
         obj, created = await cls.update_or_create(
             user_id=user_id,
             defaults=defaults
         )
+        DB_QUERY_SECONDS.labels("update_user_settings").observe(time.perf_counter() - started)
+        
+        # キャッシュなどに変更を通知
+        for listener in list(_change_listeners):
+            try:
+                listener(user_id)
+            except Exception as e:
+                logger.warning("設定変更通知エラー: %s", e)
         return obj
@@ -0,0 +1,93 @@
+"""
+Aho–Corasick 法による複数語の一括置換
+"""
+from typing import Dict, List, Mapping, Tuple
+
+
+class AhoCorasick:
+    """辞書の全語を一度に探索するオートマトン
+
+    構築は辞書の総文字数に比例し、置換はテキスト長（＋一致数）に比例する。
+    辞書の語数が数千でも1メッセージあたりのコストはほぼ変わらない。
+    重なった一致は「最も左・その中で最も長い」ものを優先する。
+    """
+
+    def __init__(self, replacements: Mapping[str, str]) -> None:
+        self._replacements: Dict[str, str] = {word: reading for word, reading in replacements.items() if word}
+        # ノードごとの遷移・失敗リンク・終端語・出力リンク（失敗リンクをたどった先の最寄りの終端ノード）
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._word: List[str] = [""]
+        self._output: List[int] = [-1]
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self._replacements)
+
+    def _build(self) -> None:
+        for word in self._replacements:
+            node = 0
+            for char in word:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._word.append("")
+                    self._output.append(-1)
+                node = next_node
+            self._word[node] = word
+
+        # 幅優先で失敗リンクと出力リンクを張る
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                fail = self._goto[fallback].get(char, 0)
+                self._fail[child] = fail if fail != child else 0
+                self._output[child] = self._fail[child] if self._word[self._fail[child]] else self._output[self._fail[child]]
+                queue.append(child)
+
+    def find(self, text: str) -> List[Tuple[int, str]]:
+        """一致した (開始位置, 語) をすべて返す"""
+        matches: List[Tuple[int, str]] = []
+        goto, fail, words, output = self._goto, self._fail, self._word, self._output
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            hit = node if words[node] else output[node]
+            while hit > 0:
+                word = words[hit]
+                matches.append((index - len(word) + 1, word))
+                hit = output[hit]
+        return matches
+
+    def replace(self, text: str) -> str:
+        """一致した語を読みに置き換える"""
+        if not self._replacements:
+            return text
+
+        # 開始位置ごとに最長の語を残す
+        longest: Dict[int, str] = {}
+        for start, word in self.find(text):
+            if len(word) > len(longest.get(start, "")):
+                longest[start] = word
+        if not longest:
+            return text
+
+        parts: List[str] = []
+        position = 0
+        for start in sorted(longest):
+            if start < position:
+                continue
+            word = longest[start]
+            parts.append(text[position:start])
+            parts.append(self._replacements[word])
+            position = start + len(word)
+        parts.append(text[position:])
+        return "".join(parts)
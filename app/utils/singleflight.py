@@ -0,0 +1,65 @@
+"""
+同一キーの非同期処理をまとめる Single-flight
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class _Flight:
+    """実行中の処理と、その完了を待っている呼び出しの数"""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """同じキーの処理が実行中なら新たに始めず、その結果を待って共有する
+
+    処理は呼び出し元とは別のタスクで動かし、先に呼んだ側も含めて全員が shield 越しに待つ。
+    誰か1人がキャンセルされても処理は続き、待っている呼び出しがいなくなったときだけ止める。
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self.shared_count = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """キーに対する処理を実行（実行中なら完了を待って同じ結果を返す）"""
+        flight = self._inflight.get(key)
+        if flight is not None:
+            self.shared_count += 1
+        else:
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda _, flight=flight: self._finished(key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # 最後の1人がいなくなったので処理も止める（止まるまでの間に来た呼び出しは新しく始める）
+                flight.task.cancel()
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finished(self, key: Hashable, flight: _Flight) -> None:
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        if not flight.task.cancelled():
+            # 待っている呼び出しがいなくても "never retrieved" 警告を出さない
+            flight.task.exception()
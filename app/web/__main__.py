@@ -0,0 +1,55 @@
+"""
+Web UI を Bot とは別のプロセスで起動する
+
+    python -m app.web --processes 2 --workers 2
+
+``--processes`` / ``--workers`` は Robyn のオプション。各プロセスが自分でデータベースに接続し、
+音声設定を保存すると localhost の UDP で Bot に通知する（Bot 側は TTS_WEB_MODE=external）。
+音声一覧は Bot が保存した TTS_VOICE_CATALOG を読む。
+"""
+import logging
+from typing import List
+
+from app.core.environment import ENV
+from app.core.logger import setup_logging
+from app.core.settings_feed import VOICE_SETTINGS, SettingsFeedPublisher
+from app.core.voice_catalog import VoiceCatalog
+from app.database.config import close_db, init_db
+from app.database.models.voice_settings import VoiceSettings
+from app.web.server import create_web_server
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    setup_logging()
+
+    backend = ENV.get("TTS_BACKEND", "aivoice")
+    catalog = VoiceCatalog(ENV.get("TTS_VOICE_CATALOG", "data/voice_catalog.json"))
+    catalog.load(backend)
+
+    def voice_names() -> List[str]:
+        # Bot がエンジンの初期化で一覧を作り直したら読み直す
+        catalog.refresh(backend)
+        return list(catalog.voice_names)
+
+    async def startup() -> None:
+        # ワーカーのプロセスごとに、ログの出力スレッド・データベース接続・通知用ソケットを用意する
+        setup_logging()
+        await init_db()
+        publisher = SettingsFeedPublisher(int(ENV.get("SETTINGS_FEED_PORT", "8765")))
+        VoiceSettings.add_change_listener(lambda user_id: publisher.publish(VOICE_SETTINGS, user_id))
+
+    async def shutdown() -> None:
+        await web_server.close()
+        await close_db()
+
+    web_server = create_web_server(voice_names)
+    web_server.app.startup_handler(startup)
+    # Robyn のハンドラーは種類ごとに1つなので、Web サーバー側の終了処理もここでまとめて呼ぶ
+    web_server.app.shutdown_handler(shutdown)
+    web_server.start(host=ENV.get("WEB_HOST", "127.0.0.1"), port=int(ENV.get("WEB_PORT", "8080")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Discord API（OAuth2 のトークン交換とユーザー情報の取得）の非同期クライアント
+"""
+import asyncio
+import logging
+import random
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from app.core.environment import ENV
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://discord.com/api"
+
+# 再試行するステータス（レート制限と一時的なサーバーエラー）
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class DiscordAPIClient:
+    """接続を使い回す Discord API クライアント
+
+    ClientSession はイベントループに紐づくため、最初のリクエスト時にそのループで作り、
+    プロセス（ワーカー）ごとに1つを使い回す。タイムアウト・接続エラー・429/5xx は
+    指数バックオフ（ジッター付き）で再試行し、429 では Retry-After に従う。
+    ``base_url`` を変えればローカルの代替サーバーに向けて負荷試験ができる。
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        timeout: float = 10.0,
+        retries: int = 2,
+        backoff: float = 0.5,
+        pool_size: int = 100,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def from_env(cls) -> "DiscordAPIClient":
+        return cls(
+            base_url=ENV.get("DISCORD_API_BASE_URL", DEFAULT_BASE_URL),
+            timeout=float(ENV.get("DISCORD_HTTP_TIMEOUT", "10")),
+            retries=int(ENV.get("DISCORD_HTTP_RETRIES", "2")),
+            backoff=float(ENV.get("DISCORD_HTTP_BACKOFF", "0.5")),
+            pool_size=int(ENV.get("DISCORD_HTTP_POOL_SIZE", "100")),
+        )
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._loop = loop
+        return self._session
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), 10.0)
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.0)
+
+    async def _request(self, method: str, path: str, **kwargs: Any) -> Optional[Dict[str, Any]]:
+        """JSON を返す（失敗したら None）"""
+        session = self._get_session()
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                async with session.request(method, self.url(path), **kwargs) as response:
+                    if response.status == 200:
+                        return await response.json()
+                    if response.status not in RETRY_STATUSES or last_attempt:
+                        logger.warning("Discord API エラー: %s %s -> %s", method, path, response.status)
+                        return None
+                    delay = self._retry_delay(attempt, response.headers.get("Retry-After"))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if last_attempt:
+                    logger.warning("Discord API 接続エラー: %s %s: %r", method, path, e)
+                    return None
+                delay = self._retry_delay(attempt)
+            logger.debug("Discord API retry %s %s in %.2fs (attempt %d)", method, path, delay, attempt + 1)
+            await asyncio.sleep(delay)
+        return None
+
+    async def exchange_code(self, client_id: str, client_secret: str, code: str, redirect_uri: str) -> Optional[str]:
+        """認可コードをアクセストークンに交換する"""
+        data = await self._request("POST", "/oauth2/token", data={
+            "client_id": client_id,
+            "client_secret": client_secret,
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": redirect_uri,
+        })
+        return data.get("access_token") if data else None
+
+    async def fetch_user(self, access_token: str) -> Optional[Dict[str, Any]]:
+        """アクセストークンの持ち主（/users/@me）"""
+        return await self._request("GET", "/users/@me", headers={"Authorization": f"Bearer {access_token}"})
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -1,35 +1,63 @@
+import base64
+import binascii
+import hashlib
+import hmac
 import json
-import os
+import logging
 import secrets
-from typing import Optional
-import requests
+import time
+from typing import Callable, List, Optional
 from robyn import Robyn, Request, Response
 from robyn.templating import JinjaTemplate
-from aivoice_python import AIVoiceTTsControl
 
 from app.core.environment import ENV
 from ..database.models.voice_settings import VoiceSettings
+from .discord_api import DiscordAPIClient
+
+logger = logging.getLogger(__name__)
 
 class TTSWebServer:
-    def __init__(self, tts_control: AIVoiceTTsControl):
+    """音声設定の Web UI
+
+    Bot のプロセス内のスレッドでも、``python -m app.web`` で別プロセス（複数ワーカー）でも動く。
+    セッションは署名付きの Cookie に入れるので、どのワーカーが受けても同じように検証できる。
+    /metrics と /api/traces は公開ポートに出さず、Bot のプロセスの StatusServer（localhost）が返す。
+    """
+
+    def __init__(self, voice_names: Callable[[], List[str]]):
         self.app = Robyn(__file__)
-        self.tts_control = tts_control
-        self.sessions = {}
+        self.voice_names = voice_names
         self.template = JinjaTemplate("app/web/templates")
         
+        # セッション Cookie の署名鍵（複数プロセスで動かす場合は共通の値を設定する）
+        secret = ENV.get("WEB_SESSION_SECRET")
+        if not secret:
+            logger.info("WEB_SESSION_SECRET is not set; sessions are valid only in this process")
+            secret = secrets.token_urlsafe(32)
+        self.session_secret = secret.encode("utf-8")
+        # Cookie はサーバー側に記録しないため、ログアウトしても値を控えていれば期限までは使える。
+        # その期間を短くしておく
+        self.session_max_age = int(ENV.get("WEB_SESSION_MAX_AGE", str(12 * 3600)))
+        
         # Discord OAuth2 settings - 環境変数から取得
         self.client_id = ENV.get("DISCORD_CLIENT_ID")
         self.client_secret = ENV.get("DISCORD_CLIENT_SECRET")
         self.redirect_uri = ENV.get("DISCORD_REDIRECT_URI", "http://localhost:8080/callback")
+        self.discord_api = DiscordAPIClient.from_env()
 
         self.setup_routes()
+        self.app.shutdown_handler(self.close)
+    
+    async def close(self):
+        """Discord API の接続を閉じる"""
+        await self.discord_api.close()
     
     async def get_user_voice_settings(self, user_id: str):
         """ユーザーの音声設定を取得（DB から）"""
         try:
             return await VoiceSettings.get_user_settings(user_id)
         except Exception as e:
-            print(f"音声設定取得エラー: {e}")
+            logger.error("音声設定取得エラー: %s", e)
             return {}
     
     async def save_user_voice_settings(self, user_id: str, settings: dict):
@@ -37,15 +65,43 @@ class TTSWebServer:
         try:
             await VoiceSettings.update_user_settings(user_id, settings)
         except Exception as e:
-            print(f"音声設定保存エラー: {e}")
+            logger.error("音声設定保存エラー: %s", e)
+    
+    def _sign(self, payload: str) -> str:
+        return hmac.new(self.session_secret, payload.encode("ascii"), hashlib.sha256).hexdigest()
+    
+    def create_session(self, user: dict) -> str:
+        """ユーザー情報と有効期限を署名付きの Cookie の値にする"""
+        data = {
+            "id": user["id"],
+            "username": user.get("username"),
+            "avatar_url": user.get("avatar_url"),
+            "exp": int(time.time()) + self.session_max_age,
+        }
+        payload = base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode("ascii")
+        return f"{payload}.{self._sign(payload)}"
     
     def get_user_from_session(self, request: Request) -> Optional[dict]:
         # Robynのヘッダーアクセス方法に修正
         cookie_header = request.headers.get("cookie") or request.headers.get("Cookie") or ""
-        if "session_id=" in cookie_header:
-            session_id = cookie_header.split("session_id=")[1].split(";")[0]
-            return self.sessions.get(session_id)
-        return None
+        if "session_id=" not in cookie_header:
+            return None
+        payload, _, signature = cookie_header.split("session_id=")[1].split(";")[0].partition(".")
+        if not payload:
+            return None
+        # 細工された Cookie（非 ASCII・壊れた base64・辞書でない JSON）はログインしていない扱いにする
+        try:
+            if not hmac.compare_digest(signature.encode("utf-8"), self._sign(payload).encode("ascii")):
+                return None
+            user = json.loads(base64.urlsafe_b64decode(payload.encode("ascii")))
+        except (ValueError, binascii.Error):
+            return None
+        if not isinstance(user, dict) or "id" not in user:
+            return None
+        expires = user.get("exp")
+        if not isinstance(expires, (int, float)) or expires < time.time():
+            return None
+        return user
     
     def setup_routes(self):
         @self.app.get("/")
@@ -62,20 +118,19 @@ class TTSWebServer:
                     "username": "DemoUser",
                     "avatar_url": "https://cdn.discordapp.com/embed/avatars/0.png"
                 }
-                session_id = secrets.token_urlsafe(32)
-                self.sessions[session_id] = demo_user
+                session_id = self.create_session(demo_user)
                 
                 return Response(
                     status_code=302,
                     headers={
                         "Location": "/",
-                        "Set-Cookie": f"session_id={session_id}; Path=/; HttpOnly"
+                        "Set-Cookie": f"session_id={session_id}; Path=/; HttpOnly; Max-Age={self.session_max_age}"
                     },
                     description="Redirecting to home"
                 )
             
             discord_auth_url = (
-                f"https://discord.com/api/oauth2/authorize"
+                f"{self.discord_api.url('/oauth2/authorize')}"
                 f"?client_id={self.client_id}"
                 f"&redirect_uri={self.redirect_uri}"
                 f"&response_type=code"
@@ -89,41 +144,23 @@ class TTSWebServer:
             )
         
         @self.app.get("/callback")
-        def callback(request: Request):
+        async def callback(request: Request):
             code = request.query_params.get("code", None)
             if not code:
                 return Response(status_code=400, headers={}, description="No authorization code")
             
             # Exchange code for access token
-            token_data = {
-                "client_id": self.client_id,
-                "client_secret": self.client_secret,
-                "grant_type": "authorization_code",
-                "code": code,
-                "redirect_uri": self.redirect_uri
-            }
-            
-            token_response = requests.post(
-                "https://discord.com/api/oauth2/token",
-                data=token_data,
-                headers={"Content-Type": "application/x-www-form-urlencoded"}
+            access_token = await self.discord_api.exchange_code(
+                self.client_id, self.client_secret, code, self.redirect_uri
             )
-            
-            if token_response.status_code != 200:
+            if not access_token:
                 return Response(status_code=400, headers={}, description="Failed to get access token")
             
-            access_token = token_response.json()["access_token"]
-            
             # Get user info
-            user_response = requests.get(
-                "https://discord.com/api/users/@me",
-                headers={"Authorization": f"Bearer {access_token}"}
-            )
-            
-            if user_response.status_code != 200:
+            user_data = await self.discord_api.fetch_user(access_token)
+            if not user_data:
                 return Response(status_code=400, headers={}, description="Failed to get user info")
             
-            user_data = user_response.json()
             user_data["avatar_url"] = (
                 f"https://cdn.discordapp.com/avatars/{user_data['id']}/{user_data['avatar']}.png"
                 if user_data.get("avatar") else
@@ -131,25 +168,19 @@ class TTSWebServer:
             )
             
             # Create session
-            session_id = secrets.token_urlsafe(32)
-            self.sessions[session_id] = user_data
+            session_id = self.create_session(user_data)
             
             return Response(
                 status_code=302,
                 headers={
                     "Location": "/",
-                    "Set-Cookie": f"session_id={session_id}; Path=/; HttpOnly"
+                    "Set-Cookie": f"session_id={session_id}; Path=/; HttpOnly; Max-Age={self.session_max_age}"
                 },
                 description="Login successful"
             )
         
         @self.app.get("/logout")
         def logout(request: Request):
-            cookie_header = request.headers.get("cookie") or request.headers.get("Cookie") or ""
-            if "session_id=" in cookie_header:
-                session_id = cookie_header.split("session_id=")[1].split(";")[0]
-                self.sessions.pop(session_id, None)
-            
             return Response(
                 status_code=302,
                 headers={
@@ -168,9 +199,10 @@ class TTSWebServer:
             # データベースからユーザー設定を取得
             user_settings = await self.get_user_voice_settings(user["id"])
             
+            voice_names = self.voice_names()
             return {
-                "voices": self.tts_control.voice_names,
-                "current_voice": user_settings.get("voice", self.tts_control.voice_names[0]),
+                "voices": voice_names,
+                "current_voice": user_settings.get("voice", voice_names[0] if voice_names else ""),
                 "settings": {
                     "pitch": user_settings.get("pitch", 1.0),
                     "speed": user_settings.get("speed", 1.0),
@@ -213,22 +245,22 @@ class TTSWebServer:
                 return {"status": "success"}
                 
             except Exception as e:
-                print(f"設定保存エラー: {e}")
+                logger.error("設定保存エラー: %s", e)
                 return Response(status_code=500, headers={}, description=str(e))
     
-    def start(self, host="localhost", port=8080):
-        print(f"🌟 TTS Web Interface starting on http://{host}:{port}")
+    def start(self, host="127.0.0.1", port=8080):
+        logger.info("TTS Web Interface starting on http://%s:%s", host, port)
         if not self.client_id:
-            print("📋 Demo mode: Discord OAuth2 not configured - using demo login")
+            logger.info("Demo mode: Discord OAuth2 not configured - using demo login")
         else:
-            print("💫 Discord OAuth2 configured - real authentication enabled!")
-        self.app.start(port=port)
+            logger.info("Discord OAuth2 configured - real authentication enabled")
+        self.app.start(host=host, port=port)
 
 # Global web server instance
 web_server_instance = None
 
-def create_web_server(tts_control: AIVoiceTTsControl):
+def create_web_server(voice_names: Callable[[], List[str]]):
     """Webサーバーインスタンスを作成（完全にDB基盤）"""
     global web_server_instance
-    web_server_instance = TTSWebServer(tts_control)
+    web_server_instance = TTSWebServer(voice_names)
     return web_server_instance
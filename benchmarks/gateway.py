@@ -0,0 +1,258 @@
+"""
+Gateway のインテント・キャッシュ設定ごとのメモリと CPU のベンチマーク
+
+Discord には接続せず、Gateway から届くペイロード（GUILD_CREATE・MESSAGE_CREATE・
+PRESENCE_UPDATE）を合成して discord.py の ConnectionState に直接流し込み、
+キャッシュの大きさ・常駐メモリ・処理にかかった CPU 時間をプロファイルごとに JSON で出力する。
+
+ペイロードはインテントに合わせて作る。full（すべてのインテント）では起動時のメンバー取得
+（チャンク）が済んだ状態として全メンバーとオンラインのプレゼンスを GUILD_CREATE に含め、
+プレゼンスの更新も流す。minimal では Discord と同じく自分とボイスチャンネルにいるメンバーだけを含める。
+
+    python -m benchmarks.gateway --guilds 20 --members 5000 --output result.json
+"""
+import argparse
+import asyncio
+import gc
+import json
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+# .env を先に読み込ませる
+from app.core.environment import ENV  # noqa: F401
+
+from .pipeline import rss_bytes
+
+PROFILES = ("full", "minimal")
+SELF_ID = 10 ** 17
+TIMESTAMP = "2024-01-01T00:00:00+00:00"
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Gateway cache benchmark")
+    parser.add_argument("--profile", choices=PROFILES + ("both",), default="both", help="比較するプロファイル")
+    parser.add_argument("--guilds", type=int, default=20, help="サーバー数")
+    parser.add_argument("--members", type=int, default=5000, help="サーバーごとのメンバー数")
+    parser.add_argument("--online-ratio", type=float, default=0.3, help="オンラインのメンバーの割合")
+    parser.add_argument("--voice-members", type=int, default=5, help="サーバーごとのボイスチャンネルにいるメンバー数")
+    parser.add_argument("--messages", type=int, default=20000, help="メッセージ数（全サーバー合計）")
+    parser.add_argument("--presence-updates", type=int, default=50000, help="プレゼンス更新の数（全サーバー合計）")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    parser.add_argument("--output", help="結果の JSON を書き出すファイル（省略時は標準出力）")
+    return parser.parse_args(argv)
+
+
+def user_payload(user_id: int) -> Dict[str, Any]:
+    return {
+        "id": str(user_id),
+        "username": f"user{user_id % 100000}",
+        "discriminator": "0",
+        "global_name": f"User {user_id % 100000}",
+        "avatar": None,
+    }
+
+
+def member_payload(user_id: int) -> Dict[str, Any]:
+    return {"user": user_payload(user_id), "roles": [], "joined_at": TIMESTAMP, "deaf": False, "mute": False, "flags": 0}
+
+
+def presence_payload(user_id: int, guild_id: int, activity: int = 0) -> Dict[str, Any]:
+    return {
+        "user": {"id": str(user_id)},
+        "guild_id": str(guild_id),
+        "status": "online",
+        "activities": [{"name": f"Game {activity}", "type": 0, "created_at": 0}],
+        "client_status": {"desktop": "online"},
+    }
+
+
+def member_id(guild_id: int, index: int) -> int:
+    return guild_id * 1_000_000 + index
+
+
+def guild_payload(args: argparse.Namespace, guild_id: int, intents) -> Dict[str, Any]:
+    """インテントに応じた GUILD_CREATE のペイロード"""
+    voice_channel_id = guild_id + 2
+    voice_ids = [member_id(guild_id, index) for index in range(args.voice_members)]
+    online = int(args.members * args.online_ratio)
+    if intents.members:
+        # 起動時のメンバー取得が済んだ状態（全メンバー）
+        member_ids = [member_id(guild_id, index) for index in range(args.members)]
+    else:
+        member_ids = voice_ids
+    return {
+        "id": str(guild_id),
+        "name": f"guild {guild_id}",
+        "owner_id": str(member_id(guild_id, 0)),
+        "member_count": args.members,
+        "large": args.members > 250,
+        "features": [],
+        "emojis": [],
+        "stickers": [],
+        "threads": [],
+        "stage_instances": [],
+        "guild_scheduled_events": [],
+        "roles": [{
+            "id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0, "color": 0,
+            "hoist": False, "managed": False, "mentionable": False, "flags": 0,
+        }],
+        "channels": [
+            {"id": str(guild_id + 1), "type": 0, "name": "general", "position": 0, "permission_overwrites": []},
+            {"id": str(voice_channel_id), "type": 2, "name": "voice", "position": 1, "permission_overwrites": [],
+             "bitrate": 64000, "user_limit": 0},
+        ],
+        "members": [member_payload(SELF_ID)] + [member_payload(user_id) for user_id in member_ids],
+        "presences": [
+            presence_payload(member_id(guild_id, index), guild_id) for index in range(online)
+        ] if intents.presences else [],
+        "voice_states": [{
+            "user_id": str(user_id), "channel_id": str(voice_channel_id), "session_id": "session",
+            "deaf": False, "mute": False, "self_deaf": False, "self_mute": False, "self_video": False,
+            "suppress": False, "request_to_speak_timestamp": None,
+        } for user_id in voice_ids] if intents.voice_states else [],
+    }
+
+
+def events(args: argparse.Namespace, guild_ids: List[int], intents) -> Iterator[tuple]:
+    """MESSAGE_CREATE と（presences インテントがあれば）PRESENCE_UPDATE を混ぜて流す"""
+    rng = random.Random(args.seed)
+    presence_updates = args.presence_updates if intents.presences else 0
+    total = args.messages + presence_updates
+    online = max(1, int(args.members * args.online_ratio))
+    for index in range(total):
+        guild_id = rng.choice(guild_ids)
+        if rng.random() < args.messages / total:
+            author = member_id(guild_id, rng.randrange(args.members))
+            yield "message_create", {
+                "id": str(SELF_ID * 10 + index),
+                "channel_id": str(guild_id + 1),
+                "guild_id": str(guild_id),
+                "author": user_payload(author),
+                "member": {"roles": [], "joined_at": TIMESTAMP, "deaf": False, "mute": False, "flags": 0},
+                "content": "こんにちは" * rng.randint(1, 10) if intents.message_content else "",
+                "timestamp": TIMESTAMP,
+                "edited_timestamp": None,
+                "tts": False,
+                "mention_everyone": False,
+                "mentions": [],
+                "mention_roles": [],
+                "attachments": [],
+                "embeds": [],
+                "pinned": False,
+                "type": 0,
+            }
+        else:
+            user_id = member_id(guild_id, rng.randrange(online))
+            yield "presence_update", presence_payload(user_id, guild_id, rng.randrange(20))
+
+
+def cpu_seconds() -> float:
+    return time.process_time()
+
+
+async def run_profile(args: argparse.Namespace, profile: str) -> Dict[str, Any]:
+    import discord
+    from discord.ext import commands
+
+    from app.bot.gateway import gateway_options
+
+    options = gateway_options(profile)
+    bot = commands.Bot(command_prefix="!", **options)
+    await bot._async_setup_hook()
+    state = bot._connection
+    state.user = discord.ClientUser(state=state, data=user_payload(SELF_ID))
+    guild_ids = [(index + 1) * 10 for index in range(args.guilds)]
+
+    gc.collect()
+    rss_before = rss_bytes()["current"]
+    started = cpu_seconds()
+    for guild_id in guild_ids:
+        state._add_guild_from_data(guild_payload(args, guild_id, options["intents"]))
+    startup_cpu = cpu_seconds() - started
+    gc.collect()
+    rss_after_startup = rss_bytes()["current"]
+
+    started = cpu_seconds()
+    count = 0
+    for name, payload in events(args, guild_ids, options["intents"]):
+        getattr(state, f"parse_{name}")(payload)
+        count += 1
+        if count % 500 == 0:
+            # on_message などのディスパッチされたタスクを進める
+            await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    event_cpu = cpu_seconds() - started
+    gc.collect()
+    rss_after_events = rss_bytes()["current"]
+
+    intents = options["intents"]
+    result = {
+        "profile": profile,
+        "intents": sorted(name for name, enabled in intents if enabled),
+        "member_cache": sorted(name for name, enabled in options["member_cache_flags"] if enabled),
+        "max_messages": options["max_messages"],
+        "cache": {
+            "guilds": len(bot.guilds),
+            "members": sum(len(guild.members) for guild in bot.guilds),
+            "users": len(bot.users),
+            "messages": len(bot.cached_messages),
+        },
+        "startup_cpu_seconds": startup_cpu,
+        "events": count,
+        "event_cpu_seconds": event_cpu,
+        "cpu_us_per_event": event_cpu / count * 1e6 if count else 0.0,
+        "rss_bytes": rss_after_events,
+        "rss_startup_delta_bytes": rss_after_startup - rss_before if rss_before and rss_after_startup else None,
+        "rss_total_delta_bytes": rss_after_events - rss_before if rss_before and rss_after_events else None,
+    }
+    await bot.close()
+    return result
+
+
+def run_in_subprocess(args: argparse.Namespace, profile: str) -> Dict[str, Any]:
+    """プロファイルごとに別プロセスで測る（前のプロファイルのメモリが残らないように）"""
+    command = [
+        sys.executable, "-m", "benchmarks.gateway", "--profile", profile,
+        "--guilds", str(args.guilds), "--members", str(args.members), "--online-ratio", str(args.online_ratio),
+        "--voice-members", str(args.voice_members), "--messages", str(args.messages),
+        "--presence-updates", str(args.presence_updates), "--seed", str(args.seed),
+    ]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    if args.profile == "both":
+        results = {profile: run_in_subprocess(args, profile) for profile in PROFILES}
+        full, minimal = results["full"], results["minimal"]
+        result = {
+            "config": vars(args),
+            **results,
+            "minimal_vs_full": {
+                "rss_total_delta_ratio": (
+                    minimal["rss_total_delta_bytes"] / full["rss_total_delta_bytes"]
+                    if full["rss_total_delta_bytes"] and minimal["rss_total_delta_bytes"] is not None else None
+                ),
+                "startup_cpu_ratio": minimal["startup_cpu_seconds"] / full["startup_cpu_seconds"]
+                if full["startup_cpu_seconds"] else None,
+                "event_cpu_ratio": minimal["event_cpu_seconds"] / full["event_cpu_seconds"]
+                if full["event_cpu_seconds"] else None,
+            },
+        }
+    else:
+        result = asyncio.run(run_profile(args, args.profile))
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Web UI の Discord ログイン（/callback）の同時実行ベンチマーク
+
+Discord API の代わりにローカルの代替サーバー（/oauth2/token と /users/@me だけを返す）を立て、
+DISCORD_API_BASE_URL をそこに向けた Web サーバーを別プロセスで起動して、/callback に同時にログインを流す。
+ログインの応答時間（p50/p95/p99）・スループット・代替サーバーが受けたリクエスト数と TCP 接続数を JSON で出力する。
+``--error-ratio`` で代替サーバーに 503 を返させると、再試行の動きも確認できる。
+
+    python -m benchmarks.oauth_login --logins 500 --concurrency 50 --api-latency-ms 100 --output result.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+# .env を先に読み込ませる
+from app.core.environment import ENV  # noqa: F401
+
+from .pipeline import percentile
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="OAuth login benchmark")
+    parser.add_argument("--logins", type=int, default=500, help="ログインの回数")
+    parser.add_argument("--concurrency", type=int, default=50, help="同時に進めるログインの数")
+    parser.add_argument("--api-latency-ms", type=float, default=100, help="代替サーバーの応答までの待ち時間")
+    parser.add_argument("--error-ratio", type=float, default=0.0, help="代替サーバーが 503 を返す割合")
+    parser.add_argument("--processes", type=int, default=1, help="Web サーバーのプロセス数（Robyn の --processes）")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    parser.add_argument("--output", help="結果の JSON を書き出すファイル（省略時は標準出力）")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StandInDiscordAPI:
+    """トークン交換とユーザー情報だけを返す Discord API の代わり"""
+
+    def __init__(self, latency: float, error_ratio: float, seed: int) -> None:
+        self.latency = latency
+        self.error_ratio = error_ratio
+        self.random = random.Random(seed)
+        self.requests: Dict[str, int] = {"token": 0, "user": 0, "errors": 0}
+        self.connections = set()
+        self.app = web.Application()
+        self.app.router.add_post("/oauth2/token", self.token)
+        self.app.router.add_get("/users/@me", self.user)
+
+    async def _respond(self, request: web.Request, kind: str, body: Dict[str, Any]) -> web.Response:
+        self.requests[kind] += 1
+        self.connections.add(request.transport.get_extra_info("peername"))
+        await asyncio.sleep(self.latency)
+        if self.random.random() < self.error_ratio:
+            self.requests["errors"] += 1
+            return web.json_response({"message": "unavailable"}, status=503)
+        return web.json_response(body)
+
+    async def token(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        return await self._respond(request, "token", {"access_token": f"token-{form['code']}", "token_type": "Bearer"})
+
+    async def user(self, request: web.Request) -> web.Response:
+        user_id = request.headers["Authorization"].rsplit("-", 1)[-1]
+        return await self._respond(request, "user", {"id": user_id, "username": f"user{user_id}", "avatar": None})
+
+
+def serve_web(port: int) -> None:
+    """ベンチマーク用に Web サーバーだけを起動する（データベースは使わない）"""
+    from app.core.logger import setup_logging
+    from app.web.server import create_web_server
+
+    setup_logging(level="WARNING", stream=sys.stderr)
+    create_web_server(lambda: []).start(host="127.0.0.1", port=port)
+
+
+def stop_web(server: subprocess.Popen) -> None:
+    """Robyn は Ctrl+C（SIGINT）で止まる。止まらなければ強制終了する"""
+    if os.name == "nt":
+        server.kill()
+    else:
+        server.send_signal(signal.SIGINT)
+    try:
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+async def wait_until_up(session: aiohttp.ClientSession, url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get(url, allow_redirects=False):
+                return
+        except aiohttp.ClientError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    api = StandInDiscordAPI(args.api_latency_ms / 1000, args.error_ratio, args.seed)
+    runner = web.AppRunner(api.app, access_log=None)
+    await runner.setup()
+    api_port = free_port()
+    await web.TCPSite(runner, "127.0.0.1", api_port).start()
+
+    web_port = free_port()
+    env = dict(
+        os.environ,
+        DISCORD_API_BASE_URL=f"http://127.0.0.1:{api_port}",
+        DISCORD_CLIENT_ID="benchmark",
+        DISCORD_CLIENT_SECRET="benchmark",
+        WEB_SESSION_SECRET="benchmark",
+    )
+    command = [sys.executable, "-m", "benchmarks.oauth_login", "--serve", "--processes", str(args.processes)]
+    server = subprocess.Popen(command + ["--port", str(web_port)], env=env, stdout=subprocess.DEVNULL)
+
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    try:
+        connector = aiohttp.TCPConnector(limit=args.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            base_url = f"http://127.0.0.1:{web_port}"
+            await wait_until_up(session, f"{base_url}/login")
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def login(index: int) -> None:
+                async with semaphore:
+                    started = time.perf_counter()
+                    async with session.get(f"{base_url}/callback?code={index}", allow_redirects=False) as response:
+                        await response.read()
+                        status = str(response.status)
+                    latencies.append(time.perf_counter() - started)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(login(index) for index in range(args.logins)))
+            elapsed = time.perf_counter() - started
+    finally:
+        stop_web(server)
+        await runner.cleanup()
+
+    return {
+        "config": {key: value for key, value in vars(args).items() if key != "serve"},
+        "elapsed_seconds": elapsed,
+        "logins_per_second": args.logins / elapsed if elapsed else 0.0,
+        "statuses": statuses,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": max(latencies, default=0.0) * 1000,
+        },
+        "api_requests": api.requests,
+        "api_connections": len(api.connections),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    if argv is None and "--serve" in sys.argv:
+        # Web サーバーのプロセス（--port 以外の引数は Robyn にそのまま渡す）
+        port = int(sys.argv[sys.argv.index("--port") + 1])
+        serve_web(port)
+        return
+
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
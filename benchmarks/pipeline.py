@@ -0,0 +1,333 @@
+"""
+読み上げパイプラインのベンチマーク
+
+疑似エンジン（TTS_BACKEND=fake）と疑似 VoiceClient を使い、複数サーバー・複数ユーザーの
+メッセージを ``TTSCog.on_message`` に流し込んで、スループット・受信から最初の音までの時間・
+キャッシュヒット率・CPU 時間・メモリを JSON で出力する。
+
+    python -m benchmarks.pipeline --guilds 20 --users 10 --messages 50 --output result.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# .env を先に読み込ませてから、ベンチマーク用の設定で上書きする
+from app.core.environment import ENV  # noqa: F401
+from app.core.logger import setup_logging, shutdown_logging
+
+HIRAGANA = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん"
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="TTS pipeline benchmark")
+    parser.add_argument("--guilds", type=int, default=10, help="サーバー数")
+    parser.add_argument("--users", type=int, default=5, help="サーバーごとのユーザー数")
+    parser.add_argument("--messages", type=int, default=30, help="サーバーごとのメッセージ数")
+    parser.add_argument("--rate", type=float, default=1.0, help="サーバーごとの平均投稿数（件/秒、ポアソン到着）")
+    parser.add_argument("--length-dist", choices=["fixed", "uniform", "lognormal"], default="lognormal", help="文字数の分布")
+    parser.add_argument("--length-mean", type=float, default=20, help="文字数の平均（lognormal は中央値）")
+    parser.add_argument("--length-max", type=int, default=120, help="文字数の上限")
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="定型文（繰り返し）を投稿する割合")
+    parser.add_argument("--phrase-pool", type=int, default=30, help="定型文の種類数")
+    parser.add_argument("--custom-voice-ratio", type=float, default=0.5, help="独自の音声設定を持つユーザーの割合")
+    parser.add_argument("--engines", type=int, default=1, help="疑似エンジンの台数")
+    parser.add_argument("--latency-ms", type=float, default=100, help="疑似エンジンの合成1回あたりの待ち時間")
+    parser.add_argument("--latency-per-char-ms", type=float, default=5, help="疑似エンジンの1文字あたりの待ち時間")
+    parser.add_argument("--apply-latency-ms", type=float, default=20, help="疑似エンジンのプリセット適用の待ち時間")
+    parser.add_argument("--playback-speed", type=float, default=10.0, help="疑似再生の速さ（1 で実時間）")
+    parser.add_argument("--cache-format", choices=["wav", "opus"], default="wav", help="キャッシュの保存形式")
+    parser.add_argument("--drain-timeout", type=float, default=300, help="全メッセージの再生完了を待つ上限（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    parser.add_argument("--output", help="結果の JSON を書き出すファイル（省略時は標準出力）")
+    parser.add_argument("--verbose", action="store_true", help="Bot のデバッグログを標準エラーに出す（省略時はエラーのみ）")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args: argparse.Namespace, cache_dir: str) -> None:
+    """アプリを import する前に、疑似エンジンとベンチマーク用キャッシュを設定する"""
+    os.environ.update({
+        "TTS_BACKEND": "fake",
+        "TTS_ENGINE_COUNT": str(args.engines),
+        "TTS_FAKE_LATENCY_MS": str(args.latency_ms),
+        "TTS_FAKE_LATENCY_PER_CHAR_MS": str(args.latency_per_char_ms),
+        "TTS_FAKE_APPLY_LATENCY_MS": str(args.apply_latency_ms),
+        "TTS_CACHE_DIR": cache_dir,
+        "TTS_CACHE_FORMAT": args.cache_format,
+        "TTS_VOICE_CATALOG": os.path.join(cache_dir, "voice_catalog.json"),
+    })
+
+
+class FakeVoiceClient:
+    """音声を送らずに AudioSource を読み切る VoiceClient の代わり
+
+    ``play`` の時点で最初のフレームを読み、全フレームを読み終えてから
+    音声の長さ ÷ playback_speed 秒後に ``after`` を呼ぶ。
+    """
+
+    def __init__(self, playback_speed: float) -> None:
+        self.playback_speed = playback_speed
+        self.frames = 0
+        self._loop = asyncio.get_running_loop()
+        self._handle: Optional[asyncio.TimerHandle] = None
+
+    def is_connected(self) -> bool:
+        return True
+
+    def is_playing(self) -> bool:
+        return self._handle is not None
+
+    def play(self, source, after=None) -> None:
+        frames = 0
+        while source.read():
+            frames += 1
+        self.frames += frames
+
+        def finished() -> None:
+            self._handle = None
+            if after is not None:
+                after(None)
+
+        self._handle = self._loop.call_later(frames * 0.02 / self.playback_speed, finished)
+
+    def stop(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    async def disconnect(self) -> None:
+        self.stop()
+
+
+class TrafficGenerator:
+    """サーバー・ユーザー・文字数分布・定型文の割合に従ってメッセージ本文を作る"""
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.phrases = [self._random_text() for _ in range(max(1, args.phrase_pool))]
+
+    def _length(self) -> int:
+        args = self.args
+        if args.length_dist == "fixed":
+            length = args.length_mean
+        elif args.length_dist == "uniform":
+            length = self.random.uniform(1, 2 * args.length_mean)
+        else:
+            length = self.random.lognormvariate(0, 0.6) * args.length_mean
+        return max(1, min(args.length_max, int(length)))
+
+    def _random_text(self) -> str:
+        return "".join(self.random.choice(HIRAGANA) for _ in range(self._length()))
+
+    def text(self) -> str:
+        if self.random.random() < self.args.repeat_ratio:
+            return self.random.choice(self.phrases)
+        return self._random_text()
+
+    def interval(self) -> float:
+        return self.random.expovariate(self.args.rate) if self.args.rate > 0 else 0.0
+
+
+def percentile(values: List[float], ratio: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+def rss_bytes() -> Dict[str, Optional[int]]:
+    """現在と最大の常駐メモリ（取得できない環境では None）"""
+    current = None
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    peak = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux は KB、macOS はバイト
+        peak = peak if sys.platform == "darwin" else peak * 1024
+    return {"current": current, "peak": peak}
+
+
+async def init_benchmark_db() -> None:
+    """インメモリの SQLite でテーブルを作る（ベンチマークの間だけ使う）"""
+    from tortoise import Tortoise
+    from app.database.config import TORTOISE_ORM
+
+    config = json.loads(json.dumps(TORTOISE_ORM))
+    config["connections"]["default"] = "sqlite://:memory:"
+    # マイグレーション管理用のテーブルは不要
+    config["apps"]["models"]["models"] = [
+        module for module in config["apps"]["models"]["models"] if module.startswith("app.")
+    ]
+    await Tortoise.init(config=config)
+    await Tortoise.generate_schemas()
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.bot.cogs.tts import TTSCog
+    from app.core.tts_manager import tts_manager
+    from app.database.models.voice_settings import VoiceSettings
+
+    class BenchmarkCog(TTSCog):
+        """Web サーバーを起動せず、DB はベンチマーク側で用意する"""
+
+        def _start_web_server(self) -> None:
+            pass
+
+        async def _initialize_database(self) -> None:
+            pass
+
+    await init_benchmark_db()
+    await asyncio.wrap_future(tts_manager.start())
+    traffic = TrafficGenerator(args)
+    voices = list(tts_manager.voice_names)
+    users = {
+        guild: [guild * 1000 + index for index in range(args.users)]
+        for guild in range(1, args.guilds + 1)
+    }
+    for members in users.values():
+        for user_id in members:
+            if traffic.random.random() < args.custom_voice_ratio:
+                await VoiceSettings.update_user_settings(str(user_id), {
+                    "voice": traffic.random.choice(voices),
+                    "speed": round(traffic.random.uniform(0.8, 1.5), 1),
+                })
+
+    cog = BenchmarkCog(SimpleNamespace(loop=asyncio.get_running_loop()))
+    latencies: List[float] = []
+
+    def on_started(item, wait: float) -> None:
+        if item.message_start:
+            latencies.append(wait)
+
+    voice_clients = {}
+    for guild in users:
+        voice_clients[guild] = FakeVoiceClient(args.playback_speed)
+        await cog._start_session(guild, guild, voice_clients[guild])
+        cog.tts_controls[guild]["player"].on_started = on_started
+
+    # メッセージ本文は計測前にまとめて作っておく
+    schedule = {
+        guild: [
+            (traffic.interval(), traffic.random.choice(members), traffic.text())
+            for _ in range(args.messages)
+        ]
+        for guild, members in users.items()
+    }
+    handle_times: List[float] = []
+
+    async def post_messages(guild: int) -> None:
+        for delay, user_id, text in schedule[guild]:
+            await asyncio.sleep(delay)
+            message = SimpleNamespace(
+                guild=SimpleNamespace(id=guild),
+                channel=SimpleNamespace(id=guild),
+                author=SimpleNamespace(id=user_id, bot=False),
+                content=text,
+                mentions=[],
+                role_mentions=[],
+                channel_mentions=[],
+            )
+            started = time.perf_counter()
+            await cog.on_message(message)
+            handle_times.append(time.perf_counter() - started)
+
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    await asyncio.gather(*(post_messages(guild) for guild in users))
+    sent_at = time.perf_counter()
+
+    # 全サーバーの再生キューが空になるまで待つ
+    drained = True
+    while any(control["player"].queue_depth for control in cog.tts_controls.values()):
+        if time.perf_counter() - sent_at > args.drain_timeout:
+            drained = False
+            break
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - wall_started
+    cpu_time = time.process_time() - cpu_started
+
+    total_messages = args.guilds * args.messages
+    cache_stats = cog.audio_cache.stats()
+    worker_stats = cog.synthesis_worker.stats()
+    backlog_merged = sum(control["backlog"].merged_count for control in cog.tts_controls.values())
+    backlog_dropped = sum(control["backlog"].dropped_count for control in cog.tts_controls.values())
+    played = sum(control["player"].played_count for control in cog.tts_controls.values())
+    failed = sum(control["player"].failed_count for control in cog.tts_controls.values())
+
+    result = {
+        "config": vars(args),
+        "drained": drained,
+        "elapsed_seconds": elapsed,
+        "messages": total_messages,
+        "throughput_messages_per_second": total_messages / elapsed if elapsed else 0.0,
+        "clips_played": played,
+        "clips_failed": failed,
+        "syntheses": worker_stats["completed"],
+        "synthesis_throughput_per_second": worker_stats["completed"] / elapsed if elapsed else 0.0,
+        "first_audio_seconds": {
+            "samples": len(latencies),
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies, default=0.0),
+        },
+        "on_message_seconds": {
+            "p50": percentile(handle_times, 0.50),
+            "p99": percentile(handle_times, 0.99),
+        },
+        "cache": {
+            "hit_ratio": cache_stats["hit_ratio"],
+            "hits": cache_stats["hits"],
+            "misses": cache_stats["misses"],
+            "shared_inflight": cog.inflight_syntheses.shared_count,
+            "entries": cache_stats["entries"],
+            "bytes": cache_stats["bytes"],
+        },
+        "backlog": {"merged": backlog_merged, "dropped": backlog_dropped},
+        "synthesis_wait_avg_seconds": worker_stats["wait_avg"],
+        "cpu_seconds": cpu_time,
+        "cpu_utilization": cpu_time / elapsed if elapsed else 0.0,
+        "rss_bytes": rss_bytes(),
+    }
+
+    await cog.cog_unload()
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="tts-bench-") as cache_dir:
+        configure_environment(args, cache_dir)
+        # 結果の JSON と混ざらないよう、ログは標準エラーに出す
+        setup_logging(level="DEBUG" if args.verbose else "ERROR", stream=sys.stderr)
+        try:
+            result = asyncio.run(run(args))
+        finally:
+            shutdown_logging()
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
 
-import discord
+import logging
+
 from discord.ext import commands
 
+from app.bot.command_sync import parse_guild_ids, sync_command_tree
+from app.bot.gateway import gateway_options, sharding_enabled
 from app.core.environment import ENV
+from app.core.logger import setup_logging
+
+logger = logging.getLogger(__name__)
 
+# COMMAND_GUILD_IDS が未指定のときの登録先（以前から同期していたサーバー）。
+# 空文字を指定した場合だけグローバルに登録する
+DEFAULT_COMMAND_GUILD_IDS = '1072447995418787902'
 
-INTENTS = discord.Intents.all()
 COGS = [
     'app.bot.cogs.link',
     'app.bot.cogs.role',
@@ -13,11 +21,15 @@ COGS = [
 ]
 
 
-class Bot(commands.Bot):
+# 大規模な運用では BOT_SHARDING=true で複数シャードに分ける
+BotBase = commands.AutoShardedBot if sharding_enabled() else commands.Bot
+
+
+class Bot(BotBase):
     def __init__(self):
         super().__init__(
             command_prefix='!',
-            intents=INTENTS,
+            **gateway_options(),
         )
 
     async def setup_hook(self) -> None:
@@ -25,20 +37,24 @@ class Bot(commands.Bot):
         for cog in COGS:
             await self.load_extension(cog)
 
-        self.tree.copy_global_to(guild=discord.Object(id='1072447995418787902'))
-        await self.tree.sync(guild=discord.Object(id='1072447995418787902'))
+        # コマンド定義が前回の同期から変わったときだけ同期する
+        await sync_command_tree(
+            self.tree,
+            self.application_id,
+            parse_guild_ids(ENV.get('COMMAND_GUILD_IDS', DEFAULT_COMMAND_GUILD_IDS)),
+            ENV.get('COMMAND_SYNC_STATE', 'data/command_sync.json'),
+            ENV.get('COMMAND_SYNC', 'auto'),
+        )
 
         return await super().setup_hook()
 
     async def on_ready(self):
-        print('Bot is ready')
-        print(f'Logged in as: {self.user.name} ({self.user.id})')
-
-    async def on_message(self, message):
-        print('Message received:', message.content)
-        await self.process_commands(message)
+        logger.info('Bot is ready')
+        logger.info('Logged in as: %s (%s)', self.user.name, self.user.id)
 
 
 if __name__ == '__main__':
+    setup_logging()
     bot = Bot()
-    bot.run(ENV.get('BOT_TOKEN'))
+    # discord.py のログもルートロガー（キュー経由の出力）に流す
+    bot.run(ENV.get('BOT_TOKEN'), log_handler=None)
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+
+from app.core.audio_cache import AudioCache
+
+
+def write_clip(cache: AudioCache, key: str, size: int = 10) -> str:
+    path = cache.path_for(key)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    cache.put(key, path)
+    return path
+
+
+def index_rows(cache_dir: str):
+    with sqlite3.connect(os.path.join(cache_dir, AudioCache.INDEX_FILE)) as db:
+        return {key: hits for key, hits in db.execute("SELECT key, hits FROM entries")}
+
+
+def test_missing_file_is_a_miss(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=1000)
+    path = write_clip(cache, "a")
+    os.remove(path)
+
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["entries"] == 0
+    assert cache.total_bytes == 0
+
+    # 作り直せば再びヒットする
+    write_clip(cache, "a")
+    assert cache.get("a") == path
+    cache.close()
+
+
+def test_hits_are_written_in_batches(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=1000)
+    write_clip(cache, "a")
+    cache.get("a")
+    cache.get("a")
+    # 参照だけではインデックスに書き込まない
+    assert index_rows(str(tmp_path)) == {"a": 0}
+
+    write_clip(cache, "b")
+    assert index_rows(str(tmp_path)) == {"a": 2, "b": 0}
+
+    cache.get("b")
+    cache.close()
+    assert index_rows(str(tmp_path)) == {"a": 2, "b": 1}
+
+
+def test_missing_entry_is_removed_from_index(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=1000)
+    os.remove(write_clip(cache, "a"))
+    cache.get("a")
+    cache.close()
+
+    assert index_rows(str(tmp_path)) == {}
+    assert AudioCache(str(tmp_path), max_bytes=1000).stats()["entries"] == 0
+
+
+def test_legacy_wav_files_are_imported(tmp_path):
+    for name in ("a.wav", "b.opus", "c.wav", "c.opus", "notes.txt"):
+        (tmp_path / name).write_bytes(b"\0" * 10)
+
+    cache = AudioCache(str(tmp_path), max_bytes=1000, suffix=".opus")
+    assert cache.get("a") == str(tmp_path / "a.wav")
+    assert cache.get("b") == str(tmp_path / "b.opus")
+    # 同じキーに両方あれば現在の形式を使う
+    assert cache.get("c") == str(tmp_path / "c.opus")
+    assert not (tmp_path / "c.wav").exists()
+    assert cache.stats()["entries"] == 3
+    cache.close()
+
+
+def test_evicted_files_are_removed_after_grace(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.core.audio_cache.time.time", lambda: now[0])
+    cache = AudioCache(str(tmp_path), max_bytes=15, eviction_grace=60)
+    a = write_clip(cache, "a")
+    write_clip(cache, "b")
+
+    # 追い出しても、get() が返したばかりのパスを再生できるよう猶予の間は残す
+    assert cache.get("a") is None
+    assert os.path.exists(a)
+
+    now[0] += 61
+    write_clip(cache, "c")
+    assert not os.path.exists(a)
+    cache.close()
+
+
+def test_rewritten_clip_is_not_removed(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.core.audio_cache.time.time", lambda: now[0])
+    cache = AudioCache(str(tmp_path), max_bytes=15, eviction_grace=60)
+    write_clip(cache, "a")
+    write_clip(cache, "b")
+    # 追い出し済みのキーを猶予中に作り直したら、新しいファイルは消さない
+    a = write_clip(cache, "a")
+
+    now[0] += 61
+    write_clip(cache, "c")
+    assert os.path.exists(a)
+    cache.close()
+
+
+def test_clear_removes_all_files(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=15)
+    paths = [write_clip(cache, key) for key in ("a", "b")]
+
+    assert cache.clear() == 1
+    assert not any(os.path.exists(path) for path in paths)
+    assert cache.stats()["entries"] == 0
+    cache.close()
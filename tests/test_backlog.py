@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("discord")
+
+from app.core.backlog import BacklogController, BacklogPolicy, ReadRequest  # noqa: E402
+from app.core.playback import GuildPlayer  # noqa: E402
+
+
+class IdleVoiceClient:
+    def is_connected(self) -> bool:
+        return True
+
+    def is_playing(self) -> bool:
+        return False
+
+    def stop(self) -> None:
+        pass
+
+
+def queue_texts(max_merge_length: int, texts):
+    async def main():
+        player = GuildPlayer(IdleVoiceClient(), prepare_ahead=0)
+        backlog = BacklogController(BacklogPolicy(merge_same_author=True), max_merge_length=max_merge_length)
+
+        async def never():
+            await asyncio.Event().wait()
+
+        for text in texts:
+            request = ReadRequest("user", text)
+            if backlog.admit(player, request):
+                player.enqueue(never, request=request)
+        result = [item.request.text for item in player.queued_items()]
+        player.close()
+        return result
+
+    return asyncio.run(main())
+
+
+def test_merges_consecutive_messages():
+    assert queue_texts(200, ["おはよう", "元気？"]) == ["おはよう。元気？"]
+
+
+def test_merged_text_is_capped():
+    texts = ["あ" * 40] * 5
+    queued = queue_texts(100, texts)
+    assert all(len(text) <= 100 for text in queued)
+    assert "".join(queued).count("あ") == 200
+    assert len(queued) == 3
+
+
+def test_sentence_chunks_are_dropped_together():
+    async def main():
+        player = GuildPlayer(IdleVoiceClient(), prepare_ahead=0)
+        backlog = BacklogController(
+            BacklogPolicy(merge_same_author=False, max_backlog_seconds=10, overflow_action="drop")
+        )
+
+        async def never():
+            await asyncio.Event().wait()
+
+        def send(author, *texts):
+            requests = [ReadRequest(author, text) for text in texts]
+            if backlog.admit(player, requests[0], requests[1:]):
+                for request in requests:
+                    player.enqueue(never, request=request)
+
+        # 1件目は3文（約9秒）。2件目を受け付けると上限を超えるので、1件目の文がまとめて捨てられる
+        send("a", "あ" * 21, "い" * 21, "う" * 21)
+        send("b", "え" * 21)
+        result = [item.request.text for item in player.queued_items()]
+        player.close()
+        return result, backlog.dropped_count
+
+    assert asyncio.run(main()) == (["え" * 21], 1)
+
+
+def test_backlog_counts_every_chunk_of_incoming_message():
+    async def main():
+        player = GuildPlayer(IdleVoiceClient(), prepare_ahead=0)
+        backlog = BacklogController(
+            BacklogPolicy(merge_same_author=False, max_backlog_seconds=10, overflow_action="drop")
+        )
+
+        async def never():
+            await asyncio.Event().wait()
+
+        first = ReadRequest("a", "あ" * 35)
+        assert backlog.admit(player, first)
+        player.enqueue(never, request=first)
+        # 1文目だけなら上限内でも、メッセージ全体では超えるので古いメッセージを捨てる
+        parts = [ReadRequest("b", "い" * 14), ReadRequest("b", "う" * 35)]
+        assert backlog.admit(player, parts[0], parts[1:])
+        result = [item.request.text for item in player.queued_items()]
+        player.close()
+        return result, parts[0].group == parts[1].group
+
+    assert asyncio.run(main()) == ([], True)
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("discord")
+
+from app.core.metrics import PLAYBACK_WAIT_SECONDS  # noqa: E402
+from app.core.playback import GuildPlayer  # noqa: E402
+
+
+class FakeSource:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.thread = threading.current_thread()
+        self.cleaned_up = False
+
+    def read(self) -> bytes:
+        return b""
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self) -> None:
+        self.cleaned_up = True
+
+
+class FakeVoiceClient:
+    def __init__(self) -> None:
+        self.played = []
+
+    def is_connected(self) -> bool:
+        return True
+
+    def is_playing(self) -> bool:
+        return False
+
+    def play(self, source, after=None) -> None:
+        self.played.append(source)
+        asyncio.get_running_loop().call_soon(after, None)
+
+    def stop(self) -> None:
+        pass
+
+
+def test_sources_are_created_off_the_event_loop_in_order():
+    async def main():
+        vc = FakeVoiceClient()
+        player = GuildPlayer(vc, source_factory=FakeSource, prepare_ahead=2)
+
+        async def slow(path: str, delay: float) -> str:
+            await asyncio.sleep(delay)
+            return path
+
+        player.enqueue("a.wav")
+        player.enqueue(slow("b.wav", 0.02))
+        player.enqueue(lambda: slow("c.wav", 0.0))
+        while len(vc.played) < 3:
+            await asyncio.sleep(0.01)
+        player.close()
+        return vc.played
+
+    played = asyncio.run(main())
+    assert [source.path for source in played] == ["a.wav", "b.wav", "c.wav"]
+    assert all(source.thread is not threading.main_thread() for source in played)
+
+
+def test_discarded_source_is_cleaned_up():
+    async def main():
+        vc = FakeVoiceClient()
+        blocker = asyncio.get_running_loop().create_future()
+        player = GuildPlayer(vc, source_factory=FakeSource, prepare_ahead=2)
+        player.enqueue(blocker)
+        item = player.enqueue("b.wav")
+        await asyncio.sleep(0.05)
+        source = item.future.result()
+        player.discard(item)
+        player.close()
+        return source
+
+    assert asyncio.run(main()).cleaned_up
+
+
+def test_queue_depth_counts_head_being_prepared():
+    async def main():
+        vc = FakeVoiceClient()
+        blocker = asyncio.get_running_loop().create_future()
+        player = GuildPlayer(vc, source_factory=FakeSource, prepare_ahead=2)
+        player.enqueue(blocker)
+        player.enqueue("b.wav")
+        await asyncio.sleep(0.05)
+        # 先頭はキューから取り出されて合成待ちでも、まだ鳴っていないので数える
+        depth = player.queue_depth
+        blocker.set_result("a.wav")
+        while len(vc.played) < 2:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        player.close()
+        return depth, player.queue_depth
+
+    assert asyncio.run(main()) == (2, 0)
+
+
+def test_close_removes_guild_metric_series():
+    async def main():
+        vc = FakeVoiceClient()
+        player = GuildPlayer(vc, source_factory=FakeSource, guild_id=1234)
+        player.enqueue("a.wav")
+        while not vc.played:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        before = "\n".join(PLAYBACK_WAIT_SECONDS.render())
+        player.close()
+        return before, "\n".join(PLAYBACK_WAIT_SECONDS.render())
+
+    before, after = asyncio.run(main())
+    assert 'guild="1234"' in before
+    assert 'guild="1234"' not in after
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from app.utils.singleflight import SingleFlight
+
+
+def test_shares_result_between_callers():
+    async def main():
+        flights = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "done"
+
+        results = await asyncio.gather(*(flights.run("key", work) for _ in range(3)))
+        return results, calls, flights.shared_count, len(flights)
+
+    assert asyncio.run(main()) == (["done"] * 3, 1, 2, 0)
+
+
+def test_leader_cancelled_while_followers_remain():
+    async def main():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "audio"
+
+        leader = asyncio.create_task(flights.run("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.run("key", work))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "audio"
+
+
+def test_work_cancelled_when_every_caller_leaves():
+    async def main():
+        flights = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.create_task(flights.run("key", work)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return "key" in flights
+
+    assert asyncio.run(main()) is False
+
+
+def test_exception_is_shared():
+    async def main():
+        flights = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0)
+            raise ValueError("boom")
+
+        return await asyncio.gather(*(flights.run("key", work) for _ in range(2)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
@@ -0,0 +1,52 @@
+import asyncio
+
+from app.core.synthesis_worker import SynthesisWorker
+
+FLOODING_GUILD = 1
+QUIET_GUILD = 2
+
+
+def run_jobs(worker: SynthesisWorker, jobs):
+    """(guild_id, cost) を順に積み、実行された順のラベルを返す"""
+    order = []
+
+    async def main():
+        futures = [
+            await worker.submit(order.append, label, guild_id=guild_id, cost=cost)
+            for label, guild_id, cost in jobs
+        ]
+        await asyncio.gather(*futures)
+        worker.close()
+
+    asyncio.run(main())
+    return order
+
+
+def test_short_priority_does_not_starve_long_jobs():
+    worker = SynthesisWorker(max_queue=64, max_queue_per_guild=64, quantum=100, short_job_cost=10)
+    jobs = [(f"short{index}", FLOODING_GUILD, 5) for index in range(30)]
+    jobs.append(("long", QUIET_GUILD, 80))
+    order = run_jobs(worker, jobs)
+
+    # 短いジョブの前借りは1巡分（100 文字 = 20 件）まで
+    assert order.index("long") <= 100 // 5
+    assert sorted(order) == sorted(label for label, _, _ in jobs)
+
+
+def test_short_priority_with_several_busy_guilds():
+    worker = SynthesisWorker(max_queue=256, max_queue_per_guild=64, quantum=100, short_job_cost=10)
+    jobs = [(f"short{guild}-{index}", 10 + guild, 5) for index in range(40) for guild in range(4)]
+    jobs.append(("long", QUIET_GUILD, 80))
+    order = run_jobs(worker, jobs)
+
+    # 忙しい4サーバーがそれぞれ前借りできる1巡分まで
+    assert order.index("long") <= 4 * (100 // 5)
+
+
+def test_short_jobs_jump_ahead_within_allowance():
+    worker = SynthesisWorker(max_queue=64, max_queue_per_guild=64, quantum=100, short_job_cost=10)
+    jobs = [(f"long{index}", QUIET_GUILD, 90) for index in range(3)]
+    jobs.append(("short", FLOODING_GUILD, 5))
+    order = run_jobs(worker, jobs)
+
+    assert order.index("short") == 0
@@ -0,0 +1,20 @@
+from app.core.text_processor import MessagePreprocessor, truncate_text
+
+
+def test_unlimited_by_default():
+    text = "あ" * 1000
+    assert MessagePreprocessor().process(text) == text
+
+
+def test_truncates_at_sentence_boundary():
+    text = "今日はいい天気ですね。明日は雨が降るそうです。傘を忘れずに持って行きましょう。"
+    assert truncate_text(text, 30, "、以下略") == "今日はいい天気ですね。明日は雨が降るそうです、以下略"
+
+
+def test_does_not_cut_inside_replaced_token():
+    preprocessor = MessagePreprocessor(max_length=12, truncate_suffix="、以下略")
+    assert preprocessor.process("これを見てください https://example.com/page") == "これを見てください、以下略"
+
+
+def test_falls_back_to_hard_limit_without_boundary():
+    assert truncate_text("あ" * 50, 10, "…") == "あ" * 10 + "…"
@@ -0,0 +1,37 @@
+import pytest
+
+pytest.importorskip("discord")
+pytest.importorskip("numpy")
+
+from app.core import tts_manager as tts_manager_module  # noqa: E402
+from app.core.tts_engine import FakeEngine  # noqa: E402
+from app.core.tts_manager import TTSManager  # noqa: E402
+
+
+def test_failed_initialization_is_retried_after_backoff(tmp_path, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(tts_manager_module.time, "monotonic", lambda: now[0])
+    results = [RuntimeError("host not running"), [FakeEngine(voice_names=["voice"])]]
+
+    def create_engines(*args):
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(tts_manager_module, "create_engines", create_engines)
+    manager = TTSManager(catalog_path=str(tmp_path / "catalog.json"))
+    manager.retry_backoff = 5
+
+    failed = manager.start()
+    with pytest.raises(RuntimeError):
+        failed.result(timeout=5)
+    # 失敗しても待っている側は止まらない
+    assert manager.wait_ready(timeout=5) is False
+
+    # 待ち時間の間は失敗した結果を返し、過ぎたらやり直す
+    assert manager.start() is failed
+    now[0] += 5
+    manager.start().result(timeout=5)
+    assert manager.ready
+    assert list(manager.voice_names) == ["voice"]
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("tortoise")
+
+from app.core.voice_settings_cache import VoiceSettingsCache  # noqa: E402
+from app.database.models.voice_settings import VoiceSettings  # noqa: E402
+
+
+class FakeManager:
+    @staticmethod
+    def create_voice_preset(settings):
+        return dict(settings)
+
+    @staticmethod
+    def preset_fingerprint(preset):
+        return str(sorted(preset.items()))
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    calls = []
+
+    async def get_user_settings(user_id):
+        calls.append(user_id)
+        return {"voice": f"voice-{user_id}"}
+
+    monkeypatch.setattr(VoiceSettings, "get_user_settings", get_user_settings)
+    return calls
+
+
+def test_least_recently_used_user_is_evicted(loads):
+    async def main():
+        cache = VoiceSettingsCache(FakeManager(), max_entries=2)
+        await cache.get("a")
+        await cache.get("b")
+        await cache.get("a")
+        await cache.get("c")
+        await cache.get("a")
+        await cache.get("b")
+        return cache
+
+    cache = asyncio.run(main())
+    assert loads == ["a", "b", "c", "b"]
+    assert cache.evictions == 2
+
+
+def test_invalidation_during_load_is_not_written_back(monkeypatch):
+    async def main():
+        release = asyncio.Event()
+
+        async def get_user_settings(user_id):
+            await release.wait()
+            return {"voice": "old"}
+
+        monkeypatch.setattr(VoiceSettings, "get_user_settings", get_user_settings)
+        cache = VoiceSettingsCache(FakeManager(), max_entries=2)
+        load = asyncio.ensure_future(cache.get("a"))
+        await asyncio.sleep(0)
+        cache.invalidate("a")
+        # 読み込み中でないユーザーの無効化では世代番号を増やさない
+        cache.invalidate("b")
+        release.set()
+        await load
+        return cache
+
+    cache = asyncio.run(main())
+    assert "a" not in cache._entries
+    assert cache._generations == {} and cache._loading == {}
@@ -0,0 +1,45 @@
+import base64
+
+import pytest
+
+pytest.importorskip("robyn")
+pytest.importorskip("tortoise")
+
+from app.web.server import TTSWebServer  # noqa: E402
+
+
+class FakeRequest:
+    def __init__(self, cookie: str) -> None:
+        self.headers = {"cookie": f"session_id={cookie}"}
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setenv("WEB_SESSION_SECRET", "test-secret")
+    return TTSWebServer(lambda: [])
+
+
+def test_signed_session_round_trip(server):
+    cookie = server.create_session({"id": "123", "username": "user"})
+    assert server.get_user_from_session(FakeRequest(cookie))["id"] == "123"
+
+
+@pytest.mark.parametrize("cookie", [
+    "abc.é",
+    "é." + "0" * 64,
+    "!!!.0",
+])
+def test_crafted_cookies_are_rejected(server, cookie):
+    assert server.get_user_from_session(FakeRequest(cookie)) is None
+
+
+def test_non_dict_payload_is_rejected(server):
+    payload = base64.urlsafe_b64encode(b"[1, 2]").decode("ascii")
+    assert server.get_user_from_session(FakeRequest(f"{payload}.{server._sign(payload)}")) is None
+
+
+def test_tampered_and_expired_cookies_are_rejected(server):
+    cookie = server.create_session({"id": "123"})
+    assert server.get_user_from_session(FakeRequest(cookie[:-1] + ("0" if cookie[-1] != "0" else "1"))) is None
+    server.session_max_age = -1
+    assert server.get_user_from_session(FakeRequest(server.create_session({"id": "123"}))) is None